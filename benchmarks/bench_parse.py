@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+قياس تحليل RSS: داخل threads الجلب مقابل مجموعة عمليات التحليل
+Feed Parse Scaling Benchmark
+
+يحلل مجموعة كبيرة من المصادر الاصطناعية (نفس مستندات harness.py بأخبار عربية
+كثيرة) عبر feed_fetcher.parse_feed، مرة داخل threads الجلب (processes = 0، يحجز
+الـ GIL) ومرة لكل حجم من أحجام مجموعة العمليات، ويقيس:
+- الإنتاجية: مصادر وأخبار و MB في الثانية، والتسريع مقارنة بالتحليل داخل العملية
+- تأخر الـ event loop أثناء التحليل (مؤقت كل 10ms): ما يشعر به البوت من بطء
+  في الأزرار والنشر بينما التحليل يعمل
+
+زمن تشغيل العمليات (spawn) لا يدخل في القياس: كل حجم يُحمّى بتحليل أولي.
+الإنتاجية تزيد مع العمليات بقدر الأنوية المتاحة فقط (cpu_count في النتيجة).
+
+التشغيل:
+    python benchmarks/bench_parse.py [--feeds 64] [--items 200] [--processes 0,1,2,4]
+                                     [--repeat 3] [--output parse.json]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import harness  # noqa: E402
+import feed_fetcher  # noqa: E402
+from config import FETCH_MAX_WORKERS  # noqa: E402
+
+TICK_SECONDS = 0.01
+
+
+def default_sizes():
+    """0 (داخل العملية) ثم 1، 2، 4 ... حتى عدد الأنوية (2 على الأقل)"""
+    sizes = [0, 1]
+    while sizes[-1] * 2 <= max(os.cpu_count() or 1, 2):
+        sizes.append(sizes[-1] * 2)
+    return sizes
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def parse_all(documents, executor):
+    """تحليل كل المستندات معاً، ويُرجع (الثواني، عدد الأخبار، تأخرات الـ event loop)"""
+    lags = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(TICK_SECONDS)
+            lags.append(time.perf_counter() - started - TICK_SECONDS)
+
+    ticking = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    feeds = await asyncio.gather(*(feed_fetcher.parse_feed(document, 'application/rss+xml', executor)
+                                   for document in documents))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await ticking
+    return elapsed, sum(len(feed.entries) for feed in feeds), lags
+
+
+async def measure(documents, processes, repeat):
+    executor = ThreadPoolExecutor(max_workers=FETCH_MAX_WORKERS, thread_name_prefix='feed-fetch')
+    try:
+        feed_fetcher.start_parse_pool(processes)
+        # تحمية: تشغيل كل العمليات واستيراد feedparser فيها قبل القياس
+        await asyncio.gather(*(feed_fetcher.parse_feed(document, '', executor)
+                               for document in documents[:max(processes, 1)]))
+        runs = [await parse_all(documents, executor) for _ in range(repeat)]
+    finally:
+        feed_fetcher.shutdown_parse_pool()
+        executor.shutdown()
+
+    elapsed, entries, lags = min(runs, key=lambda run: run[0])
+    megabytes = sum(map(len, documents)) / 1e6
+    return {
+        'processes': processes,
+        'seconds': round(elapsed, 3),
+        'feeds_per_second': round(len(documents) / elapsed, 1),
+        'entries_per_second': round(entries / elapsed),
+        'mb_per_second': round(megabytes / elapsed, 2),
+        'loop_lag_ms': {
+            'p50': round(percentile(lags, 0.5) * 1000, 2) if lags else None,
+            'p99': round(percentile(lags, 0.99) * 1000, 2) if lags else None,
+            'max': round(max(lags) * 1000, 2) if lags else None,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--feeds', type=int, default=64, help='عدد المستندات في كل قياس')
+    parser.add_argument('--items', type=int, default=200, help='أخبار كل مستند')
+    parser.add_argument('--processes', help='أحجام مجموعة العمليات مفصولة بفواصل (0 = داخل العملية)')
+    parser.add_argument('--repeat', type=int, default=3, help='عدد مرات القياس لكل حجم (يُؤخذ الأسرع)')
+    parser.add_argument('--output', help='حفظ النتيجة في ملف JSON')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.processes.split(',')] if args.processes else default_sizes()
+    feed_args = argparse.Namespace(items=args.items, new_per_cycle=0)
+    documents = [harness.render_feed(feed_id, 0, feed_args) for feed_id in range(args.feeds)]
+
+    results = [asyncio.run(measure(documents, size, args.repeat)) for size in sizes]
+    baseline = next((result for result in results if result['processes'] == 0), results[0])
+    for result in results:
+        result['speedup'] = round(baseline['seconds'] / result['seconds'], 2)
+
+    output = json.dumps({
+        'revision': harness.git_revision(),
+        'cpu_count': os.cpu_count(),
+        'feeds': args.feeds,
+        'items_per_feed': args.items,
+        'megabytes': round(sum(map(len, documents)) / 1e6, 2),
+        'results': results,
+    }, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+قياس تكلفة تنظيف الخبر الواحد: الدوال القديمة مقابل sanitizer.py
+Sanitizer micro-benchmark
+
+التشغيل:
+    python benchmarks/bench_sanitizer.py [--items 2000] [--repeat 5]
+
+clean: الدوال القديمة كما هي (بدون فك كيانات HTML ولا توحيد المسافات)
+decoded: الدوال القديمة مع فك الكيانات وتوحيد المسافات، أي بنفس ناتج sanitizer.py
+"""
+
+import os
+import sys
+import html
+import timeit
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sanitizer import escape_markdown, hashtag, plain_text  # noqa: E402
+
+
+# ---- الدوال القديمة كما كانت في news_bot.py (للمقارنة فقط) ----
+
+def legacy_escape_markdown(text):
+    if not text:
+        return ""
+    import re
+    special_chars = ['*', '_', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '.', '!']
+    for char in special_chars:
+        text = text.replace(char, f'\\{char}')
+    return text
+
+
+def legacy_clean(title, description, source_name):
+    # مرحلة الجلب: تنظيف الوصف
+    import re
+    description = re.sub('<[^<]+?>', '', description)
+    description = description.strip()[:200]
+
+    # format_news_message
+    import re
+    if title:
+        title = re.sub('<[^<]+?>', '', title)
+        title = title.replace('*', '').replace('_', '').replace('[', '').replace(']', '')
+        title = title.strip()
+    if description:
+        description = re.sub('<[^<]+?>', '', description)
+        description = description.strip()[:200]
+        description = description.replace('*', '').replace('_', '').replace('[', '').replace(']', '')
+    safe_source = source_name.replace(' ', '_').replace('-', '_')
+    safe_source = re.sub(r'[^a-zA-Z0-9_أ-ي]', '', safe_source)
+
+    # post_to_telegram_async: إزالة HTML من الرسالة كاملة مرة أخرى
+    message = f"{source_name}\n{title}\n{description}\n#{safe_source}"
+    import re
+    return re.sub('<[^<]+?>', '', message)
+
+
+def legacy_clean_decoded(title, description, source_name):
+    """الدوال القديمة مع فك الكيانات وتوحيد المسافات (لمقارنة بنفس جودة الناتج)"""
+    message = legacy_clean(title, description, source_name)
+    return ' '.join(html.unescape(message).split())
+
+
+def new_clean(title, description, source_name):
+    title = plain_text(title)
+    description = plain_text(description, limit=200)
+    return f"{source_name}\n{title}\n{description}\n#{hashtag(source_name)}"
+
+
+# ---- بيانات اختبار تشبه أخبار RSS حقيقية ----
+
+_WORDS = ['الحكومة', 'تعلن', 'عن', 'خطة', 'جديدة', 'لدعم', 'الاقتصاد', 'في', 'العام', 'المقبل',
+          'Breaking:', 'talks', '(update)', 'v2.0', 'ميزانية', '*عاجل*', '[فيديو]', 'وزير_الخارجية']
+_SOURCES = ['الجزيرة', 'BBC Arabic', 'Sky News عربية', 'Al-Monitor', 'RT Arabic', 'فرانس 24']
+
+
+def make_items(count, paragraph_range=(1, 4), seed=42):
+    """أخبار اصطناعية: paragraph_range هو مدى عدد فقرات HTML في الوصف"""
+    rng = random.Random(seed)
+    items = []
+    for _ in range(count):
+        title = ' '.join(rng.choice(_WORDS) for _ in range(rng.randint(6, 14)))
+        paragraphs = [' '.join(rng.choice(_WORDS) for _ in range(rng.randint(10, 30)))
+                      for _ in range(rng.randint(*paragraph_range))]
+        description = ''.join(f'<p>{p} &amp; <a href="https://example.com/{i}">المزيد</a></p>\n'
+                              for i, p in enumerate(paragraphs))
+        items.append((title, description, rng.choice(_SOURCES)))
+    return items
+
+
+def bench(func, items, repeat):
+    def run():
+        for title, description, source in items:
+            func(title, description, source)
+    best = min(timeit.repeat(run, number=1, repeat=repeat))
+    return best / len(items) * 1e6  # ميكروثانية لكل خبر
+
+
+def bench_escape(func, items, repeat):
+    def run():
+        for title, description, _ in items:
+            func(title)
+            func(description)
+    best = min(timeit.repeat(run, number=1, repeat=repeat))
+    return best / len(items) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    # ملخص قصير (مثل أغلب المصادر) ومقال كامل داخل الوصف (بعض المصادر ترسل النص كله)
+    short_items = make_items(args.items)
+    long_items = make_items(args.items, paragraph_range=(8, 20))
+    rows = [
+        ('clean short', bench(legacy_clean, short_items, args.repeat),
+         bench(new_clean, short_items, args.repeat)),
+        ('clean long', bench(legacy_clean, long_items, args.repeat),
+         bench(new_clean, long_items, args.repeat)),
+        ('decoded short', bench(legacy_clean_decoded, short_items, args.repeat),
+         bench(new_clean, short_items, args.repeat)),
+        ('decoded long', bench(legacy_clean_decoded, long_items, args.repeat),
+         bench(new_clean, long_items, args.repeat)),
+        ('escape_markdown', bench_escape(legacy_escape_markdown, short_items, args.repeat),
+         bench_escape(escape_markdown, short_items, args.repeat)),
+    ]
+
+    print(f"{'stage':<18}{'legacy µs/item':>16}{'new µs/item':>14}{'speedup':>10}")
+    for name, legacy, new in rows:
+        print(f"{name:<18}{legacy:>16.2f}{new:>14.2f}{legacy / new:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+قياس زمن التشغيل
+Startup Benchmark
+
+1) زمن استيراد كل وحدة رئيسية في مفسر جديد (أقل قيمة ووسيط عدة مرات)
+2) الزمن حتى الجاهزية: تشغيل news_bot.py كاملاً مقابل الخادم المحلي من harness.py
+   (مصادر RSS اصطناعية و Bot API مزيف) وقراءة مراحل التشغيل من سجل JSON:
+   database ← connected ← polling (جاهز للتفاعلات) ← caches ← first_cycle
+
+التشغيل:
+    python benchmarks/bench_startup.py [--repeat 5] [--feeds 3] [--output startup.json]
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import argparse
+import contextlib
+import statistics
+import subprocess
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import harness  # noqa: E402
+
+MODULES = ('news_bot', 'web_app', 'reaction_handler')
+STAGES = ('database', 'connected', 'polling', 'caches', 'first_cycle')
+
+
+def import_time(module, env):
+    """زمن استيراد الوحدة بالثواني في مفسر جديد (بدون زمن تشغيل المفسر نفسه)"""
+    code = (f"import time; started = time.perf_counter(); import {module}; "
+            f"print(time.perf_counter() - started)")
+    output = subprocess.check_output([sys.executable, '-c', code], cwd=ROOT, env=env, text=True)
+    return float(output.strip().splitlines()[-1])
+
+
+def read_stages(log_path):
+    stages = {}
+    if os.path.exists(log_path):
+        with open(log_path, encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                if record.get('event') == 'startup':
+                    stages[record['stage']] = record['unix_time']
+    return stages
+
+
+def time_to_ready(args, env, workdir):
+    """تشغيل البوت وإرجاع الثواني من بدء العملية حتى كل مرحلة"""
+    state = harness.BenchState(argparse.Namespace(
+        seed=1, error_rate=0, latency_ms=args.latency_ms, items=args.items, new_per_cycle=0,
+        chat_rate=1200, global_rate=30,
+    ))
+    servers = harness.start_servers(state, 1)
+    host, port = servers[0].server_address[:2]
+
+    # المصادر الاصطناعية فقط (مصادر config موجودة لكن معطلة، فلا يضيفها البوت من جديد)
+    import db
+    import news_bot
+    with contextlib.redirect_stdout(io.StringIO()):
+        news_bot.init_database()
+    conn = db.get_connection()
+    with conn:
+        conn.execute("UPDATE rss_feeds SET is_active = 0")
+        conn.executemany("INSERT INTO rss_feeds (name, url) VALUES (?, ?)",
+                         harness.feed_rows(servers, args.feeds))
+    db.close_connections()
+
+    run_env = dict(env, TELEGRAM_API_URL=f'http://{host}:{port}/bot')
+    log_path = os.path.join(workdir, 'metrics.jsonl')
+    started = time.time()
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'news_bot.py')], cwd=workdir,
+                               env=run_env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = started + args.timeout
+        while time.time() < deadline and process.poll() is None:
+            if 'first_cycle' in read_stages(log_path):
+                break
+            time.sleep(0.05)
+    finally:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        for server in servers:
+            server.shutdown()
+    return {stage: round(unix_time - started, 3) for stage, unix_time in read_stages(log_path).items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='عدد مرات قياس الاستيراد')
+    parser.add_argument('--feeds', type=int, default=3, help='عدد المصادر في أول دورة')
+    parser.add_argument('--items', type=int, default=1, help='أخبار كل مصدر (أول دورة تنشرها كلها)')
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--timeout', type=float, default=60, help='أقصى انتظار لاكتمال أول دورة')
+    parser.add_argument('--output', help='حفظ النتيجة في ملف JSON')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='news-startup-')
+    env = dict(os.environ,
+               NEWS_BOT_DB_PATH=os.path.join(workdir, 'bench.db'),
+               TELEGRAM_BOT_TOKEN=harness.BENCH_TOKEN,
+               TELEGRAM_CHANNEL_ID=str(harness.BENCH_CHANNEL_ID),
+               PYTHONDONTWRITEBYTECODE='1')
+    os.environ.update({key: env[key] for key in ('NEWS_BOT_DB_PATH', 'TELEGRAM_BOT_TOKEN',
+                                                 'TELEGRAM_CHANNEL_ID')})
+
+    imports = {}
+    for module in MODULES:
+        samples = [import_time(module, env) for _ in range(args.repeat)]
+        imports[module] = {'min': round(min(samples), 4), 'median': round(statistics.median(samples), 4)}
+
+    stages = time_to_ready(args, env, workdir)
+    result = {
+        'revision': harness.git_revision(),
+        'python': sys.version.split()[0],
+        'import_seconds': imports,
+        'startup_seconds': {stage: stages.get(stage) for stage in STAGES},
+    }
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+قياس وضع webhook تحت موجة ضغطات
+Webhook Tap-Storm Benchmark
+
+بديل محلي لتليجرام: يشغل news_bot.py في وضع webhook مقابل Bot API المزيف من
+harness.py، ثم يرسل تحديثات callback_query اصطناعية عبر عدة اتصالات مستمرة
+(كما يفعل تليجرام حتى WEBHOOK_MAX_CONNECTIONS) بالسر الصحيح.
+
+زمن الضغطة = من إرسال التحديث إلى وصول answerCallbackQuery للـ API المزيف،
+أي الزمن الذي يراه المستخدم حتى يتوقف مؤشر التحميل على الزر.
+ويتحقق أيضاً أن الطلب بسر خاطئ يُرفض بـ 403.
+
+التشغيل:
+    python benchmarks/bench_webhook.py [--taps 5000] [--connections 40] [--posts 20]
+                                       [--rate 0] [--api-latency-ms 30] [--output webhook.json]
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import signal
+import socket
+import shutil
+import asyncio
+import argparse
+import contextlib
+import statistics
+import subprocess
+import tempfile
+from collections import Counter
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import harness  # noqa: E402
+from config import WEBHOOK_PATH  # noqa: E402
+
+SECRET = 'bench-webhook-secret'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def prepare_database():
+    """قاعدة بيانات بلا مصادر مفعلة (القياس للتفاعلات فقط)"""
+    import db
+    import news_bot
+    with contextlib.redirect_stdout(io.StringIO()):
+        news_bot.init_database()
+    conn = db.get_connection()
+    with conn:
+        conn.execute("UPDATE rss_feeds SET is_active = 0")
+    db.close_connections()
+
+
+async def post_update(reader, writer, port, update, secret):
+    """إرسال تحديث واحد على اتصال مستمر وإرجاع حالة الرد"""
+    body = json.dumps(update).encode('utf-8')
+    writer.write((f'POST {WEBHOOK_PATH} HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n'
+                  f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n'
+                  f'X-Telegram-Bot-Api-Secret-Token: {secret}\r\n\r\n').encode('latin-1') + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while (line := await reader.readline()) not in (b'\r\n', b''):
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    if length:
+        await reader.readexactly(length)
+    return status
+
+
+async def send_once(port, update, secret):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        return await post_update(reader, writer, port, update, secret)
+    finally:
+        writer.close()
+
+
+async def tap_storm(args, port):
+    """إرسال args.taps ضغطة عبر args.connections اتصالاً، وإرجاع (أوقات الإرسال، الحالات، المدة)"""
+    rng = random.Random(args.seed)
+    updates = []
+    for update_id in range(1, args.taps + 1):
+        # الضغطات تتركز على الرسائل الأولى (المنشور المنتشر)
+        message_id = min(int(rng.paretovariate(1.2)), args.posts)
+        reaction = rng.choice(('like', 'star'))
+        updates.append(harness.callback_update(update_id, rng.randrange(1, args.users + 1),
+                                               message_id, f'{reaction}_{message_id}'))
+    pending = asyncio.Queue()
+    for update in updates:
+        pending.put_nowait(update)
+
+    sent_at = {}
+    statuses = Counter()
+    interval = 1 / args.rate if args.rate else 0
+    started = time.perf_counter()
+
+    async def connection():
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        try:
+            while not pending.empty():
+                update = pending.get_nowait()
+                if interval:
+                    # معدل ثابت: موعد كل ضغطة محسوب من بداية القياس
+                    delay = started + update['update_id'] * interval - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                sent_at[str(update['update_id'])] = time.perf_counter()
+                statuses[await post_update(reader, writer, port, update, SECRET)] += 1
+        finally:
+            writer.close()
+
+    await asyncio.gather(*(connection() for _ in range(args.connections)))
+    return sent_at, statuses, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--taps', type=int, default=5000, help='عدد الضغطات')
+    parser.add_argument('--connections', type=int, default=40, help='اتصالات متوازية (max_connections)')
+    parser.add_argument('--posts', type=int, default=20, help='عدد الرسائل التي تتوزع عليها الضغطات')
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--rate', type=float, default=0, help='ضغطات في الثانية (0 = بأقصى سرعة)')
+    parser.add_argument('--api-latency-ms', type=float, default=30,
+                        help='زمن رد Bot API المزيف (الرحلة إلى خوادم تليجرام)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--output', help='حفظ النتيجة في ملف JSON')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='news-webhook-')
+    env = dict(os.environ,
+               NEWS_BOT_DB_PATH=os.path.join(workdir, 'bench.db'),
+               TELEGRAM_BOT_TOKEN=harness.BENCH_TOKEN,
+               TELEGRAM_CHANNEL_ID=str(harness.BENCH_CHANNEL_ID))
+    os.environ.update({key: env[key] for key in ('NEWS_BOT_DB_PATH', 'TELEGRAM_BOT_TOKEN',
+                                                 'TELEGRAM_CHANNEL_ID')})
+    prepare_database()
+
+    # Bot API مزيف بلا حد للمعدل العام (حد تعديل الأزرار يطبقه البوت نفسه)
+    state = harness.BenchState(argparse.Namespace(
+        seed=args.seed, error_rate=0, latency_ms=0, items=1, new_per_cycle=0,
+        chat_rate=1200, global_rate=100000, api_latency_ms=args.api_latency_ms,
+    ))
+    servers = harness.start_servers(state, 1)
+    api_host, api_port = servers[0].server_address[:2]
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'news_bot.py')], cwd=workdir,
+        env=dict(env, UPDATE_MODE='webhook', WEBHOOK_URL=f'http://127.0.0.1:{port}', PORT=str(port),
+                 WEBHOOK_SECRET=SECRET, TELEGRAM_API_URL=f'http://{api_host}:{api_port}/bot'),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.time() + args.timeout
+        while not state.webhook and time.time() < deadline and process.poll() is None:
+            time.sleep(0.05)
+        if not state.webhook:
+            sys.exit("❌ البوت لم يسجل الـ webhook")
+
+        forbidden = asyncio.run(send_once(port, harness.callback_update(0, 1, 1, 'like_1'), 'wrong'))
+        sent_at, statuses, send_seconds = asyncio.run(tap_storm(args, port))
+        accepted = statuses.get(200, 0)
+        while len(state.answered) < accepted and time.time() < deadline:
+            time.sleep(0.05)
+        handled_seconds = max(state.answered.values(), default=0) - min(sent_at.values())
+    finally:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        for server in servers:
+            server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    latencies = [(state.answered[key] - sent) * 1000 for key, sent in sent_at.items()
+                 if key in state.answered]
+    result = {
+        'revision': harness.git_revision(),
+        'taps': args.taps,
+        'connections': args.connections,
+        'rate': args.rate or None,
+        'api_latency_ms': args.api_latency_ms,
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'wrong_secret_status': forbidden,
+        'handled': len(latencies),
+        'send_seconds': round(send_seconds, 3),
+        'taps_per_second': round(len(latencies) / handled_seconds, 1) if handled_seconds > 0 else None,
+        'tap_latency_ms': {
+            'p50': round(percentile(latencies, 0.5), 2) if latencies else None,
+            'p95': round(percentile(latencies, 0.95), 2) if latencies else None,
+            'p99': round(percentile(latencies, 0.99), 2) if latencies else None,
+            'max': round(max(latencies), 2) if latencies else None,
+            'mean': round(statistics.fmean(latencies), 2) if latencies else None,
+        },
+        'api_calls': dict(state.api_calls),
+    }
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,438 @@
+# -*- coding: utf-8 -*-
+"""
+قياس أداء البوت كاملاً بدون شبكة
+Offline End-to-End Benchmark Harness
+
+يشغل خادماً محلياً يقدم مصادر RSS عربية اصطناعية (بحجم وزمن استجابة ونسبة أخطاء
+قابلة للضبط) ونسخة مزيفة من Telegram Bot API تفرض حدود المعدل (ترد 429 مع retry_after).
+ثم يشغل check_and_post_news_async و handle_reaction كما يعملان في البوت، ويطبع
+النتائج بصيغة JSON للمقارنة بين الإصدارات.
+
+التشغيل:
+    python benchmarks/harness.py [--feeds 40] [--items 30] [--new-per-cycle 5] [--cycles 3]
+                                 [--latency-ms 50] [--error-rate 0.05] [--reactions 2000]
+                                 [--output result.json]
+
+ملاحظة: حد القناة الحقيقي في تليجرام 20 رسالة في الدقيقة، والقياس يرفعه (--chat-rate)
+على الطرفين معاً (الخادم المزيف وطابور النشر) حتى لا يصبح زمن الدورة مجرد انتظار
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+import contextlib
+from collections import Counter, deque
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from config import TELEGRAM_CHAT_BURST  # noqa: E402
+
+BENCH_TOKEN = '123456:BENCHMARK'
+BENCH_CHANNEL_ID = -1001000000000
+
+_WORDS = ('الرئيس الحكومة البرلمان الاقتصاد النفط الذهب المدينة الجيش الشرطة المنتخب الدوري '
+          'الجامعة المستشفى السوق البنك الوزير المجلس القمة المؤتمر الانتخابات الطقس الأمطار '
+          'الزلزال الفيضان الشركة الأسهم العملة التضخم الصادرات الواردات المطار القطار الميناء '
+          'المعرض المهرجان الفيلم الكتاب المدرسة الطلاب المعلمين الأطباء المزارعين المصانع '
+          'الطاقة الشمسية الرياح المياه السدود الطرق الجسور الاتصالات الإنترنت الهواتف').split()
+
+
+# ---- الخادم المحلي: مصادر RSS و Telegram Bot API ----
+
+class BenchState:
+    """حالة الخادم المشتركة: إصدار كل مصدر وعدادات الطلبات وحدود المعدل"""
+
+    def __init__(self, args):
+        self.args = args
+        self.version = 0  # يزيد مع كل دورة فتظهر أخبار جديدة في كل مصدر
+        self.lock = threading.Lock()
+        self.rng = random.Random(args.seed)
+        self.rss_requests = Counter()
+        self.api_calls = Counter()
+        self.flood_rejections = 0
+        self.message_id = 0
+        self.sent = []  # (message_id, callback_data) لكل رسالة منشورة
+        self.answered = {}  # callback_query_id -> وقت وصول answerCallbackQuery (perf_counter)
+        self.webhook = {}  # معاملات آخر setWebhook
+        self._chat_window = deque()
+        self._global_window = deque()
+
+    def advance(self):
+        with self.lock:
+            self.version += 1
+
+    def roll_error(self):
+        with self.lock:
+            return self.rng.random() < self.args.error_rate
+
+    def check_flood(self, count_chat):
+        """
+        حدود Telegram: عدد الطلبات في آخر ثانية (عام) ولكل قناة (المعدل + الدفعة المسموحة)
+
+        يُرجع None إذا سُمح بالطلب، أو عدد الثواني المطلوب انتظارها
+        """
+        now = time.monotonic()
+        with self.lock:
+            for window in (self._global_window, self._chat_window):
+                while window and window[0] <= now - 1:
+                    window.popleft()
+            if len(self._global_window) >= self.args.global_rate:
+                self.flood_rejections += 1
+                return 1
+            if count_chat and len(self._chat_window) >= self.args.chat_rate / 60 + TELEGRAM_CHAT_BURST:
+                self.flood_rejections += 1
+                return 1
+            self._global_window.append(now)
+            if count_chat:
+                self._chat_window.append(now)
+        return None
+
+
+def _title(feed_id, item_id):
+    rng = random.Random(f'{feed_id}-{item_id}')
+    return ' '.join(rng.sample(_WORDS, 8))
+
+
+def render_feed(feed_id, version, args):
+    """مستند RSS بأحدث args.items خبر (الأحدث أولاً)"""
+    newest = args.items + version * args.new_per_cycle
+    items = []
+    for item_id in range(newest, max(newest - args.items, 0), -1):
+        published = formatdate(1700000000 + item_id * 60, usegmt=True)
+        items.append(
+            f"<item><title>{_title(feed_id, item_id)}</title>"
+            f"<link>https://bench.local/{feed_id}/{item_id}</link>"
+            f"<guid>bench-{feed_id}-{item_id}</guid>"
+            f"<description>&lt;p&gt;{' '.join(_WORDS[(item_id + k) % len(_WORDS)] for k in range(40))}"
+            f" &amp; المزيد&lt;/p&gt;</description>"
+            f"<pubDate>{published}</pubDate></item>"
+        )
+    return ('<?xml version="1.0" encoding="utf-8"?><rss version="2.0"><channel>'
+            f'<title>مصدر {feed_id}</title>{"".join(items)}</channel></rss>').encode('utf-8')
+
+
+class BenchHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # الترويسة والجسم يُرسلان في كتابتين، وبدون هذا يضيف Nagle مع delayed ACK ‏40ms لكل طلب
+    disable_nagle_algorithm = True
+    state = None  # BenchState
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body, content_type='application/json', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        state = self.state
+        # /feed/<id>.xml
+        if not self.path.startswith('/feed/'):
+            return self._reply(404, b'{}')
+        feed_id = int(self.path.rsplit('/', 1)[1].split('.')[0])
+        time.sleep(state.args.latency_ms / 1000 * (0.5 + random.random()))
+        if state.roll_error():
+            state.rss_requests['error'] += 1
+            return self._reply(500, b'error', 'text/plain')
+
+        etag = f'"{feed_id}-{state.version}"'
+        if self.headers.get('If-None-Match') == etag:
+            state.rss_requests['304'] += 1
+            return self._reply(304, b'', 'application/rss+xml', {'ETag': etag})
+        state.rss_requests['200'] += 1
+        self._reply(200, render_feed(feed_id, state.version, state.args), 'application/rss+xml',
+                    {'ETag': etag})
+
+    def do_POST(self):
+        state = self.state
+        # /bot<token>/<method>
+        method = self.path.rsplit('/', 1)[1]
+        length = int(self.headers.get('Content-Length') or 0)
+        params = {key: values[0] for key, values in
+                  parse_qs(self.rfile.read(length).decode('utf-8')).items()}
+        with state.lock:
+            state.api_calls[method] += 1
+        api_latency_ms = getattr(state.args, 'api_latency_ms', 0)
+        if api_latency_ms and method not in ('getUpdates', 'getMe', 'setWebhook'):
+            time.sleep(api_latency_ms / 1000)
+
+        if method in ('sendMessage', 'editMessageReplyMarkup'):
+            retry_after = state.check_flood(count_chat=method == 'sendMessage')
+            if retry_after is not None:
+                return self._reply(429, json.dumps({
+                    'ok': False, 'error_code': 429,
+                    'description': f'Too Many Requests: retry after {retry_after}',
+                    'parameters': {'retry_after': retry_after},
+                }).encode())
+
+        if method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot',
+                      'can_join_groups': False, 'can_read_all_group_messages': False,
+                      'supports_inline_queries': False}
+        elif method == 'sendMessage':
+            with state.lock:
+                state.message_id += 1
+                message_id = state.message_id
+            markup = json.loads(params.get('reply_markup') or '{}')
+            buttons = markup.get('inline_keyboard') or [[]]
+            state.sent.append((message_id, [button['callback_data'] for button in buttons[0]]))
+            result = self._message(message_id, params)
+        elif method == 'editMessageReplyMarkup':
+            result = self._message(int(params['message_id']), params)
+        elif method == 'answerCallbackQuery':
+            state.answered[params.get('callback_query_id')] = time.perf_counter()
+            result = True
+        elif method == 'setWebhook':
+            state.webhook = params
+            result = True
+        elif method == 'getUpdates':
+            # long polling بلا تحديثات (مدة قصيرة حتى يتوقف البوت بسرعة)
+            time.sleep(min(float(params.get('timeout') or 0), 0.5))
+            result = []
+        else:
+            result = True
+        self._reply(200, json.dumps({'ok': True, 'result': result}).encode())
+
+    @staticmethod
+    def _message(message_id, params):
+        return {'message_id': message_id, 'date': int(time.time()),
+                'chat': {'id': BENCH_CHANNEL_ID, 'type': 'channel', 'title': 'bench'},
+                'text': params.get('text', '')}
+
+
+class QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # العميل أغلق الاتصال (إيقاف البوت أثناء long polling مثلاً)
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def start_servers(state, hosts):
+    """خادم لكل عنوان 127.0.0.x (حد الطلبات المتزامنة في الجلب يُطبق لكل موقع)"""
+    handler = type('Handler', (BenchHandler,), {'state': state})
+    servers = []
+    for host_index in range(1, hosts + 1):
+        server = QuietServer((f'127.0.0.{host_index}', 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    return servers
+
+
+def feed_rows(servers, count):
+    """(الاسم، الرابط) للمصادر الاصطناعية موزعة على الخوادم"""
+    rows = []
+    for feed_id in range(count):
+        host, port = servers[feed_id % len(servers)].server_address[:2]
+        rows.append((f'مصدر {feed_id}', f'http://{host}:{port}/feed/{feed_id}.xml'))
+    return rows
+
+
+# ---- عدادات القياس ----
+
+class QueryCounter:
+    """عدّ استعلامات SQLite المنفذة على اتصال الـ thread الرئيسي"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, statement):
+        self.count += 1
+
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ---- التشغيل ----
+
+def callback_update(update_id, user_id, message_id, data):
+    """تحديث callback_query كما يرسله تليجرام عند ضغط زر"""
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'user'},
+            'chat_instance': 'bench',
+            'data': data,
+            'message': {'message_id': message_id, 'date': int(time.time()),
+                        'chat': {'id': BENCH_CHANNEL_ID, 'type': 'channel', 'title': 'bench'}},
+        },
+    }
+
+
+async def run(args, state, servers, log):
+    from telegram import Bot, Update
+    import db
+    import dedup
+    import near_dup
+    import news_bot
+    import publisher
+    import reaction_handler
+
+    with contextlib.redirect_stdout(log):
+        news_bot.init_database()
+    conn = db.get_connection()
+    with conn:
+        conn.execute("DELETE FROM rss_feeds")
+        conn.executemany("INSERT INTO rss_feeds (name, url) VALUES (?, ?)", feed_rows(servers, args.feeds))
+    dedup.warm_cache(news_bot.NEWS_COOLDOWN_HOURS)
+    near_dup.warm_index()
+    reaction_handler.store.load()
+
+    # نفس حد القناة على الطرفين (انظر الملاحظة أعلاه)
+    chat_bucket = publisher.get_chat_bucket(news_bot.CHANNEL_ID)
+    chat_bucket.rate = args.chat_rate / 60
+    reaction_handler.coalescer.window = args.edit_window
+
+    queries = QueryCounter()
+    conn.set_trace_callback(queries)
+    api_host, api_port = servers[0].server_address
+    result = {'cycles': []}
+
+    async with Bot(BENCH_TOKEN, base_url=f'http://{api_host}:{api_port}/bot') as bot:
+        for cycle in range(args.cycles):
+            if cycle:
+                state.advance()
+            api_before, queries_before = sum(state.api_calls.values()), queries.count
+            floods_before = state.flood_rejections
+            posted_before = len(state.sent)
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(log):
+                await news_bot.check_and_post_news_async(bot, force=True)
+            elapsed = time.perf_counter() - started
+            posted = len(state.sent) - posted_before
+            api_calls = sum(state.api_calls.values()) - api_before
+            db_queries = queries.count - queries_before
+            result['cycles'].append({
+                'cycle': cycle + 1,
+                'cycle_seconds': round(elapsed, 4),
+                'items_posted': posted,
+                'items_per_second': round(posted / elapsed, 2) if elapsed else None,
+                'db_queries': db_queries,
+                'db_queries_per_item': round(db_queries / posted, 2) if posted else None,
+                'api_calls': api_calls,
+                'api_calls_per_post': round(api_calls / posted, 3) if posted else None,
+                'flood_rejections': state.flood_rejections - floods_before,
+            })
+
+        # التفاعلات: ضغطات عشوائية من مستخدمين على الرسائل المنشورة
+        if args.reactions and state.sent:
+            rng = random.Random(args.seed)
+            context = SimpleNamespace(bot=bot)
+            edits_before = state.api_calls['editMessageReplyMarkup']
+            queries_before = queries.count
+            floods_before = state.flood_rejections
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(log):
+                for update_id in range(args.reactions):
+                    message_id, buttons = rng.choice(state.sent)
+                    update = Update.de_json(callback_update(
+                        update_id, rng.randrange(args.users), message_id, rng.choice(buttons)
+                    ), bot)
+                    await reaction_handler.handle_reaction(update, context)
+                # انتظار آخر تعديلات الأزرار المدمجة ثم حفظ العدادات
+                while reaction_handler.coalescer._tasks:
+                    await asyncio.sleep(0.01)
+                reaction_handler.store.flush()
+            elapsed = time.perf_counter() - started
+            result['reactions'] = {
+                'taps': args.reactions,
+                'seconds': round(elapsed, 4),
+                'taps_per_second': round(args.reactions / elapsed, 2),
+                'edit_calls': state.api_calls['editMessageReplyMarkup'] - edits_before,
+                'db_queries': queries.count - queries_before,
+                'db_queries_per_tap': round((queries.count - queries_before) / args.reactions, 3),
+                'flood_rejections': state.flood_rejections - floods_before,
+            }
+
+    conn.set_trace_callback(None)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--feeds', type=int, default=40, help='عدد المصادر')
+    parser.add_argument('--items', type=int, default=30, help='عدد الأخبار في كل مستند RSS')
+    parser.add_argument('--new-per-cycle', type=int, default=5, help='أخبار جديدة لكل مصدر في كل دورة')
+    parser.add_argument('--cycles', type=int, default=3)
+    parser.add_argument('--latency-ms', type=float, default=50, help='متوسط زمن استجابة المصدر')
+    parser.add_argument('--error-rate', type=float, default=0.05, help='نسبة طلبات RSS الفاشلة (500)')
+    parser.add_argument('--hosts', type=int, default=8, help='عدد المواقع (عناوين 127.0.0.x)')
+    parser.add_argument('--chat-rate', type=float, default=1200, help='حد رسائل القناة في الدقيقة')
+    parser.add_argument('--global-rate', type=int, default=30, help='حد الطلبات العام في الثانية')
+    parser.add_argument('--reactions', type=int, default=2000, help='عدد ضغطات أزرار التفاعل')
+    parser.add_argument('--users', type=int, default=300)
+    parser.add_argument('--edit-window', type=float, default=0.2, help='نافذة دمج تعديلات الأزرار')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='حفظ النتيجة في ملف JSON')
+    parser.add_argument('--verbose', action='store_true', help='عرض سجل البوت')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='news-bench-')
+    # قبل استيراد وحدات البوت: قاعدة بيانات مؤقتة وبيانات بوت وهمية
+    os.environ['NEWS_BOT_DB_PATH'] = os.path.join(workdir, 'bench.db')
+    os.environ['TELEGRAM_BOT_TOKEN'] = BENCH_TOKEN
+    os.environ['TELEGRAM_CHANNEL_ID'] = str(BENCH_CHANNEL_ID)
+
+    import metrics
+    metrics.METRICS_LOG_FILE = os.path.join(workdir, 'metrics.jsonl')
+
+    state = BenchState(args)
+    servers = start_servers(state, args.hosts)
+    log = sys.stderr if args.verbose else io.StringIO()
+    started = time.perf_counter()
+    result = asyncio.run(run(args, state, servers, log))
+    for server in servers:
+        server.shutdown()
+
+    result.update({
+        'revision': git_revision(),
+        'python': sys.version.split()[0],
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'verbose')},
+        'total_seconds': round(time.perf_counter() - started, 4),
+        'peak_rss_kb': peak_rss_kb(),
+        'rss_requests': dict(state.rss_requests),
+        'api_calls': dict(state.api_calls),
+        'flood_rejections': state.flood_rejections,
+        # مجموع الزمن وعدد المرات لكل مدرج (أين يذهب زمن الدورة)
+        'timings': {name: values for name, values in metrics.snapshot().items()
+                    if name.endswith('_seconds')},
+    })
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+تشغيل عدة عمليات worker معاً
+Feed Sharding and Leader Lease
+
+- تقسيم المصادر: كل مصدر يتبع عملية واحدة من N عملية حسب تجزئة ثابتة لمعرفه
+  (rendezvous hashing: عند تغيير عدد العمليات لا ينتقل إلا نصيب العملية المضافة أو المحذوفة)
+- عقد القيادة (lease) في قاعدة البيانات: عملية واحدة فقط تنفذ المهام المفردة
+  (الحذف والصيانة وطلبات لوحة التحكم)، وتجدد العقد دورياً، وإذا توقفت تنتقل القيادة
+  لعملية أخرى بعد انتهاء مدته
+
+منع نشر الخبر مرتين بين العمليات يتم بحجز ذري في published_news (news_bot.reserve_published_news)
+"""
+
+import os
+import time
+import socket
+import hashlib
+
+from config import WORKER_SHARD_INDEX, WORKER_SHARD_COUNT, LEADER_LEASE_SECONDS
+from db import get_connection
+
+_schema_ready = False
+
+
+def _weight(shard_index, feed_id):
+    digest = hashlib.blake2b(f"{shard_index}:{feed_id}".encode('ascii'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def shard_of(feed_id, count):
+    """رقم العملية المسؤولة عن المصدر (0 إلى count - 1)"""
+    if count <= 1:
+        return 0
+    return max(range(count), key=lambda shard_index: _weight(shard_index, feed_id))
+
+
+class Shard:
+    """نصيب هذه العملية من المصادر"""
+
+    def __init__(self, index=WORKER_SHARD_INDEX, count=WORKER_SHARD_COUNT):
+        if count < 1 or not 0 <= index < count:
+            raise ValueError(f"رقم العملية {index} خارج النطاق 0..{count - 1}")
+        self.index = index
+        self.count = count
+
+    @classmethod
+    def parse(cls, value):
+        """من نص بصيغة INDEX/COUNT (مثلاً 0/3)"""
+        index, _, count = value.partition('/')
+        return cls(int(index), int(count or 1))
+
+    @property
+    def sharded(self):
+        return self.count > 1
+
+    def owns(self, feed_id):
+        # المصادر بدون معرف (قائمة config الاحتياطية) تتبع العملية الأولى
+        if feed_id is None:
+            return self.index == 0
+        return shard_of(feed_id, self.count) == self.index
+
+    def __str__(self):
+        return f"{self.index}/{self.count}"
+
+
+def init_leases(conn=None):
+    """جدول عقود القيادة (مرة واحدة لكل عملية)"""
+    global _schema_ready
+    conn = conn or get_connection()
+    with conn:
+        conn.execute('''CREATE TABLE IF NOT EXISTS leases
+                        (name TEXT PRIMARY KEY,
+                         holder TEXT NOT NULL,
+                         expires_at REAL NOT NULL)''')
+    _schema_ready = True
+
+
+def _connection():
+    if not _schema_ready:
+        init_leases()
+    return get_connection()
+
+
+def worker_id(shard=None):
+    """معرف العملية في جدول العقود (الجهاز، رقم العملية، ونصيبها)"""
+    suffix = f":shard{shard}" if shard is not None else ''
+    return f"{socket.gethostname()}:{os.getpid()}{suffix}"
+
+
+class Lease:
+    """
+    عقد باسم ثابت تملكه عملية واحدة حتى expires_at
+
+    acquire() تأخذ العقد إذا كان منتهياً أو تجدده إذا كانت تملكه، في أمر SQL واحد
+    (SQLite ينفذ الكتابات واحدة تلو الأخرى، فلا تأخذه عمليتان معاً).
+    الوقت من ساعة النظام، فيجب أن تكون ساعات الأجهزة متزامنة (NTP)
+    """
+
+    def __init__(self, name, holder, ttl=LEADER_LEASE_SECONDS):
+        self.name = name
+        self.holder = holder
+        self.ttl = ttl
+        self._valid_until = 0.0
+
+    @property
+    def held(self):
+        # هامش أمان: نتوقف عن اعتبار أنفسنا القائد قبل انتهاء العقد فعلياً
+        return time.time() < self._valid_until - self.ttl / 10
+
+    def acquire(self):
+        """أخذ العقد أو تجديده، ويُرجع True إذا كانت العملية تملكه الآن"""
+        now = time.time()
+        conn = _connection()
+        with conn:
+            rows = conn.execute("""INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?)
+                                   ON CONFLICT(name) DO UPDATE
+                                   SET holder = excluded.holder, expires_at = excluded.expires_at
+                                   WHERE leases.holder = excluded.holder OR leases.expires_at < ?
+                                   RETURNING holder""",
+                                (self.name, self.holder, now + self.ttl, now)).fetchall()
+        self._valid_until = now + self.ttl if rows else 0.0
+        return bool(rows)
+
+    def release(self):
+        """ترك العقد (عند الإيقاف) حتى تأخذه عملية أخرى فوراً"""
+        self._valid_until = 0.0
+        conn = _connection()
+        with conn:
+            conn.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (self.name, self.holder))
+
+    def current_holder(self):
+        row = _connection().execute("SELECT holder, expires_at FROM leases WHERE name = ?",
+                                    (self.name,)).fetchone()
+        return row[0] if row and row[1] > time.time() else None
@@ -121,3 +121,92 @@ SOURCE_EMOJIS = {
 
 # الإيموجي الافتراضي للمصادر الجديدة
 DEFAULT_EMOJI = "📢"
+
+# إعدادات جلب المصادر (بالتوازي)
+FETCH_MAX_WORKERS = 16  # أقصى عدد مصادر تُجلب في نفس الوقت
+FETCH_PER_HOST_LIMIT = 2  # أقصى عدد طلبات متزامنة لنفس الموقع
+FETCH_TIMEOUT_SECONDS = 20  # المهلة القصوى لجلب مصدر واحد
+FETCH_CYCLE_DEADLINE_SECONDS = 90  # المهلة القصوى لجلب كل المصادر في الدورة الواحدة
+# عمليات تحليل RSS (feedparser) خارج عملية البوت، حتى لا يحجز التحليل الـ GIL عن البوت
+# 0 = معطل (التحليل داخل threads الجلب)، و None = عدد الأنوية ناقص واحد
+FEED_PARSE_PROCESSES = 0
+
+# جدولة فحص كل مصدر حسب نشاطه وصحته (الفترة الأساسية هي CHECK_INTERVAL_MINUTES)
+FEED_MIN_POLL_MINUTES = 5  # أقصر فترة بين فحصين لنفس المصدر (المصادر كثيرة الأخبار)
+FEED_MAX_POLL_MINUTES = 240  # أطول فترة للمصادر الخاملة أو المتعطلة
+FEED_STATS_SMOOTHING = 0.3  # وزن آخر فحص في متوسطات الزمن وعدد الأخبار الجديدة
+FEED_CIRCUIT_FAILURES = 5  # فصل المصدر بعد هذا العدد من الأخطاء المتتالية
+FEED_CIRCUIT_OPEN_MINUTES = 360  # مدة فصل المصدر قبل تجربته مرة أخرى
+
+# تتبع الأخبار التي سبق رؤيتها في كل مصدر (معالجة الجديد فقط)
+FEED_FIRST_POLL_LIMIT = 10  # أول فحص لمصدر جديد: أحدث 10 أخبار فقط (لا نغرق القناة بأرشيفه)
+FEED_SEEN_GUIDS = 300  # أقصى عدد معرفات أخبار محفوظة لكل مصدر
+
+# إعدادات كشف الأخبار المتشابهة (نفس الخبر من عدة مصادر)
+NEAR_DUP_THRESHOLD = 0.85  # نسبة التشابه التي يُعتبر عندها الخبر مكرراً (0 إلى 1)
+NEAR_DUP_WINDOW_HOURS = 24  # مقارنة الخبر بأخبار آخر 24 ساعة فقط
+
+# إعدادات النشر على تليجرام (حدود المعدل)
+TELEGRAM_GLOBAL_RATE_PER_SECOND = 30  # الحد العام للبوت: 30 رسالة في الثانية
+TELEGRAM_CHAT_RATE_PER_MINUTE = 20  # حد القناة الواحدة: 20 رسالة في الدقيقة
+TELEGRAM_CHAT_BURST = 3  # عدد الرسائل المسموح إرسالها دفعة واحدة للقناة
+PUBLISH_CONCURRENCY = 3  # عدد الرسائل قيد الإرسال في نفس الوقت
+PUBLISH_QUEUE_SIZE = 100  # حجم طابور النشر (يتوقف الجلب مؤقتاً إذا امتلأ)
+PUBLISH_MAX_RETRIES = 3  # عدد مرات إعادة المحاولة بعد Flood control
+PUBLISH_DRAIN_TIMEOUT_SECONDS = 20  # أقصى انتظار لتفريغ طابور النشر عند الإيقاف (الباقي يُعاد في التشغيل القادم)
+PUBLISH_STALE_RESERVATION_MINUTES = 30  # حجز أقدم من هذا بلا رسالة = خبر توقفت عمليته قبل إرساله
+
+# إعدادات التفاعلات (العدادات في الذاكرة وتُحفظ على دفعات)
+REACTION_FLUSH_SECONDS = 5  # أقصى مدة قبل حفظ التفاعلات المعلقة في قاعدة البيانات
+REACTION_FLUSH_BATCH = 200  # حفظ فوري إذا وصل عدد التفاعلات المعلقة لهذا الرقم
+REACTION_EDIT_WINDOW_SECONDS = 3  # تعديل أزرار الرسالة مرة واحدة على الأكثر كل 3 ثوان (بآخر الأعداد)
+UPDATE_CONCURRENCY = 64  # عدد التحديثات (الضغطات) التي تُعالج في نفس الوقت (بترتيب الوصول لكل رسالة)
+
+# طابور المهام (طلبات "تحديث الآن" من لوحة التحكم)
+JOB_POLL_SECONDS = 5  # كل كم ثانية يفحص البوت طلبات المهام الجديدة
+
+# إعدادات لوحة التحكم
+DASHBOARD_CACHE_SECONDS = 10  # أقصى عمر للقطة الإحصائيات (تُلغى فوراً عند أي تغيير)
+DASHBOARD_RECENT_NEWS = 10  # عدد آخر الأخبار في الصفحة الرئيسية
+DASHBOARD_PAGE_SIZE = 50  # عدد العناصر في كل صفحة من صفحات الأخبار والمصادر
+
+# مقاييس الأداء (Prometheus وسجل JSON)
+METRICS_HOST = '127.0.0.1'  # عنوان خادم المقاييس في البوت (محلي فقط)
+METRICS_PORT = 9108  # منفذ GET /metrics في البوت (0 لتعطيله)
+METRICS_LOG_FILE = 'metrics.jsonl'  # ملف سجل JSON للأحداث (None للكتابة على stderr)
+
+# وضع قياس الأداء (python news_bot.py --profile أو NEWS_BOT_PROFILE=1)
+PROFILE_DIR = 'profiles'  # مجلد تقارير القياس (مجلد فرعي لكل تشغيل)
+PROFILE_SAMPLE_INTERVAL_MS = 5  # الفترة بين عينات مكدسات الـ threads
+PROFILE_TRACEMALLOC_FRAMES = 1  # عمق المكدس لكل حجز ذاكرة (كل إطار إضافي يبطئ الدورة كثيراً)
+
+# الاحتفاظ بالبيانات وأرشفتها (retention.py)
+RETENTION_POLICIES = {
+    # الأخبار المنشورة: أسبوع (أطول من مدة منع التكرار NEWS_COOLDOWN_HOURS)
+    'published_news': {'days': 7, 'archive': True},
+    # تفاعلات الرسالة تُحذف معاً بعد 90 يوماً من آخر تفاعل عليها
+    'reactions': {'days': 90, 'archive': True, 'group_by': 'message_id'},
+    # المهام المنتهية فقط
+    'jobs': {'days': 30, 'age_column': 'finished_at', 'where': "status IN ('done', 'failed')"},
+}
+RETENTION_INTERVAL_MINUTES = 60  # كل كم دقيقة تعمل دورة الحذف والصيانة
+RETENTION_BATCH_SIZE = 500  # عدد الصفوف المحذوفة في كل معاملة (يحدد مدة حبس قفل الكتابة)
+RETENTION_PAUSE_SECONDS = 0.05  # استراحة بين الدفعات حتى يكتب البوت ولوحة التحكم
+RETENTION_ARCHIVE_DIR = 'archive'  # مجلد ملفات الأرشيف المضغوطة (jsonl.gz)
+RETENTION_ANALYZE_HOURS = 24  # ANALYZE كامل مرة يومياً (و PRAGMA optimize في كل دورة)
+RETENTION_VACUUM_PAGES = 1000  # أقصى عدد صفحات فارغة تُعاد للنظام في كل دورة
+
+# استقبال التحديثات من تليجرام (ضغطات الأزرار)
+UPDATE_MODE = 'polling'  # polling أو webhook (يُستبدل بمتغير البيئة UPDATE_MODE)
+WEBHOOK_HOST = '0.0.0.0'  # عنوان خادم webhook المدمج
+WEBHOOK_PORT = 8443  # منفذه (أو متغير البيئة PORT على Render و Heroku)
+WEBHOOK_PATH = '/telegram'  # المسار الذي يرسل إليه تليجرام (الرابط العام في WEBHOOK_URL)
+WEBHOOK_MAX_CONNECTIONS = 40  # أقصى اتصالات متوازية يفتحها تليجرام للخادم (1-100)
+WEBHOOK_QUEUE_SIZE = 1000  # طابور التحديثات قبل المعالجة (إذا امتلأ يُطلب من تليجرام الإعادة لاحقاً)
+WEBHOOK_QUEUE_TIMEOUT_SECONDS = 1  # أقصى انتظار لمكان في الطابور قبل الرد بـ 503
+WEBHOOK_MAX_BODY_BYTES = 1024 * 1024  # أقصى حجم لطلب تحديث واحد
+
+# تشغيل عدة عمليات worker (تقسيم المصادر وعقد القيادة، cluster.py)
+WORKER_SHARD_INDEX = 0  # رقم هذه العملية (أو WORKER_SHARD_INDEX / news_bot.py --shard 0/3)
+WORKER_SHARD_COUNT = 1  # عدد العمليات التي تتقاسم المصادر (1 = عملية واحدة لكل شيء)
+LEADER_LEASE_SECONDS = 30  # مدة عقد القيادة (تنتقل المهام المفردة لعملية أخرى بعدها إذا توقف القائد)
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+إحصائيات لوحة التحكم
+Dashboard Stats Snapshot
+
+الأعداد تُحفظ في جدول dashboard_stats (صف واحد) وتُحدّث بـ triggers عند كل
+إضافة أو حذف، بدلاً من COUNT(*) على كامل الجداول في كل عرض للصفحة.
+عمود version يزيد مع كل تغيير، فتُعيد لوحة التحكم استخدام آخر لقطة
+ما دام الإصدار لم يتغير ولم تنتهِ مدة الكاش القصيرة
+"""
+
+import time
+import threading
+
+from config import DASHBOARD_CACHE_SECONDS, DASHBOARD_RECENT_NEWS, DASHBOARD_PAGE_SIZE
+from db import get_connection
+import feed_health
+
+_schema_ready = False
+
+
+def init_stats_table(conn=None):
+    """إنشاء جدول الإحصائيات والـ triggers والفهارس (مرة واحدة لكل عملية)"""
+    global _schema_ready
+    conn = conn or get_connection()
+    feed_health.init_health_columns(conn)
+    with conn:
+        conn.execute('''CREATE TABLE IF NOT EXISTS dashboard_stats
+                        (id INTEGER PRIMARY KEY CHECK (id = 1),
+                         news_count INTEGER NOT NULL DEFAULT 0,
+                         feeds_count INTEGER NOT NULL DEFAULT 0,
+                         active_feeds INTEGER NOT NULL DEFAULT 0,
+                         version INTEGER NOT NULL DEFAULT 0)''')
+        conn.execute('''INSERT OR IGNORE INTO dashboard_stats (id, news_count, feeds_count, active_feeds)
+                        VALUES (1,
+                                (SELECT COUNT(*) FROM published_news),
+                                (SELECT COUNT(*) FROM rss_feeds),
+                                (SELECT COUNT(*) FROM rss_feeds WHERE is_active = 1))''')
+
+        conn.execute('''CREATE TRIGGER IF NOT EXISTS trg_stats_news_insert
+                        AFTER INSERT ON published_news BEGIN
+                            UPDATE dashboard_stats SET news_count = news_count + 1,
+                                                       version = version + 1 WHERE id = 1;
+                        END''')
+        conn.execute('''CREATE TRIGGER IF NOT EXISTS trg_stats_news_delete
+                        AFTER DELETE ON published_news BEGIN
+                            UPDATE dashboard_stats SET news_count = news_count - 1,
+                                                       version = version + 1 WHERE id = 1;
+                        END''')
+        conn.execute('''CREATE TRIGGER IF NOT EXISTS trg_stats_feeds_insert
+                        AFTER INSERT ON rss_feeds BEGIN
+                            UPDATE dashboard_stats SET feeds_count = feeds_count + 1,
+                                                       active_feeds = active_feeds + (NEW.is_active = 1),
+                                                       version = version + 1 WHERE id = 1;
+                        END''')
+        conn.execute('''CREATE TRIGGER IF NOT EXISTS trg_stats_feeds_delete
+                        AFTER DELETE ON rss_feeds BEGIN
+                            UPDATE dashboard_stats SET feeds_count = feeds_count - 1,
+                                                       active_feeds = active_feeds - (OLD.is_active = 1),
+                                                       version = version + 1 WHERE id = 1;
+                        END''')
+        # تحديث كاش الطلبات الشرطية (etag...) في كل دورة لا يغير ما تعرضه اللوحة
+        conn.execute('''CREATE TRIGGER IF NOT EXISTS trg_stats_feeds_update
+                        AFTER UPDATE OF name, url, is_active ON rss_feeds BEGIN
+                            UPDATE dashboard_stats SET active_feeds = active_feeds
+                                                           - (OLD.is_active = 1) + (NEW.is_active = 1),
+                                                       version = version + 1 WHERE id = 1;
+                        END''')
+
+        # صفحات الأخبار تستخدم idx_published_news_created_at (يتضمن id ضمنياً)،
+        # وصفحات المصادر تستخدم المفتاح الأساسي
+        conn.execute("""CREATE INDEX IF NOT EXISTS idx_published_news_created_at
+                        ON published_news (created_at)""")
+        conn.execute("""CREATE INDEX IF NOT EXISTS idx_rss_feeds_active
+                        ON rss_feeds (is_active)""")
+    _schema_ready = True
+
+
+def _connection():
+    if not _schema_ready:
+        init_stats_table()
+    return get_connection()
+
+
+def get_stats():
+    """الأعداد الحالية وإصدارها (قراءة صف واحد بالمفتاح الأساسي)"""
+    row = _connection().execute("""SELECT news_count, feeds_count, active_feeds, version
+                                   FROM dashboard_stats WHERE id = 1""").fetchone()
+    return dict(row)
+
+
+def news_page(before=None, limit=DASHBOARD_PAGE_SIZE):
+    """
+    صفحة من الأخبار المنشورة (الأحدث أولاً)
+
+    before: (created_at, id) لآخر خبر في الصفحة السابقة، فتبقى تكلفة الصفحة ثابتة
+    مهما كان عمق الصفحة أو حجم الأرشيف. يُرجع (الأخبار، مؤشر الصفحة التالية أو None)
+    """
+    conn = _connection()
+    if before is None:
+        rows = conn.execute("""SELECT id, title, source, link, created_at FROM published_news
+                               ORDER BY created_at DESC, id DESC LIMIT ?""",
+                            (limit + 1,)).fetchall()
+    else:
+        rows = conn.execute("""SELECT id, title, source, link, created_at FROM published_news
+                               WHERE (created_at, id) < (?, ?)
+                               ORDER BY created_at DESC, id DESC LIMIT ?""",
+                            (*before, limit + 1)).fetchall()
+    rows, extra = rows[:limit], rows[limit:]
+    next_cursor = (rows[-1]['created_at'], rows[-1]['id']) if extra else None
+    return rows, next_cursor
+
+
+def feeds_page(after=None, limit=DASHBOARD_PAGE_SIZE):
+    """صفحة من المصادر مرتبة بالمعرف، يُرجع (المصادر، مؤشر الصفحة التالية أو None)"""
+    rows = _connection().execute("""SELECT id, name, url, is_active, last_success_at,
+                                           consecutive_failures, avg_latency_ms, avg_new_items,
+                                           next_poll_at, circuit_open_until, last_error
+                                    FROM rss_feeds WHERE id > ? ORDER BY id LIMIT ?""",
+                                 (after or 0, limit + 1)).fetchall()
+    rows, extra = rows[:limit], rows[limit:]
+    feeds = [dict(row, status=feed_health.feed_status(row)) for row in rows]
+    return feeds, (rows[-1]['id'] if extra else None)
+
+
+class SnapshotCache:
+    """
+    لقطة بيانات لوحة التحكم (الأعداد وآخر الأخبار وأول صفحة من المصادر)
+
+    تُعاد بنفس اللقطة ما دام version لم يتغير ولم تمر ttl ثانية،
+    وأي كتابة من البوت أو اللوحة على الأخبار أو المصادر تُلغيها فوراً
+    """
+
+    def __init__(self, ttl=DASHBOARD_CACHE_SECONDS):
+        self.ttl = ttl
+        self._snapshot = None
+        self._version = None
+        self._expires = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        stats = get_stats()
+        now = time.monotonic()
+        with self._lock:
+            if self._snapshot is not None and stats['version'] == self._version and now < self._expires:
+                return self._snapshot
+
+        recent_news, _ = news_page(limit=DASHBOARD_RECENT_NEWS)
+        feeds, next_feed = feeds_page()
+        snapshot = {
+            'total_news': stats['news_count'],
+            'feeds_count': stats['active_feeds'],
+            'all_feeds_count': stats['feeds_count'],
+            'recent_news': recent_news,
+            'feeds': feeds,
+            'more_feeds': next_feed is not None,
+        }
+        with self._lock:
+            self._snapshot, self._version, self._expires = snapshot, stats['version'], now + self.ttl
+        return snapshot
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+
+# الكاش المشترك داخل عملية لوحة التحكم
+snapshot_cache = SnapshotCache()
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+طبقة الوصول المشتركة لقاعدة البيانات
+Shared SQLite Data-Access Layer
+
+اتصال دائم لكل thread داخل كل عملية (بدلاً من فتح اتصال جديد في كل دالة)،
+مع وضع WAL و busy_timeout حتى يكتب البوت ومعالج التفاعلات ولوحة التحكم
+في نفس الملف دون أخطاء "database is locked"
+"""
+
+import os
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import metrics
+
+# مسار قاعدة البيانات الافتراضي (يمكن تغييره من متغير البيئة NEWS_BOT_DB_PATH)
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'news_bot.db')
+
+BUSY_TIMEOUT_MS = 10000  # انتظار فك القفل بدلاً من الفشل الفوري
+CACHE_SIZE_KB = 16000  # حجم كاش الصفحات لكل اتصال
+STATEMENT_CACHE_SIZE = 256  # عدد الاستعلامات المُجهّزة المحفوظة لكل اتصال
+
+_local = threading.local()
+
+
+def database_path():
+    """
+    مسار قاعدة البيانات الحالي
+
+    يُقرأ عند كل طلب اتصال وليس عند الاستيراد، لأن .env يُحمّل بعد استيراد هذه الوحدة
+    """
+    return os.getenv("NEWS_BOT_DB_PATH") or DEFAULT_DB_PATH
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor يسجل زمن تنفيذ كل استعلام في مقاييس SQLite (حسب نوع الاستعلام)"""
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            metrics.observe_query(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            metrics.observe_query(sql, time.perf_counter() - started)
+
+
+class TimedConnection(sqlite3.Connection):
+    """
+    اتصال كل استعلاماته تمر عبر TimedCursor
+
+    conn.execute في sqlite3 لا يستدعي cursor() الخاص بالصنف الفرعي، لذلك نعيد تعريفه
+    """
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def _configure(conn):
+    """ضبط إعدادات الاتصال (WAL وانتظار القفل والكاش)"""
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA synchronous = NORMAL")  # آمن مع WAL وأسرع بكثير من FULL
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    # حتى تُنفذ triggers الحذف عند INSERT OR REPLACE (عدادات dashboard_stats)
+    conn.execute("PRAGMA recursive_triggers = ON")
+
+
+def get_connection(db_path=None):
+    """
+    إرجاع اتصال دائم خاص بالـ thread الحالي
+
+    الاتصالات لا تُشارك بين الـ threads ولا تُورث بعد fork (تُنشأ من جديد في العملية الابن)
+    لا تغلق الاتصال بعد الاستخدام، واستخدم transaction() للكتابة
+    """
+    path = db_path or database_path()
+    pid = os.getpid()
+    if getattr(_local, 'pid', None) != pid:
+        _local.pid = pid
+        _local.connections = {}
+
+    conn = _local.connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000,
+                               cached_statements=STATEMENT_CACHE_SIZE, factory=TimedConnection)
+        _configure(conn)
+        _local.connections[path] = conn
+    return conn
+
+
+@contextmanager
+def transaction(db_path=None):
+    """معاملة كتابة: حفظ تلقائي عند النجاح وتراجع عند الخطأ"""
+    conn = get_connection(db_path)
+    with conn:
+        yield conn
+
+
+def close_connections():
+    """إغلاق اتصالات الـ thread الحالي (عند إيقاف التشغيل)"""
+    connections = getattr(_local, 'connections', None)
+    if getattr(_local, 'pid', None) != os.getpid() or not connections:
+        return
+    for conn in connections.values():
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+    connections.clear()
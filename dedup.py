@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+مرحلة منع تكرار الأخبار
+News Deduplication Stage
+
+تفحص دفعة كاملة من الأخبار باستعلام واحد على عمود title_hash المفهرس،
+مع كاش داخل العملية للمفاتيح المنشورة مؤخراً (يُملأ عند التشغيل)
+
+created_at في published_news بتوقيت UTC (CURRENT_TIMESTAMP)، فكل الأوقات هنا UTC
+"""
+
+import hashlib
+import threading
+from datetime import datetime, timedelta
+
+from db import get_connection
+
+# حد متغيرات SQLite في الاستعلام الواحد (نقسم الدفعات الكبيرة)
+_SQL_VARIABLES_LIMIT = 500
+
+# كاش المفاتيح المنشورة مؤخراً: {title_hash: وقت النشر (UTC)}
+_recent_keys = {}
+_recent_keys_lock = threading.Lock()
+
+
+def title_key(title):
+    """مفتاح ثابت للعنوان بعد توحيد المسافات وحالة الأحرف"""
+    normalized = ' '.join(title.split()).casefold()
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]
+
+
+def _parse_timestamp(value):
+    """تحويل قيمة created_at من قاعدة البيانات إلى datetime"""
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return datetime.min
+
+
+def _since(hours):
+    """معامل datetime('now', ?) في SQLite لبداية فترة الانتظار"""
+    return f'-{hours} hours'
+
+
+def warm_cache(cooldown_hours):
+    """تعبئة الكاش بمفاتيح الأخبار المنشورة خلال فترة الانتظار (مرة واحدة عند التشغيل)"""
+    rows = get_connection().execute("""SELECT title_hash, created_at FROM published_news
+                                       WHERE created_at > datetime('now', ?) AND title_hash IS NOT NULL""",
+                                    (_since(cooldown_hours),)).fetchall()
+    with _recent_keys_lock:
+        for key, created_at in rows:
+            _recent_keys[key] = _parse_timestamp(created_at)
+    return len(rows)
+
+
+def remember(key, published_at=None):
+    """تسجيل مفتاح خبر تم نشره للتو في الكاش"""
+    with _recent_keys_lock:
+        _recent_keys[key] = published_at or datetime.utcnow()
+
+
+def forget(key):
+    """إزالة مفتاح من الكاش (خبر حُجز ولم يُنشر)"""
+    with _recent_keys_lock:
+        _recent_keys.pop(key, None)
+
+
+def prune_cache(cooldown_hours):
+    """حذف المفاتيح التي تجاوزت فترة الانتظار من الكاش"""
+    cutoff = datetime.utcnow() - timedelta(hours=cooldown_hours)
+    with _recent_keys_lock:
+        expired = [key for key, seen_at in _recent_keys.items() if seen_at <= cutoff]
+        for key in expired:
+            del _recent_keys[key]
+    return len(expired)
+
+
+def filter_unpublished(items, cooldown_hours, key=lambda item: item['title']):
+    """
+    إرجاع الأخبار غير المنشورة فقط من الدفعة
+
+    الفحص يتم أولاً في الكاش، ثم باستعلام واحد لكل المفاتيح المتبقية.
+    يُرجع قائمة (title_hash, item) بنفس الترتيب، وتُحذف التكرارات داخل الدفعة نفسها
+    """
+    cutoff = datetime.utcnow() - timedelta(hours=cooldown_hours)
+
+    candidates = {}
+    for item in items:
+        item_key = title_key(key(item))
+        if item_key not in candidates:
+            candidates[item_key] = item
+
+    with _recent_keys_lock:
+        unknown = [k for k in candidates
+                   if k not in _recent_keys or _recent_keys[k] <= cutoff]
+    published = set(candidates) - set(unknown)
+
+    if unknown:
+        conn = get_connection()
+        for start in range(0, len(unknown), _SQL_VARIABLES_LIMIT):
+            chunk = unknown[start:start + _SQL_VARIABLES_LIMIT]
+            placeholders = ','.join('?' * len(chunk))
+            rows = conn.execute(f"""SELECT title_hash, MAX(created_at) FROM published_news
+                                    WHERE title_hash IN ({placeholders})
+                                    AND created_at > datetime('now', ?)
+                                    GROUP BY title_hash""", (*chunk, _since(cooldown_hours))).fetchall()
+            with _recent_keys_lock:
+                for found_key, created_at in rows:
+                    _recent_keys[found_key] = _parse_timestamp(created_at)
+                    published.add(found_key)
+
+    return [(item_key, item) for item_key, item in candidates.items()
+            if item_key not in published]
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+محرك جلب مصادر RSS بالتوازي
+Concurrent RSS Feed Fetcher
+
+يجلب كل المصادر في نفس الوقت (مع حد لكل موقع) ويعيد كل مصدر فور انتهائه،
+فيصبح زمن الدورة قريباً من زمن أبطأ مصدر بدلاً من مجموع أزمنة كل المصادر.
+يستخدم طلبات شرطية (ETag / Last-Modified) وبصمة المحتوى لتخطي المصادر التي لم تتغير.
+feedparser و requests يُستوردان عند أول جلب فقط (داخل threads الجلب) وليس عند تشغيل البوت
+
+التحليل (feedparser مكتوبة بـ Python بالكامل وثقيلة على المصادر الكبيرة) يتم في
+مجموعة عمليات منفصلة إذا شُغلت start_parse_pool()، فلا يحجز الـ GIL عن البوت:
+ترسل المحتوى الخام وتستقبل سجلات صغيرة (ParsedFeed و ParsedEntry) بدلاً من FeedParserDict
+"""
+
+import os
+import time
+import signal
+import asyncio
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import metrics
+from config import (FETCH_MAX_WORKERS, FETCH_PER_HOST_LIMIT, FETCH_TIMEOUT_SECONDS,
+                    FETCH_CYCLE_DEADLINE_SECONDS, FEED_PARSE_PROCESSES)
+
+USER_AGENT = "Mozilla/5.0 (compatible; ArabNewsBot/1.0; +https://t.me/ArabNewsAi)"
+
+# جلسة HTTP لكل thread (لإعادة استخدام الاتصالات بين الطلبات)
+_thread_local = threading.local()
+
+# مجموعة عمليات التحليل (None = التحليل داخل threads الجلب)
+_parse_pool = None
+_parse_pool_size = 0
+
+
+class ParsedEntry:
+    """خبر واحد من المصدر بالحقول التي يحتاجها البوت فقط (صغير وقابل للـ pickle)"""
+
+    __slots__ = ('title', 'link', 'summary', 'published', 'guid', 'timestamp')
+
+    def __init__(self, title, link, summary, published, guid, timestamp=None):
+        self.title = title
+        self.link = link
+        self.summary = summary  # الوصف الخام كما ورد (يُنظف عند التنسيق)
+        self.published = published  # تاريخ النشر كما ورد في المصدر (نص)
+        self.guid = guid  # معرف ثابت للخبر داخل المصدر
+        self.timestamp = timestamp  # تاريخ النشر (UTC) أو None
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+
+class ParsedFeed:
+    """نتيجة تحليل مستند RSS: الأخبار بالترتيب، و bozo إذا كان المستند معطوباً"""
+
+    __slots__ = ('entries', 'bozo', 'bozo_exception')
+
+    def __init__(self, entries, bozo=False, bozo_exception=None):
+        self.entries = entries
+        self.bozo = bozo
+        self.bozo_exception = bozo_exception  # نص الخطأ (الاستثناء نفسه قد لا يقبل الـ pickle)
+
+    def __getstate__(self):
+        return self.entries, self.bozo, self.bozo_exception
+
+    def __setstate__(self, state):
+        self.entries, self.bozo, self.bozo_exception = state
+
+
+class FeedResult:
+    """نتيجة جلب مصدر واحد"""
+
+    __slots__ = ('feed_id', 'name', 'url', 'feed', 'error', 'elapsed', 'not_modified',
+                 'etag', 'last_modified', 'content_hash', 'cache_changed')
+
+    def __init__(self, feed_id, name, url, feed=None, error=None, elapsed=0.0,
+                 not_modified=False, etag=None, last_modified=None, content_hash=None):
+        self.feed_id = feed_id
+        self.name = name
+        self.url = url
+        self.feed = feed
+        self.error = error
+        self.elapsed = elapsed
+        self.not_modified = not_modified  # True إذا لم يتغير المصدر (304 أو نفس المحتوى)
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_hash = content_hash
+        self.cache_changed = False  # True إذا تغيرت بيانات الكاش عن المحفوظة
+
+
+def _get_session():
+    """جلسة requests خاصة بالـ thread الحالي"""
+    session = getattr(_thread_local, 'session', None)
+    if session is None:
+        import requests
+        session = requests.Session()
+        session.headers['User-Agent'] = USER_AGENT
+        _thread_local.session = session
+    return session
+
+
+def download_feed(feed_info, timeout=FETCH_TIMEOUT_SECONDS):
+    """
+    تحميل مصدر واحد (يعمل داخل thread من الـ pool)
+
+    يرسل طلباً شرطياً بالـ ETag و Last-Modified المحفوظين
+    يُرجع (content, content_type, etag, last_modified, content_hash)، و content = None
+    إذا رد الخادم بـ 304 أو كان المحتوى مطابقاً لآخر نسخة (فلا داعي لتحليله)
+    """
+    headers = {}
+    if feed_info.get('etag'):
+        headers['If-None-Match'] = feed_info['etag']
+    if feed_info.get('last_modified'):
+        headers['If-Modified-Since'] = feed_info['last_modified']
+
+    response = _get_session().get(feed_info['url'], headers=headers, timeout=timeout)
+    if response.status_code == 304:
+        return (None, None, feed_info.get('etag'), feed_info.get('last_modified'),
+                feed_info.get('content_hash'))
+    response.raise_for_status()
+
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    content_hash = hashlib.sha1(response.content).hexdigest()
+    if content_hash == feed_info.get('content_hash'):
+        return None, None, etag, last_modified, content_hash
+    return response.content, response.headers.get('content-type', ''), etag, last_modified, content_hash
+
+
+def parse_feed_bytes(content, content_type=''):
+    """
+    تحليل مستند RSS خام إلى ParsedFeed (دالة على مستوى الوحدة حتى تعمل في عملية أخرى)
+
+    كل ما يُرجع نصوص وتواريخ فقط، فيكون نقله بين العمليات رخيصاً
+    """
+    import feedparser
+    feed = feedparser.parse(content, response_headers={'content-type': content_type})
+    entries = []
+    for entry in feed.entries:
+        title = (entry.get('title') or '').strip()
+        link = entry.get('link', '')
+        parsed = entry.get('published_parsed') or entry.get('updated_parsed')
+        entries.append(ParsedEntry(
+            title, link,
+            entry.get('summary') or entry.get('description') or '',
+            entry.get('published') or entry.get('updated') or '',
+            entry.get('id') or link or title,
+            datetime(*parsed[:6]) if parsed else None,
+        ))
+    bozo_exception = feed.get('bozo_exception')
+    return ParsedFeed(entries, bool(feed.bozo),
+                      str(bozo_exception) if bozo_exception is not None else None)
+
+
+def _init_parse_worker():
+    # Ctrl+C يصل لكل العمليات في الطرفية، والإيقاف تتولاه عملية البوت
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import feedparser  # noqa: F401
+
+
+def parse_processes(configured=FEED_PARSE_PROCESSES):
+    """عدد عمليات التحليل الفعلي: None = عدد الأنوية ناقص واحد (نواة للبوت نفسه)"""
+    if configured is None:
+        return max((os.cpu_count() or 1) - 1, 0)
+    return max(int(configured), 0)
+
+
+def start_parse_pool(processes=FEED_PARSE_PROCESSES):
+    """
+    تشغيل مجموعة عمليات التحليل، ويُرجع عددها (0 = التحليل داخل threads الجلب)
+
+    العمليات تبدأ بطريقة spawn (وليس fork) لأن عملية البوت فيها threads تعمل،
+    وتُنشأ عند أول تحليل فعلاً
+    """
+    global _parse_pool, _parse_pool_size
+    shutdown_parse_pool()
+    _parse_pool_size = parse_processes(processes)
+    if _parse_pool_size:
+        _parse_pool = ProcessPoolExecutor(max_workers=_parse_pool_size,
+                                          mp_context=multiprocessing.get_context('spawn'),
+                                          initializer=_init_parse_worker)
+    return _parse_pool_size
+
+
+def shutdown_parse_pool(wait=True):
+    """إيقاف عمليات التحليل (التحليل بعدها يعود إلى threads الجلب)"""
+    global _parse_pool
+    pool, _parse_pool = _parse_pool, None
+    if pool is not None:
+        pool.shutdown(wait=wait, cancel_futures=True)
+
+
+async def parse_feed(content, content_type='', executor=None):
+    """
+    تحليل المحتوى في مجموعة العمليات إن وُجدت، وإلا في executor (threads الجلب)
+
+    إذا توقفت إحدى عمليات التحليل فجأة تُستبدل المجموعة كلها، ويُعتبر المصدر
+    الحالي فاشلاً في هذه الدورة فقط
+    """
+    loop = asyncio.get_running_loop()
+    pool = _parse_pool
+    with metrics.Timer(metrics.FEED_PARSE_SECONDS.labels()):
+        if pool is None:
+            return await loop.run_in_executor(executor, parse_feed_bytes, content, content_type)
+        try:
+            return await loop.run_in_executor(pool, parse_feed_bytes, content, content_type)
+        except BrokenProcessPool:
+            if _parse_pool is pool:
+                shutdown_parse_pool(wait=False)
+                start_parse_pool(_parse_pool_size)
+            raise
+
+
+async def fetch_feeds(feeds, timeout=FETCH_TIMEOUT_SECONDS,
+                      deadline=FETCH_CYCLE_DEADLINE_SECONDS,
+                      max_workers=FETCH_MAX_WORKERS,
+                      per_host_limit=FETCH_PER_HOST_LIMIT):
+    """
+    جلب المصادر بالتوازي وإرجاع FeedResult لكل مصدر فور انتهائه
+
+    feeds: قائمة قواميس المصادر (id, name, url, etag, last_modified, content_hash)
+    المصادر التي لم تنتهِ قبل انقضاء deadline تُلغى ولا تُرجع
+    """
+    if not feeds:
+        return
+
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='feed-fetch')
+    host_limits = {}
+
+    def observed(result, outcome):
+        metrics.FEED_FETCH_SECONDS.labels(result.name).observe(result.elapsed)
+        metrics.FEED_FETCHES.labels(result.name, outcome).inc()
+        return result
+
+    async def fetch_one(feed_info):
+        feed_id, name, url = feed_info.get('id'), feed_info['name'], feed_info['url']
+        host = urlsplit(url).hostname or url
+        semaphore = host_limits.get(host)
+        if semaphore is None:
+            semaphore = host_limits[host] = asyncio.Semaphore(per_host_limit)
+
+        try:
+            async with semaphore:
+                started = time.monotonic()
+                content, content_type, etag, last_modified, content_hash = await asyncio.wait_for(
+                    loop.run_in_executor(executor, download_feed, feed_info, timeout),
+                    timeout
+                )
+            # التحليل بعد ترك مكان الموقع في الحد (المحتوى وصل بالكامل)
+            feed = None
+            if content is not None:
+                feed = await asyncio.wait_for(parse_feed(content, content_type, executor), timeout)
+            result = FeedResult(feed_id, name, url, feed=feed,
+                                elapsed=time.monotonic() - started,
+                                not_modified=feed is None, etag=etag,
+                                last_modified=last_modified, content_hash=content_hash)
+            result.cache_changed = (etag, last_modified, content_hash) != (
+                feed_info.get('etag'), feed_info.get('last_modified'), feed_info.get('content_hash'))
+            return observed(result, 'not_modified' if feed is None else 'ok')
+        except asyncio.TimeoutError:
+            return observed(FeedResult(feed_id, name, url, error=f"انتهت المهلة ({timeout} ثانية)",
+                                       elapsed=time.monotonic() - started), 'timeout')
+        except Exception as e:
+            return observed(FeedResult(feed_id, name, url, error=e,
+                                       elapsed=time.monotonic() - started), 'error')
+
+    tasks = [asyncio.ensure_future(fetch_one(feed_info)) for feed_info in feeds]
+    try:
+        # المصادر المكتملة تُرجع أولاً بأول، والمتبقية عند انقضاء المهلة تُلغى
+        for next_done in asyncio.as_completed(tasks, timeout=deadline):
+            try:
+                result = await next_done
+            except asyncio.TimeoutError:
+                break
+            yield result
+    finally:
+        for task in tasks:
+            task.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+صحة المصادر وجدولة فحصها
+Per-Feed Health, Adaptive Polling and Circuit Breaking
+
+لكل مصدر حالة محفوظة في rss_feeds: آخر نجاح، عدد الأخطاء المتتالية، متوسط زمن
+الجلب ومتوسط الأخبار الجديدة في كل فحص (متوسطات متحركة أُسية).
+منها يُحسب موعد الفحص القادم: المصادر النشطة تُفحص أكثر، والخاملة تتباطأ تدريجياً،
+والمتعطلة تتراجع أُسياً، ومن تتكرر أخطاؤه يُفصل (circuit breaker) لفترة ثم يُجرب مرة واحدة
+"""
+
+from datetime import datetime, timedelta
+
+from config import (FEED_MIN_POLL_MINUTES, FEED_MAX_POLL_MINUTES, FEED_STATS_SMOOTHING,
+                    FEED_CIRCUIT_FAILURES, FEED_CIRCUIT_OPEN_MINUTES)
+from db import get_connection, transaction
+
+HEALTH_COLUMNS = {
+    'last_polled_at': 'TIMESTAMP',
+    'last_success_at': 'TIMESTAMP',
+    'consecutive_failures': 'INTEGER NOT NULL DEFAULT 0',
+    'avg_latency_ms': 'REAL',
+    'avg_new_items': 'REAL',
+    'next_poll_at': 'TIMESTAMP',
+    'circuit_open_until': 'TIMESTAMP',
+    'last_error': 'TEXT',
+}
+
+# حالات المصدر كما تعرضها لوحة التحكم
+HEALTHY = 'healthy'
+FAILING = 'failing'
+CIRCUIT_OPEN = 'circuit_open'
+NEW = 'new'
+
+_schema_ready = False
+
+
+def init_health_columns(conn=None):
+    """إضافة أعمدة الصحة إلى rss_feeds للقواعد القديمة (مرة واحدة لكل عملية)"""
+    global _schema_ready
+    conn = conn or get_connection()
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(rss_feeds)")}
+    with conn:
+        for column, column_type in HEALTH_COLUMNS.items():
+            if column not in columns:
+                conn.execute(f"ALTER TABLE rss_feeds ADD COLUMN {column} {column_type}")
+        conn.execute("""CREATE INDEX IF NOT EXISTS idx_rss_feeds_next_poll
+                        ON rss_feeds (is_active, next_poll_at)""")
+    _schema_ready = True
+
+
+def _smooth(average, value):
+    """متوسط متحرك أُسي (أول قيمة تصبح المتوسط)"""
+    if average is None:
+        return float(value)
+    return average + FEED_STATS_SMOOTHING * (value - average)
+
+
+def poll_interval(avg_new_items, base_minutes):
+    """
+    الفترة حتى الفحص القادم لمصدر يعمل (بالدقائق)
+
+    مصدر ينشر خبرين في كل فحص يُفحص بضعف التكرار، ومصدر بلا جديد يقل متوسطه
+    بنسبة ثابتة مع كل فحص فارغ، فتطول فترته أُسياً حتى الحد الأقصى
+    """
+    if avg_new_items is None:
+        minutes = base_minutes
+    else:
+        minutes = base_minutes / max(avg_new_items, 1e-3)
+    return min(max(minutes, FEED_MIN_POLL_MINUTES), FEED_MAX_POLL_MINUTES)
+
+
+def failure_backoff(consecutive_failures, base_minutes):
+    """الفترة حتى المحاولة القادمة بعد أخطاء متتالية (تتضاعف مع كل خطأ)"""
+    return min(base_minutes * 2 ** (consecutive_failures - 1), FEED_MAX_POLL_MINUTES)
+
+
+def _load(conn, feed_id):
+    return conn.execute("""SELECT consecutive_failures, avg_latency_ms, avg_new_items
+                           FROM rss_feeds WHERE id = ?""", (feed_id,)).fetchone()
+
+
+def record_success(feed_id, elapsed, new_items, base_minutes, now=None):
+    """تسجيل فحص ناجح (بما فيه "لا جديد") وحساب موعد الفحص القادم"""
+    if feed_id is None:
+        return None
+    now = now or datetime.now()
+    with transaction() as conn:
+        row = _load(conn, feed_id)
+        if row is None:
+            return None
+        avg_latency = _smooth(row['avg_latency_ms'], elapsed * 1000)
+        avg_new = _smooth(row['avg_new_items'], new_items)
+        next_poll = now + timedelta(minutes=poll_interval(avg_new, base_minutes))
+        conn.execute("""UPDATE rss_feeds SET last_polled_at = ?, last_success_at = ?,
+                            consecutive_failures = 0, avg_latency_ms = ?, avg_new_items = ?,
+                            next_poll_at = ?, circuit_open_until = NULL, last_error = NULL
+                        WHERE id = ?""",
+                     (now, now, avg_latency, avg_new, next_poll, feed_id))
+    return next_poll
+
+
+def record_failure(feed_id, error, elapsed, base_minutes, now=None):
+    """
+    تسجيل فحص فاشل وحساب موعد المحاولة القادمة
+
+    يُرجع True إذا فُصل المصدر (circuit breaker) بعد هذا الخطأ
+    """
+    if feed_id is None:
+        return False
+    now = now or datetime.now()
+    with transaction() as conn:
+        row = _load(conn, feed_id)
+        if row is None:
+            return False
+        failures = row['consecutive_failures'] + 1
+        avg_latency = _smooth(row['avg_latency_ms'], elapsed * 1000) if elapsed else row['avg_latency_ms']
+        circuit_open_until = None
+        if failures >= FEED_CIRCUIT_FAILURES:
+            # بعد فترة الفصل يُجرب المصدر مرة واحدة: النجاح يعيده، والفشل يفصله من جديد
+            circuit_open_until = now + timedelta(minutes=FEED_CIRCUIT_OPEN_MINUTES)
+            next_poll = circuit_open_until
+        else:
+            next_poll = now + timedelta(minutes=failure_backoff(failures, base_minutes))
+        conn.execute("""UPDATE rss_feeds SET last_polled_at = ?, consecutive_failures = ?,
+                            avg_latency_ms = ?, next_poll_at = ?, circuit_open_until = ?,
+                            last_error = ?
+                        WHERE id = ?""",
+                     (now, failures, avg_latency, next_poll, circuit_open_until,
+                      str(error)[:500], feed_id))
+    return circuit_open_until is not None
+
+
+def feed_status(feed, now=None):
+    """حالة المصدر للعرض (من صف rss_feeds يحتوي أعمدة الصحة)"""
+    now = now or datetime.now()
+    if feed['circuit_open_until'] and str(feed['circuit_open_until']) > str(now):
+        return CIRCUIT_OPEN
+    if feed['consecutive_failures']:
+        return FAILING
+    if feed['last_success_at']:
+        return HEALTHY
+    return NEW
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+طابور المهام بين لوحة التحكم والبوت
+Background Job Queue (SQLite)
+
+لوحة التحكم لا تجلب ولا ترسل أي خبر بنفسها: تضيف طلب مهمة في جدول jobs
+والبوت (عملية worker) يفحص الجدول دورياً وينفذ المهمة على event loop الخاص به.
+فهرس فريد جزئي يضمن وجود مهمة واحدة فقط نشطة (في الانتظار أو قيد التنفيذ) لكل نوع
+"""
+
+import json
+import sqlite3
+from datetime import datetime
+
+from db import get_connection, transaction
+
+NEWS_CYCLE = 'news_cycle'
+
+# حالات المهمة
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+_schema_ready = False
+
+
+def init_jobs_table(conn=None):
+    """إنشاء جدول المهام وفهارسه (مرة واحدة لكل عملية)"""
+    global _schema_ready
+    conn = conn or get_connection()
+    conn.execute('''CREATE TABLE IF NOT EXISTS jobs
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     kind TEXT NOT NULL,
+                     status TEXT NOT NULL DEFAULT 'queued',
+                     requested_by TEXT,
+                     progress TEXT,
+                     error TEXT,
+                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                     started_at TIMESTAMP,
+                     finished_at TIMESTAMP)''')
+    # كل الأوقات بتوقيت UTC مثل created_at (سياسة الاحتفاظ تقارن finished_at بتوقيت UTC)
+    # مهمة واحدة نشطة فقط لكل نوع (النقر المتكرر لا يُنشئ دورات متداخلة)
+    conn.execute("""CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_active
+                    ON jobs (kind) WHERE status IN ('queued', 'running')""")
+    conn.commit()
+    _schema_ready = True
+
+
+def _connection():
+    if not _schema_ready:
+        init_jobs_table()
+    return get_connection()
+
+
+def _row_to_dict(row):
+    if row is None:
+        return None
+    job = dict(row)
+    job['progress'] = json.loads(job['progress']) if job['progress'] else {}
+    return job
+
+
+def enqueue(kind=NEWS_CYCLE, requested_by=None):
+    """
+    طلب تنفيذ مهمة
+
+    يُرجع (معرف المهمة، True) إذا أُضيفت مهمة جديدة،
+    أو (معرف المهمة النشطة الحالية، False) إذا كانت هناك مهمة من نفس النوع لم تنتهِ بعد
+    """
+    conn = _connection()
+    try:
+        with conn:
+            job_id = conn.execute("INSERT INTO jobs (kind, requested_by) VALUES (?, ?)",
+                                  (kind, requested_by)).lastrowid
+        return job_id, True
+    except sqlite3.IntegrityError:
+        row = conn.execute("SELECT id FROM jobs WHERE kind = ? AND status IN (?, ?)",
+                           (kind, QUEUED, RUNNING)).fetchone()
+        if row is None:
+            # انتهت المهمة النشطة بين المحاولتين
+            return enqueue(kind, requested_by)
+        return row[0], False
+
+
+def claim_next(kind=NEWS_CYCLE):
+    """استلام أقدم مهمة في الانتظار وتحويلها إلى قيد التنفيذ (عملية ذرية)، أو None"""
+    conn = _connection()
+    with conn:
+        rows = conn.execute("""UPDATE jobs SET status = ?, started_at = ?
+                              WHERE id = (SELECT id FROM jobs WHERE kind = ? AND status = ?
+                                          ORDER BY id LIMIT 1)
+                              RETURNING id""",
+                           (RUNNING, datetime.utcnow(), kind, QUEUED)).fetchall()
+    return rows[0][0] if rows else None
+
+
+def update_progress(job_id, progress):
+    """حفظ تقدم المهمة (قاموس صغير قابل للتحويل إلى JSON)"""
+    with transaction() as conn:
+        conn.execute("UPDATE jobs SET progress = ? WHERE id = ?",
+                     (json.dumps(progress, ensure_ascii=False), job_id))
+
+
+def finish(job_id, error=None):
+    """إنهاء المهمة بنجاح أو بخطأ"""
+    with transaction() as conn:
+        conn.execute("UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                     (FAILED if error else DONE, str(error) if error else None,
+                      datetime.utcnow(), job_id))
+
+
+def fail_interrupted(kind=NEWS_CYCLE):
+    """عند تشغيل البوت: المهام التي بقيت قيد التنفيذ من تشغيل سابق توقفت ولن تكتمل"""
+    conn = _connection()
+    with conn:
+        return conn.execute("""UPDATE jobs SET status = ?, error = ?, finished_at = ?
+                               WHERE kind = ? AND status = ?""",
+                            (FAILED, 'interrupted', datetime.utcnow(), kind, RUNNING)).rowcount
+
+
+def get_job(job_id):
+    """حالة مهمة معينة كقاموس، أو None"""
+    return _row_to_dict(_connection().execute("SELECT * FROM jobs WHERE id = ?",
+                                              (job_id,)).fetchone())
+
+
+def latest_job(kind=NEWS_CYCLE):
+    """آخر مهمة من نوع معين، أو None"""
+    return _row_to_dict(_connection().execute("SELECT * FROM jobs WHERE kind = ? ORDER BY id DESC LIMIT 1",
+                                              (kind,)).fetchone())
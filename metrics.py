@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+"""
+مقاييس الأداء
+Metrics: Counters, Histograms, Prometheus Endpoint and JSON Logs
+
+عدادات ومدرجات تكرارية (histograms) في الذاكرة لكل مرحلة من مسار الخبر:
+الجلب والتحليل ومنع التكرار والإرسال وانتظار Flood control والتفاعلات واستعلامات SQLite.
+تُعرض بصيغة Prometheus النصية (على منفذ محلي في البوت، و /metrics في لوحة التحكم)،
+والأحداث المهمة (كل مصدر وكل دورة) تُكتب أيضاً كسطور JSON في ملف السجل
+"""
+
+import sys
+import json
+import time
+import asyncio
+import logging
+import threading
+from bisect import bisect_left
+from datetime import datetime
+
+from config import METRICS_LOG_FILE
+
+# حدود المدرجات بالثواني (من أجزاء الملي ثانية لاستعلامات SQLite إلى عشرات الثواني للجلب)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # الأخير: أكبر من كل الحدود
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class _Metric:
+    """مقياس بأسماء تصنيفات ثابتة، وقيمة مستقلة لكل مجموعة قيم تصنيف"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _items(self):
+        with self._lock:
+            return sorted(self._children.items(), key=lambda item: tuple(map(str, item[0])))
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def render(self):
+        for values, child in self._items():
+            yield f'{self.name}{_format_labels(self.labelnames, values)} {child.value:g}'
+
+    def snapshot(self):
+        return {','.join(map(str, values)): child.value for values, child in self._items()}
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def render(self):
+        for values, child in self._items():
+            with child._lock:
+                counts, total, count = list(child.counts), child.sum, child.count
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound:g}"'
+                yield f'{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}'
+            labels = _format_labels(self.labelnames, values)
+            yield f'{self.name}_sum{labels} {total:.6f}'
+            yield f'{self.name}_count{labels} {count}'
+
+    def snapshot(self):
+        return {','.join(map(str, values)): {'count': child.count, 'sum': round(child.sum, 6)}
+                for values, child in self._items()}
+
+
+class Registry:
+    """كل مقاييس العملية (المقياس يُسجل مرة واحدة بالاسم)"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self):
+        """كل المقاييس بصيغة Prometheus النصية (text/plain; version=0.0.4)"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """كل المقاييس كقاموس (لسجل JSON ولأدوات القياس)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+histogram = REGISTRY.histogram
+render = REGISTRY.render
+snapshot = REGISTRY.snapshot
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+# ---- مقاييس مسار الخبر ----
+
+FEED_FETCH_SECONDS = histogram('newsbot_feed_fetch_seconds', 'Feed download and parse time', ('feed',))
+FEED_FETCHES = counter('newsbot_feed_fetches_total', 'Feed fetches by outcome', ('feed', 'outcome'))
+FEED_PARSE_SECONDS = histogram('newsbot_feed_parse_seconds',
+                               'Feed parse time per document (including the parse pool round trip)')
+DEDUP_HITS = counter('newsbot_dedup_hits_total', 'Entries skipped before publishing',
+                     ('reason',))
+NEWS_CYCLE_SECONDS = histogram('newsbot_cycle_seconds', 'Full fetch-and-publish cycle time')
+NEWS_POSTED = counter('newsbot_news_posted_total', 'News items published to the channel')
+TELEGRAM_SECONDS = histogram('newsbot_telegram_request_seconds', 'Bot API call latency',
+                             ('method', 'result'))
+RATE_LIMIT_WAIT_SECONDS = histogram('newsbot_rate_limit_wait_seconds',
+                                    'Time spent waiting for the local send rate limiter')
+FLOOD_WAITS = counter('newsbot_flood_waits_total', 'Flood control (429) responses', ('source',))
+FLOOD_WAIT_SECONDS = counter('newsbot_flood_wait_seconds_total',
+                             'Seconds requested by Flood control (retry_after)', ('source',))
+REACTION_SECONDS = histogram('newsbot_reaction_seconds', 'Reaction button handling time')
+SQLITE_SECONDS = histogram('newsbot_sqlite_query_seconds', 'SQLite statement execution time',
+                           ('statement',))
+STARTUP_SECONDS = histogram('newsbot_startup_seconds', 'Seconds from process start to each startup stage',
+                            ('stage',))
+
+
+class Readiness:
+    """
+    مراحل تشغيل العملية وزمن الوصول لكل منها (منذ بداية main)
+
+    العملية "جاهزة" عند اكتمال المرحلة required، وباقي المراحل تكتمل في الخلفية
+    """
+
+    def __init__(self, required):
+        self.required = required
+        self.started = time.perf_counter()
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.perf_counter()
+            self.stages = {}
+
+    def mark(self, stage):
+        """تسجيل اكتمال مرحلة (في المقاييس وسجل JSON)، يُرجع الثواني منذ البداية"""
+        with self._lock:
+            seconds = time.perf_counter() - self.started
+            self.stages.setdefault(stage, round(seconds, 3))
+        STARTUP_SECONDS.labels(stage).observe(seconds)
+        log_event('startup', stage=stage, seconds=round(seconds, 3), unix_time=round(time.time(), 3))
+        return seconds
+
+    @property
+    def ready(self):
+        return self.required in self.stages
+
+    def as_dict(self):
+        with self._lock:
+            return {'ready': self.required in self.stages, 'stages': dict(self.stages)}
+
+
+# في البوت: جاهز عندما يبدأ استقبال التفاعلات (polling، أو webhook في وضعه)، والجلب الأول يكتمل لاحقاً
+readiness = Readiness('polling')
+
+
+class Timer:
+    """قياس زمن كتلة كود وتسجيله في مدرج: with metrics.Timer(HISTOGRAM.labels(...)):"""
+
+    __slots__ = ('child', 'started', 'elapsed')
+
+    def __init__(self, child):
+        self.child = child
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed = time.perf_counter() - self.started
+        self.child.observe(self.elapsed)
+        return False
+
+
+# نوع الاستعلام (SELECT, INSERT...) لكل نص استعلام، والنصوص ثابتة في الكود فالكاش صغير
+_statement_kinds = {}
+
+
+def observe_query(sql, elapsed):
+    """تسجيل زمن استعلام SQLite مصنفاً بنوعه"""
+    kind = _statement_kinds.get(sql)
+    if kind is None:
+        kind = sql.split(None, 1)[0].upper() if sql.strip() else 'EMPTY'
+        if len(_statement_kinds) < 1024:
+            _statement_kinds[sql] = kind
+    SQLITE_SECONDS.labels(kind).observe(elapsed)
+
+
+# ---- سجل JSON ----
+
+_logger = None
+_logger_lock = threading.Lock()
+
+
+def _get_logger():
+    global _logger
+    if _logger is None:
+        with _logger_lock:
+            if _logger is None:
+                logger = logging.getLogger('newsbot.metrics')
+                logger.propagate = False
+                logger.setLevel(logging.INFO)
+                if METRICS_LOG_FILE:
+                    handler = logging.FileHandler(METRICS_LOG_FILE, encoding='utf-8')
+                else:
+                    handler = logging.StreamHandler(sys.stderr)
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                logger.addHandler(handler)
+                _logger = logger
+    return _logger
+
+
+def log_event(event, **fields):
+    """كتابة حدث كسطر JSON واحد (الوقت واسم الحدث ثم الحقول)"""
+    record = {'ts': datetime.now().isoformat(timespec='milliseconds'), 'event': event}
+    record.update(fields)
+    _get_logger().info(json.dumps(record, ensure_ascii=False, default=str))
+
+
+# ---- خادم Prometheus داخل البوت ----
+
+async def _handle_scrape(reader, writer):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), 5)
+        # تجاهل باقي الترويسات
+        while (await asyncio.wait_for(reader.readline(), 5)) not in (b'\r\n', b'\n', b''):
+            pass
+        parts = request_line.decode('latin-1').split()
+        path = parts[1].split('?')[0] if len(parts) >= 2 and parts[0] == 'GET' else None
+        if path == '/metrics':
+            status, content_type, body = '200 OK', CONTENT_TYPE, render().encode('utf-8')
+        elif path == '/ready':
+            status = '200 OK' if readiness.ready else '503 Service Unavailable'
+            content_type, body = 'application/json', json.dumps(readiness.as_dict()).encode('utf-8')
+        else:
+            status, content_type, body = '404 Not Found', 'text/plain', b'not found\n'
+        writer.write(f'HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n'
+                     f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode('latin-1') + body)
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(host, port):
+    """خادم HTTP صغير على event loop البوت يعرض GET /metrics و GET /ready"""
+    return await asyncio.start_server(_handle_scrape, host, port)
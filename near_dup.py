@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+كشف الأخبار المتشابهة بين المصادر
+Near-Duplicate Story Clustering
+
+نفس خبر الوكالة يصل من عدة مصادر بعناوين مختلفة قليلاً، فنوحّد النص العربي
+ونحسب بصمة MinHash لمقاطع الكلمات، ونبحث عن المرشحين عبر فهرس LSH (حزم band)
+فيبقى البحث غير خطي بالنسبة لحجم نافذة الأخبار الحديثة
+
+المقارنة بأخبار المصادر الأخرى فقط: خبران من نفس المصدر خبران مختلفان
+"""
+
+import re
+import zlib
+import random
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+
+from config import NEAR_DUP_THRESHOLD, NEAR_DUP_WINDOW_HOURS
+from db import get_connection
+
+# إعدادات MinHash / LSH
+# مقاطع من كلمتين: تغيير كلمة واحدة (ارتفاع/انخفاض، اسم الدولة) يغير مقطعين على الأقل
+# فيبقى تشابه عنوانين مختلفين في الحدث أقل بكثير من NEAR_DUP_THRESHOLD
+# 12 حزمة × 5 صفوف: احتمال التقاط خبرين بتشابه 0.8 حوالي 99% وبتشابه 0.5 حوالي 32%
+SHINGLE_SIZE = 2
+LSH_BANDS = 12
+LSH_ROWS = 5
+NUM_PERMUTATIONS = LSH_BANDS * LSH_ROWS
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# معاملات دوال التجزئة ثابتة (بذرة ثابتة) لتبقى البصمات متوافقة بين التشغيلات
+_rng = random.Random(1337)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+                 for _ in range(NUM_PERMUTATIONS)]
+
+# توحيد الحروف العربية: إزالة التشكيل والتطويل، وتوحيد الألف والياء والتاء المربوطة
+_ARABIC_TRANSLATION = str.maketrans({
+    **{chr(code): None for code in range(0x064B, 0x0660)},  # التشكيل
+    'ٰ': None,  # الألف الخنجرية
+    'ـ': None,  # التطويل
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي', 'ئ': 'ي',
+    'ؤ': 'و',
+    'ة': 'ه',
+})
+_NON_WORD_RE = re.compile(r'[\W_]+')
+
+
+def normalize_arabic(text):
+    """توحيد النص العربي قبل المقارنة (تشكيل، همزات، ألف/ياء/تاء مربوطة، علامات ترقيم)"""
+    text = text.translate(_ARABIC_TRANSLATION).casefold()
+    return _NON_WORD_RE.sub(' ', text).strip()
+
+
+def _shingles(text):
+    """مقاطع من SHINGLE_SIZE كلمات متتالية من النص الموحد"""
+    words = text.split()
+    if len(words) <= SHINGLE_SIZE:
+        return {' '.join(words)}
+    return {' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def signature(title):
+    """بصمة MinHash للعنوان"""
+    hashes = [zlib.crc32(shingle.encode('utf-8')) for shingle in _shingles(normalize_arabic(title))]
+    return tuple(
+        min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+        for a, b in _PERMUTATIONS
+    )
+
+
+def similarity(sig_a, sig_b):
+    """تقدير تشابه Jaccard من بصمتين"""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERMUTATIONS
+
+
+def _bands(sig):
+    """تقسيم البصمة إلى حزم LSH"""
+    for band in range(LSH_BANDS):
+        yield band, sig[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+
+
+class NearDupIndex:
+    """فهرس LSH للأخبار الحديثة مع إزالة الأقدم من نافذة الوقت"""
+
+    def __init__(self, threshold=NEAR_DUP_THRESHOLD, window_hours=NEAR_DUP_WINDOW_HOURS):
+        self.threshold = threshold
+        self.window = timedelta(hours=window_hours)
+        self._buckets = {}  # (band, قيم الحزمة) -> مجموعة مفاتيح الأخبار
+        self._docs = {}  # مفتاح الخبر -> (البصمة، معرف المجموعة، المصدر، وقت الإضافة)
+        self._order = deque()  # (وقت الإضافة، مفتاح الخبر) بترتيب الإضافة
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def find_cluster(self, sig, source=None):
+        """
+        إرجاع (معرف المجموعة، التشابه) لأقرب خبر مشابه من مصدر آخر، أو (None, 0.0)
+
+        source: مصدر الخبر الجديد (أخبار نفس المصدر لا تُقارن به)
+        """
+        with self._lock:
+            candidates = set()
+            for band in _bands(sig):
+                candidates.update(self._buckets.get(band, ()))
+
+            best_cluster, best_score = None, 0.0
+            for key in candidates:
+                doc_sig, cluster_id, doc_source, _ = self._docs[key]
+                if source is not None and doc_source == source:
+                    continue
+                score = similarity(sig, doc_sig)
+                if score > best_score:
+                    best_cluster, best_score = cluster_id, score
+
+        if best_score >= self.threshold:
+            return best_cluster, best_score
+        return None, 0.0
+
+    def add(self, key, sig, cluster_id, source=None, added_at=None):
+        """إضافة خبر (من المصدر source) إلى الفهرس ضمن مجموعة معينة"""
+        with self._lock:
+            if key in self._docs:
+                return
+            added_at = added_at or datetime.utcnow()
+            self._docs[key] = (sig, cluster_id, source, added_at)
+            self._order.append((added_at, key))
+            for band in _bands(sig):
+                self._buckets.setdefault(band, set()).add(key)
+
+    def _discard(self, key):
+        doc = self._docs.pop(key, None)
+        if doc is None:
+            return False
+        for band in _bands(doc[0]):
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band]
+        return True
+
+    def remove(self, key):
+        """إزالة خبر من الفهرس (خبر حُجز ولم يُنشر)"""
+        with self._lock:
+            return self._discard(key)
+
+    def prune(self, now=None):
+        """إزالة الأخبار التي خرجت من نافذة الوقت (الأوقات بتوقيت UTC مثل created_at)"""
+        cutoff = (now or datetime.utcnow()) - self.window
+        removed = 0
+        with self._lock:
+            while self._order and self._order[0][0] <= cutoff:
+                added_at, key = self._order.popleft()
+                doc = self._docs.get(key)
+                # تجاهل السجلات القديمة لخبر أُزيل ثم أُضيف من جديد
+                if doc is not None and doc[3] == added_at and self._discard(key):
+                    removed += 1
+        return removed
+
+
+# الفهرس المشترك داخل العملية
+index = NearDupIndex()
+# أكبر معرف خبر في published_news أُضيف للفهرس من قاعدة البيانات
+_indexed_id = 0
+
+
+def warm_index(window_hours=NEAR_DUP_WINDOW_HOURS, since_id=None):
+    """
+    تعبئة الفهرس بعناوين الأخبار المنشورة خلال النافذة (عند التشغيل)
+
+    since_id: إضافة الأخبار الأحدث من آخر تعبئة فقط (أخبار نشرتها عمليات worker أخرى)
+    """
+    global _indexed_id
+    # created_at بتوقيت UTC، فالنافذة تُحسب في SQLite من datetime('now')
+    rows = get_connection().execute(
+        """SELECT id, title, title_hash, cluster_id, source, created_at FROM published_news
+           WHERE created_at > datetime('now', ?) AND id > ? AND title_hash IS NOT NULL
+           ORDER BY created_at""", (f'-{window_hours} hours', since_id or 0)
+    ).fetchall()
+    for news_id, title, title_hash, cluster_id, source, created_at in rows:
+        try:
+            added_at = datetime.fromisoformat(str(created_at))
+        except ValueError:
+            added_at = None
+        index.add(title_hash, signature(title or ''), cluster_id or title_hash, source, added_at)
+        _indexed_id = max(_indexed_id, news_id)
+    return len(rows)
+
+
+def refresh_index(window_hours=NEAR_DUP_WINDOW_HOURS):
+    """إضافة ما نُشر منذ آخر تعبئة (يُستدعى في بداية كل دورة عند تقسيم المصادر)"""
+    return warm_index(window_hours, since_id=_indexed_id)
@@ -4,54 +4,122 @@
 Telegram Auto News Publisher Bot
 
 يجلب الأخبار من مصادر RSS ويرسلها تلقائياً لقناة تليجرام
+
+استيراد هذه الوحدة بلا آثار جانبية: قراءة .env والتحقق من الإعدادات يتمان في
+load_settings() عند التشغيل، و telegram.ext و feedparser تُستورد عند الحاجة فقط
 """
 
 import os
 import sys
+import json
+import argparse
 import time
 import sqlite3
 import asyncio
-import feedparser
-import schedule
-from datetime import datetime, timedelta
+from datetime import datetime
 from dotenv import load_dotenv
-from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup, Update
-from telegram.error import TelegramError
-from telegram.ext import Application, CallbackQueryHandler, ContextTypes
-
-# إصلاح مشكلة الترميز في Windows
-if sys.platform == 'win32':
-    try:
-        # محاولة تعيين UTF-8 للـ stdout
-        sys.stdout.reconfigure(encoding='utf-8')
-    except:
-        # إذا فشل، استخدم encoding افتراضي
-        pass
-
-# تحميل الإعدادات من ملف .env
-load_dotenv()
+from telegram import Bot
+from telegram.error import RetryAfter, TelegramError
 
 # استيراد إعدادات المصادر
 from config import RSS_FEEDS, MAX_POSTS_PER_CHECK, NEWS_COOLDOWN_HOURS, SOURCE_EMOJIS, DEFAULT_EMOJI
+from config import REACTION_FLUSH_SECONDS, JOB_POLL_SECONDS, FEED_MIN_POLL_MINUTES
+from config import FEED_FIRST_POLL_LIMIT, FEED_SEEN_GUIDS, METRICS_HOST, METRICS_PORT
+from config import RETENTION_INTERVAL_MINUTES, UPDATE_MODE as DEFAULT_UPDATE_MODE
+from config import WEBHOOK_PORT, UPDATE_CONCURRENCY, WORKER_SHARD_INDEX, WORKER_SHARD_COUNT
+from config import FEED_PARSE_PROCESSES, PUBLISH_DRAIN_TIMEOUT_SECONDS, PUBLISH_STALE_RESERVATION_MINUTES
+import dedup
+import near_dup
+import jobs
+import dashboard_stats
+import feed_fetcher
+import feed_health
+import metrics
+import retention
+import cluster
+from db import get_connection, transaction
+from publisher import Publisher, set_rate_share
+from sanitizer import hashtag, plain_text
+from reaction_handler import build_reaction_keyboard, handle_reaction, news_post_ref
+from reaction_handler import store as reaction_store
 
-# إعداد متغيرات البيئة
+# إعدادات البيئة (تُقرأ من جديد بعد تحميل .env في load_settings)
 BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 CHANNEL_ID = os.getenv("TELEGRAM_CHANNEL_ID")
 INTERVAL = int(os.getenv("CHECK_INTERVAL_MINUTES", 30))
+# عنوان Bot API بديل (خادم Bot API محلي أو بديل اختبار)، والافتراضي api.telegram.org
+API_BASE_URL = os.getenv("TELEGRAM_API_URL")
+# استقبال التحديثات: polling أو webhook (الرابط العام للخادم والسر ومنفذ الاستماع)
+UPDATE_MODE = os.getenv("UPDATE_MODE", DEFAULT_UPDATE_MODE)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_LISTEN_PORT = int(os.getenv("PORT") or WEBHOOK_PORT)
+# نصيب هذه العملية من المصادر عند تشغيل عدة عمليات worker (cluster.py)
+SHARD = cluster.Shard()
+# عدد عمليات تحليل RSS (0 = معطل، و None = تلقائي حسب عدد الأنوية)
+PARSE_PROCESSES = FEED_PARSE_PROCESSES
+
+
+def load_settings():
+    """
+    تحميل .env وقراءة إعدادات البيئة والتحقق منها
+
+    يُرجع قائمة رسائل الأخطاء (فارغة إذا كانت الإعدادات صالحة)
+    """
+    global BOT_TOKEN, CHANNEL_ID, INTERVAL, API_BASE_URL
+    global UPDATE_MODE, WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_LISTEN_PORT, SHARD, PARSE_PROCESSES
+    load_dotenv()
+    BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+    CHANNEL_ID = os.getenv("TELEGRAM_CHANNEL_ID")
+    INTERVAL = int(os.getenv("CHECK_INTERVAL_MINUTES", 30))
+    API_BASE_URL = os.getenv("TELEGRAM_API_URL")
+    UPDATE_MODE = os.getenv("UPDATE_MODE", DEFAULT_UPDATE_MODE)
+    WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+    WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+    WEBHOOK_LISTEN_PORT = int(os.getenv("PORT") or WEBHOOK_PORT)
+    
+    errors = []
+    if not BOT_TOKEN or BOT_TOKEN == "ضع_توكن_بوتك_هنا":
+        errors.append("يجب تعيين TELEGRAM_BOT_TOKEN في ملف .env\n"
+                      "   احصل على التوكن من @BotFather في تليجرام")
+    if not CHANNEL_ID or CHANNEL_ID == "@اسم_قناتك_او_رقمها":
+        errors.append("يجب تعيين TELEGRAM_CHANNEL_ID في ملف .env\n"
+                      "   استخدم @username أو ID القناة")
+    if UPDATE_MODE not in ('polling', 'webhook'):
+        errors.append(f"UPDATE_MODE يجب أن يكون polling أو webhook (القيمة الحالية: {UPDATE_MODE})")
+    elif UPDATE_MODE == 'webhook' and not WEBHOOK_URL:
+        errors.append("وضع webhook يحتاج WEBHOOK_URL (الرابط العام HTTPS للخادم)")
+    try:
+        SHARD = cluster.Shard(int(os.getenv("WORKER_SHARD_INDEX", WORKER_SHARD_INDEX)),
+                              int(os.getenv("WORKER_SHARD_COUNT", WORKER_SHARD_COUNT)))
+    except ValueError as e:
+        errors.append(f"WORKER_SHARD_INDEX / WORKER_SHARD_COUNT: {e}")
+    parse_processes = os.getenv("FEED_PARSE_PROCESSES", "").strip()
+    try:
+        if parse_processes == 'auto':
+            PARSE_PROCESSES = None
+        else:
+            PARSE_PROCESSES = int(parse_processes) if parse_processes else FEED_PARSE_PROCESSES
+    except ValueError:
+        errors.append(f"FEED_PARSE_PROCESSES يجب أن يكون رقماً أو auto (القيمة الحالية: {parse_processes})")
+    return errors
+
 
-# التحقق من وجود الإعدادات الضرورية
-if not BOT_TOKEN or BOT_TOKEN == "ضع_توكن_بوتك_هنا":
-    print("❌ خطأ: يجب تعيين TELEGRAM_BOT_TOKEN في ملف .env")
-    print("   احصل على التوكن من @BotFather في تليجرام")
-    sys.exit(1)
+def _bot_kwargs():
+    """معاملات إضافية لإنشاء Bot (عنوان Bot API البديل إن وُجد)"""
+    return {'base_url': API_BASE_URL} if API_BASE_URL else {}
 
-if not CHANNEL_ID or CHANNEL_ID == "@اسم_قناتك_او_رقمها":
-    print("❌ خطأ: يجب تعيين TELEGRAM_CHANNEL_ID في ملف .env")
-    print("   استخدم @username أو ID القناة")
-    sys.exit(1)
+# قفل دورة الجلب والنشر (دورة واحدة فقط في أي وقت)
+_cycle_lock = asyncio.Lock()
 
-# مسار قاعدة البيانات
-DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'news_bot.db')
+# المهام الدورية التي تعمل على event loop البوت
+_background_tasks = []
+# خادم /metrics داخل البوت (يُشغل في post_init)
+_metrics_server = None
+# عقد القيادة: المهام المفردة (الحذف والصيانة وطلبات لوحة التحكم) في عملية واحدة فقط
+_leader = None
+# البوت يتوقف (post_stop): تفريغ طابور النشر بمهلة محددة
+_stopping = False
 
 # دالة طباعة آمنة للتعامل مع مشاكل الترميز في Windows
 def safe_print(*args, **kwargs):
@@ -85,7 +153,7 @@ def safe_print(*args, **kwargs):
 
 def init_database():
     """تهيئة قاعدة البيانات"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     c = conn.cursor()
     
     # جدول الأخبار المنشورة
@@ -98,6 +166,26 @@ def init_database():
                   telegram_message_id INTEGER,
                   created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
     
+    # مفتاح العنوان المفهرس لفحص التكرار دفعة واحدة
+    news_columns = {row[1] for row in c.execute("PRAGMA table_info(published_news)")}
+    if 'title_hash' not in news_columns:
+        c.execute("ALTER TABLE published_news ADD COLUMN title_hash TEXT")
+    # معرف مجموعة الأخبار المتشابهة (title_hash لأول خبر نُشر من المجموعة)
+    if 'cluster_id' not in news_columns:
+        c.execute("ALTER TABLE published_news ADD COLUMN cluster_id TEXT")
+    # مصدر الخبر ومعرفه فيه، لإعادة الخبر لمصدره إذا توقفت العملية قبل إرساله
+    if 'feed_id' not in news_columns:
+        c.execute("ALTER TABLE published_news ADD COLUMN feed_id INTEGER")
+    if 'guid' not in news_columns:
+        c.execute("ALTER TABLE published_news ADD COLUMN guid TEXT")
+    missing_hashes = c.execute("SELECT id, title FROM published_news WHERE title_hash IS NULL").fetchall()
+    c.executemany("UPDATE published_news SET title_hash = ? WHERE id = ?",
+                  [(dedup.title_key(title or ''), news_id) for news_id, title in missing_hashes])
+    c.execute("""CREATE INDEX IF NOT EXISTS idx_published_news_title_hash
+                 ON published_news (title_hash, created_at)""")
+    c.execute("""CREATE INDEX IF NOT EXISTS idx_published_news_created_at
+                 ON published_news (created_at)""")
+    
     # جدول المصادر RSS
     c.execute('''CREATE TABLE IF NOT EXISTS rss_feeds
                  (id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -106,6 +194,19 @@ def init_database():
                   is_active BOOLEAN DEFAULT 1,
                   added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
     
+    # أعمدة كاش الطلبات الشرطية (ETag / Last-Modified) للقواعد القديمة
+    feed_columns = {row[1] for row in c.execute("PRAGMA table_info(rss_feeds)")}
+    for column in ('etag', 'last_modified', 'content_hash'):
+        if column not in feed_columns:
+            c.execute(f"ALTER TABLE rss_feeds ADD COLUMN {column} TEXT")
+    # آخر الأخبار التي رأيناها في كل مصدر: معرفاتها (JSON) وأحدث تاريخ نشر
+    if 'seen_guids' not in feed_columns:
+        c.execute("ALTER TABLE rss_feeds ADD COLUMN seen_guids TEXT")
+    if 'high_water_mark' not in feed_columns:
+        c.execute("ALTER TABLE rss_feeds ADD COLUMN high_water_mark TIMESTAMP")
+    # أعمدة صحة المصدر وموعد فحصه القادم
+    feed_health.init_health_columns(conn)
+    
     # جدول التفاعلات (الإعجابات والنجوم)
     c.execute('''CREATE TABLE IF NOT EXISTS reactions
                  (id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -115,6 +216,14 @@ def init_database():
                   created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                   UNIQUE(message_id, user_id, reaction_type))''')
     
+    # ربط التفاعل بسجل الخبر في published_news (للأزرار الجديدة)
+    reaction_columns = {row[1] for row in c.execute("PRAGMA table_info(reactions)")}
+    if 'news_id' not in reaction_columns:
+        c.execute("ALTER TABLE reactions ADD COLUMN news_id INTEGER")
+    
+    # جدول المهام (طلبات لوحة التحكم)
+    jobs.init_jobs_table(conn)
+    
     # نقل المصادر من config.py إلى قاعدة البيانات (إضافة المصادر الجديدة)
     try:
         feeds_count = c.execute("SELECT COUNT(*) FROM rss_feeds").fetchone()[0]
@@ -138,176 +247,414 @@ def init_database():
         safe_print(f"⚠️ تحذير في نقل المصادر: {e}")
     
     conn.commit()
-    conn.close()
+    
+    # عدادات لوحة التحكم (تُحدّث بـ triggers) وفهارس الصفحات
+    dashboard_stats.init_stats_table(conn)
+    # حالة الصيانة وفهارس أعمار الصفوف (سياسات الاحتفاظ)
+    retention.init_retention(conn)
+    # عقود القيادة بين عمليات worker
+    cluster.init_leases(conn)
     safe_print("✅ تم تهيئة قاعدة البيانات")
 
 
-def is_news_published(title):
-    """تحقق إذا كان الخبر منشوراً من قبل"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    # تحقق إذا كان الخبر منشوراً خلال فترة الانتظار
-    cooldown_time = datetime.now() - timedelta(hours=NEWS_COOLDOWN_HOURS)
-    c.execute("""SELECT 1 FROM published_news 
-                 WHERE title = ? AND created_at > ?""", (title, cooldown_time))
-    result = c.fetchone()
-    conn.close()
-    return result is not None
+def reserve_published_news(title, source, link, title_hash=None, cluster_id=None, feed_id=None, guid=None):
+    """
+    حجز سجل الخبر قبل إرساله وإرجاع معرفه، أو None إذا سبقتنا إليه عملية أخرى
 
+    الحجز ذري: أمر واحد يضيف السجل فقط إذا لم يكن نفس المفتاح منشوراً أو محجوزاً
+    خلال NEWS_COOLDOWN_HOURS (SQLite ينفذ الكتابات واحدة تلو الأخرى)، فلا يُنشر الخبر
+    مرتين حتى مع عدة عمليات worker. والمعرف ثابت ومعروف قبل الإرسال، فتُبنى أزرار
+    التفاعل به من أول طلب
+    """
+    title_hash = title_hash or dedup.title_key(title)
+    # created_at بتوقيت UTC (CURRENT_TIMESTAMP)، فالمقارنة بـ datetime('now') وليس بالوقت المحلي
+    with transaction() as conn:
+        rows = conn.execute("""INSERT OR REPLACE INTO published_news 
+                               (title, title_hash, cluster_id, source, link, published_at, feed_id, guid) 
+                               SELECT ?, ?, ?, ?, ?, ?, ?, ?
+                               WHERE NOT EXISTS (SELECT 1 FROM published_news
+                                                 WHERE title_hash = ? AND created_at > datetime('now', ?))
+                               RETURNING id""",
+                            (title, title_hash, cluster_id or title_hash, source, link, datetime.now(),
+                             feed_id, guid, title_hash, f'-{NEWS_COOLDOWN_HOURS} hours')).fetchall()
+    dedup.remember(title_hash)
+    return rows[0][0] if rows else None
 
-def save_published_news(title, source, link, telegram_msg_id):
-    """حفظ الخبر في قاعدة البيانات"""
+
+def confirm_published_news(news_id, telegram_msg_id):
+    """تسجيل معرف رسالة تليجرام للخبر بعد نجاح الإرسال"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("""INSERT OR REPLACE INTO published_news 
-                     (title, source, link, published_at, telegram_message_id) 
-                     VALUES (?, ?, ?, ?, ?)""",
-                  (title, source, link, datetime.now(), telegram_msg_id))
-        conn.commit()
-        conn.close()
+        with transaction() as conn:
+            conn.execute("UPDATE published_news SET telegram_message_id = ? WHERE id = ?",
+                         (telegram_msg_id, news_id))
     except sqlite3.Error as e:
         safe_print(f"❌ خطأ في حفظ الخبر: {e}")
 
 
-def cleanup_old_news():
-    """حذف الأخبار القديمة (أكبر من 7 أيام)"""
+def discard_published_news(news_id):
+    """حذف سجل خبر محجوز فشل إرساله"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        week_ago = datetime.now() - timedelta(days=7)
-        c.execute("DELETE FROM published_news WHERE created_at < ?", (week_ago,))
-        deleted = c.rowcount
-        conn.commit()
-        conn.close()
-        if deleted > 0:
-            safe_print(f"🗑️ تم حذف {deleted} خبر قديم")
+        with transaction() as conn:
+            conn.execute("DELETE FROM published_news WHERE id = ? AND telegram_message_id IS NULL",
+                         (news_id,))
     except sqlite3.Error as e:
-        safe_print(f"❌ خطأ في تنظيف الأخبار القديمة: {e}")
+        safe_print(f"❌ خطأ في حذف الخبر المحجوز: {e}")
+
+
+# معرفات أخبار فشل نشرها في الدورة الحالية (المصدر -> المعرفات): إذا فشل الإرسال
+# قبل حفظ كاش المصدر تُزال من جديد بعد الحفظ (fetch_latest_news)
+_released_guids = {}
 
 
-def get_active_feeds():
-    """جلب المصادر النشطة من قاعدة البيانات"""
-    feeds = {}
+def forget_feed_guids(feed_id, guids):
+    """
+    إزالة أخبار من معرفات المصدر المحفوظة، مع مسح ETag و Last-Modified وبصمة المحتوى
+    حتى يُحلل المصدر كاملاً في الفحص القادم ولا يُتخطى لأنه لم يتغير
+    """
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("SELECT name, url FROM rss_feeds WHERE is_active = 1")
-        rows = c.fetchall()
-        conn.close()
+        with transaction() as conn:
+            row = conn.execute("SELECT seen_guids FROM rss_feeds WHERE id = ?", (feed_id,)).fetchone()
+            seen_guids = [seen for seen in json.loads(row[0]) if seen not in guids] if row and row[0] else []
+            # بدون معرفات محفوظة يُعتمد على آخر تاريخ نشر، فيُمسح حتى لا يتخطى الخبر
+            conn.execute("""UPDATE rss_feeds SET etag = NULL, last_modified = NULL, content_hash = NULL,
+                                seen_guids = ?,
+                                high_water_mark = CASE WHEN ? THEN high_water_mark END
+                            WHERE id = ?""",
+                         (json.dumps(seen_guids, ensure_ascii=False), bool(seen_guids), feed_id))
+    except sqlite3.Error as e:
+        safe_print(f"❌ خطأ في تحديث معرفات المصدر: {e}")
+
+
+def release_news(news_item):
+    """إلغاء حجز خبر لم يُنشر، وإزالته من أخبار مصدره المرئية ليُعاد في الفحص القادم"""
+    if news_item.news_id is not None:
+        discard_published_news(news_item.news_id)
+    dedup.forget(news_item.title_hash)
+    near_dup.index.remove(news_item.title_hash)
+    if news_item.feed_id is not None:
+        _released_guids.setdefault(news_item.feed_id, set()).add(news_item.guid)
+        forget_feed_guids(news_item.feed_id, {news_item.guid})
+
+
+def release_stale_reservations(minutes=PUBLISH_STALE_RESERVATION_MINUTES):
+    """
+    إلغاء حجوزات الأخبار التي توقفت عمليتها قبل إرسالها، وإعادتها لمصادرها
+
+    الحجز ومعرفات المصدر يُحفظان قبل الإرسال، فإذا توقفت العملية وفي طابورها أخبار
+    يبقى سجلها بلا telegram_message_id ولا يُجلب الخبر مرة أخرى أبداً.
+    الحجوزات الأحدث من minutes قد تكون في طابور عملية worker أخرى فتُترك
+    """
+    with transaction() as conn:
+        rows = conn.execute("""DELETE FROM published_news
+                               WHERE telegram_message_id IS NULL AND created_at < datetime('now', ?)
+                               RETURNING title_hash, feed_id, guid""", (f'-{minutes} minutes',)).fetchall()
+    guids = {}
+    for title_hash, feed_id, guid in rows:
+        dedup.forget(title_hash)
+        if feed_id is not None and guid is not None:
+            guids.setdefault(feed_id, set()).add(guid)
+    for feed_id, feed_guids in guids.items():
+        forget_feed_guids(feed_id, feed_guids)
+    return len(rows)
+
+
+def get_active_feeds(force=False):
+    """
+    جلب المصادر النشطة التي حان موعد فحصها (مع بيانات الكاش الخاصة بكل مصدر)
+
+    force: كل المصادر النشطة بغض النظر عن موعدها، ما عدا المفصولة (circuit breaker)
+    """
+    feeds = []
+    now = datetime.now()
+    try:
+        if force:
+            rows = get_connection().execute(
+                """SELECT id, name, url, etag, last_modified, content_hash, seen_guids, high_water_mark
+                   FROM rss_feeds WHERE is_active = 1
+                   AND (circuit_open_until IS NULL OR circuit_open_until <= ?)""", (now,)
+            ).fetchall()
+        else:
+            rows = get_connection().execute(
+                """SELECT id, name, url, etag, last_modified, content_hash, seen_guids, high_water_mark
+                   FROM rss_feeds WHERE is_active = 1
+                   AND (next_poll_at IS NULL OR next_poll_at <= ?)""", (now,)
+            ).fetchall()
+        if not force:
+            # عند تقسيم المصادر: نصيب هذه العملية فقط (الفحص بطلب من اللوحة يشمل الكل)
+            rows = [row for row in rows if SHARD.owns(row[0])]
         for row in rows:
-            feeds[row[0]] = row[1]
+            feeds.append({
+                'id': row[0],
+                'name': row[1],
+                'url': row[2],
+                'etag': row[3],
+                'last_modified': row[4],
+                'content_hash': row[5],
+                'seen_guids': set(json.loads(row[6])) if row[6] else set(),
+                'high_water_mark': datetime.fromisoformat(row[7]) if row[7] else None
+            })
     except Exception as e:
         safe_print(f"❌ خطأ في جلب المصادر من قاعدة البيانات: {e}")
         # Fallback if DB fails
         from config import RSS_FEEDS as FALLBACK_FEEDS
-        return FALLBACK_FEEDS
+        return [{'id': None, 'name': name, 'url': url, 'etag': None,
+                 'last_modified': None, 'content_hash': None,
+                 'seen_guids': set(), 'high_water_mark': None}
+                for name, url in FALLBACK_FEEDS.items()]
     return feeds
 
-def fetch_latest_news():
-    """جلب أحدث الأخبار من جميع المصادر"""
-    all_news = []
-    
+
+def save_feed_cache(feed_id, etag, last_modified, content_hash, seen_guids=None, high_water_mark=None):
+    """
+    حفظ ETag و Last-Modified وبصمة المحتوى للمصدر (للطلبات الشرطية في الفحص القادم)
+
+    seen_guids و high_water_mark: معرفات أخبار المصدر الحالية وأحدث تاريخ نشر
+    (None = بدون تغيير)
+    """
+    if feed_id is None:
+        return
+    if seen_guids is not None:
+        seen_guids = json.dumps(seen_guids[:FEED_SEEN_GUIDS], ensure_ascii=False)
+    try:
+        with transaction() as conn:
+            conn.execute("""UPDATE rss_feeds SET etag = ?, last_modified = ?, content_hash = ?,
+                                seen_guids = COALESCE(?, seen_guids),
+                                high_water_mark = COALESCE(?, high_water_mark)
+                            WHERE id = ?""", (etag, last_modified, content_hash,
+                                              seen_guids, high_water_mark, feed_id))
+    except sqlite3.Error as e:
+        safe_print(f"❌ خطأ في حفظ كاش المصدر: {e}")
+
+
+class NewsItem:
+    """
+    خبر جديد في طريقه للنشر
+
+    يُنشأ فقط للأخبار التي اجتازت منع التكرار، والوصف ونص الرسالة يُحسبان
+    عند أول استخدام (داخل عامل النشر) وليس عند الجلب
+    """
+
+    __slots__ = ('title', 'title_hash', 'cluster_id', 'news_id', 'source', 'feed_id', '_entry', '_message')
+
+    def __init__(self, title, title_hash, source, entry, feed_id=None):
+        self.title = title
+        self.title_hash = title_hash
+        self.cluster_id = title_hash  # الخبر الجديد يبدأ مجموعته الخاصة
+        self.news_id = None  # معرف سجله المحجوز في published_news
+        self.source = source
+        self.feed_id = feed_id
+        self._entry = entry
+        self._message = None
+
+    @property
+    def link(self):
+        return self._entry.link
+
+    @property
+    def guid(self):
+        return self._entry.guid
+
+    @property
+    def description(self):
+        """الوصف الخام كما ورد في المصدر (يُنظف عند التنسيق)"""
+        return self._entry.summary
+
+    @property
+    def published(self):
+        return self._entry.published or datetime.now().isoformat()
+
+    @property
+    def message(self):
+        """نص الرسالة المنسق (يُحسب مرة واحدة عند أول طلب)"""
+        if self._message is None:
+            self._message = format_news_message(self.title, self.description, self.link, self.source)
+        return self._message
+
+
+def _new_entries(feed, seen_guids, high_water_mark):
+    """
+    مرحلة التوحيد: (العنوان، الخبر) للأخبار التي لم تُرَ من قبل في هذا المصدر
+
+    المعرفات المحفوظة هي معرفات أول FEED_SEEN_GUIDS خبر في المستند السابق، فتُقارن
+    بنفس الجزء من المستند الحالي كاملاً (وليس حتى أول أخبار مرئية متتالية)، حتى يُعاد
+    الخبر الذي فشل نشره (release_news) ولو سبقته أخبار منشورة.
+    إذا لم تُحفظ معرفات بعد، تُتخطى الأخبار الأقدم من آخر تاريخ نشر رأيناه.
+    لا حد لعدد الأخبار الجديدة، إلا في أول فحص للمصدر
+    """
+    first_poll = not seen_guids and high_water_mark is None
+    count = 0
+    for entry in feed.entries[:FEED_SEEN_GUIDS]:
+        if entry.guid in seen_guids:
+            continue
+        if not seen_guids and high_water_mark is not None:
+            if entry.timestamp is not None and entry.timestamp <= high_water_mark:
+                continue
+        title = entry.title
+        if not title:
+            continue
+        yield title, entry
+        count += 1
+        if first_poll and count >= FEED_FIRST_POLL_LIMIT:
+            break
+
+
+def _feed_marks(feed):
+    """معرفات أخبار المستند الحالي وأحدث تاريخ نشر فيه (تُحفظ للفحص القادم)"""
+    # التواريخ المستقبلية (خطأ في المصدر) لا ترفع العلامة فوق الوقت الحالي
+    now = datetime.utcnow().replace(microsecond=0)
+    timestamps = [min(entry.timestamp, now) for entry in feed.entries if entry.timestamp is not None]
+    return [entry.guid for entry in feed.entries], max(timestamps, default=None)
+
+
+def record_feed_failure(result, error):
+    """تسجيل فشل المصدر في حالته الصحية (مع تنبيه عند فصله)"""
+    if feed_health.record_failure(result.feed_id, error, result.elapsed, INTERVAL):
+        safe_print(f"🔌 تم إيقاف فحص {result.name} مؤقتاً بعد أخطاء متتالية")
+
+
+async def fetch_latest_news(force=False):
+    """
+    جلب أحدث الأخبار من المصادر التي حان موعدها كتدفق: جلب ← توحيد ← منع التكرار ← NewsItem
+
+    كل مصدر يُعالج فور اكتمال جلبه، والتنسيق يتم لاحقاً للأخبار الجديدة فقط
+    force: فحص كل المصادر النشطة الآن (طلب من لوحة التحكم)
+    """
     # استخدام المصادر من قاعدة البيانات بدلاً من الملف الثابت
-    active_feeds = get_active_feeds()
+    active_feeds = get_active_feeds(force)
     
     if not active_feeds:
-        safe_print("⚠️ لا توجد مصادر نشطة في قاعدة البيانات")
-        return []
+        safe_print("📭 لا توجد مصادر حان موعد فحصها")
+        return
+    
+    feeds_by_id = {feed['id']: feed for feed in active_feeds}
+    pending_feeds = dict(feeds_by_id)
+    # كتابات SQLite (الحجز، كاش المصدر، صحته) في thread: قد تنتظر قفل الكتابة حتى
+    # busy_timeout، والضغطات على نفس الـ event loop لا تتوقف خلال ذلك
+    loop = asyncio.get_running_loop()
+    # إخفاقات الدورة السابقة محفوظة في قاعدة البيانات (forget_feed_guids)
+    _released_guids.clear()
 
-    for source_name, rss_url in active_feeds.items():
+    total_news = 0
+    total_skipped = 0
+    total_similar = 0
+    total_claimed = 0
+    async for result in feed_fetcher.fetch_feeds(active_feeds):
+        pending_feeds.pop(result.feed_id, None)
+        source_name = result.name
+        if result.error is not None:
+            safe_print(f"❌ خطأ في جلب أخبار {source_name}: {result.error}")
+            metrics.log_event('feed_fetch', feed=source_name, outcome='error',
+                              seconds=round(result.elapsed, 3), error=str(result.error))
+            await loop.run_in_executor(None, record_feed_failure, result, result.error)
+            continue
+        
+        if result.not_modified:
+            safe_print(f"⏭️ {source_name}: لا جديد منذ آخر فحص")
+            metrics.log_event('feed_fetch', feed=source_name, outcome='not_modified',
+                              seconds=round(result.elapsed, 3))
+            if result.cache_changed:
+                await loop.run_in_executor(None, save_feed_cache, result.feed_id, result.etag,
+                                           result.last_modified, result.content_hash)
+            await loop.run_in_executor(None, feed_health.record_success,
+                                       result.feed_id, result.elapsed, 0, INTERVAL)
+            continue
+        
         try:
-            safe_print(f"🔍 جلب الأخبار من: {source_name}")
-            feed = feedparser.parse(rss_url)
+            feed = result.feed
             
             if feed.bozo:
                 safe_print(f"⚠️ تحذير: مشكلة في قراءة RSS من {source_name}")
+                await loop.run_in_executor(None, record_feed_failure, result, feed.bozo_exception or 'bozo')
                 continue
             
-            entries = feed.entries[:10]  # آخر 10 أخبار من كل مصدر
-            safe_print(f"   📰 وجدت {len(entries)} خبر")
+            feed_state = feeds_by_id.get(result.feed_id) or {}
+            entries = list(_new_entries(feed, feed_state.get('seen_guids') or set(),
+                                        feed_state.get('high_water_mark')))
             
-            for entry in entries:
-                if hasattr(entry, 'title') and entry.title:
-                    title = entry.title.strip()
-                    link = entry.link if hasattr(entry, 'link') else ''
-                    
-                    # الحصول على الوصف
-                    description = ""
-                    if hasattr(entry, 'summary'):
-                        description = entry.summary
-                    elif hasattr(entry, 'description'):
-                        description = entry.description
-                    
-                    # تنظيف الوصف من HTML
-                    import re
-                    description = re.sub('<[^<]+?>', '', description)
-                    description = description.strip()[:200]  # أول 200 حرف
-                    
-                    # الحصول على تاريخ النشر
-                    published = ""
-                    if hasattr(entry, 'published'):
-                        published = entry.published
-                    elif hasattr(entry, 'updated'):
-                        published = entry.updated
-                    else:
-                        published = datetime.now().isoformat()
-                    
-                    # تنسيق الرسالة
-                    message = format_news_message(title, description, link, source_name)
-                    
-                    all_news.append({
-                        'title': title,
-                        'message': message,
-                        'source': source_name,
-                        'link': link,
-                        'published': published
-                    })
+            # منع التكرار بين المصادر باستعلام واحد (قبل أي تنظيف أو تنسيق)
+            fresh_entries = dedup.filter_unpublished(
+                entries, NEWS_COOLDOWN_HOURS, key=lambda pair: pair[0]
+            ) if entries else []
+            total_skipped += len(entries) - len(fresh_entries)
+            metrics.DEDUP_HITS.labels('seen').inc(len(feed.entries) - len(entries))
+            metrics.DEDUP_HITS.labels('published').inc(len(entries) - len(fresh_entries))
+            feed_similar = 0
+            safe_print(f"🔍 {source_name}: {len(entries)} خبر لم يُرَ من قبل (من {len(feed.entries)})، "
+                       f"منها {len(fresh_entries)} جديد ({result.elapsed:.1f} ثانية)")
+            
+            for title_hash, (title, entry) in fresh_entries:
+                # كشف الأخبار المتشابهة (نفس الخبر بعنوان مختلف من مصدر آخر)
+                signature = near_dup.signature(title)
+                cluster_id, similarity = near_dup.index.find_cluster(signature, source_name)
+                if cluster_id is not None:
+                    near_dup.index.add(title_hash, signature, cluster_id, source_name)
+                    total_similar += 1
+                    feed_similar += 1
+                    safe_print(f"🧩 خبر مشابه ({similarity:.0%}) ضمن المجموعة {cluster_id}: {title[:50]}...")
+                    continue
+                
+                # حجز الخبر قبل إرساله لطابور النشر: في قاعدة البيانات (بين العمليات)
+                # وداخل العملية، حتى لا يمر نفس الخبر (أو خبر مشابه) من مصدر آخر
+                news_item = NewsItem(title, title_hash, source_name, entry, result.feed_id)
+                news_item.news_id = await loop.run_in_executor(
+                    None, reserve_published_news, title, source_name, news_item.link,
+                    title_hash, news_item.cluster_id, result.feed_id, news_item.guid)
+                near_dup.index.add(title_hash, signature, title_hash, source_name)
+                if news_item.news_id is None:
+                    total_claimed += 1
+                    continue
+                total_news += 1
+                yield news_item
+            
+            # حفظ الكاش وآخر ما رأيناه بعد معالجة أخبار المصدر. الأخبار التي يفشل نشرها
+            # تُزال من المعرفات (release_news)، وما فشل منها قبل هذا الحفظ يُزال بعده مباشرة
+            seen_guids, high_water_mark = _feed_marks(feed)
+            await loop.run_in_executor(None, save_feed_cache, result.feed_id, result.etag,
+                                       result.last_modified, result.content_hash,
+                                       seen_guids, high_water_mark)
+            released = _released_guids.pop(result.feed_id, None)
+            if released:
+                await loop.run_in_executor(None, forget_feed_guids, result.feed_id, released)
+            await loop.run_in_executor(None, feed_health.record_success,
+                                       result.feed_id, result.elapsed, len(fresh_entries), INTERVAL)
+            metrics.DEDUP_HITS.labels('similar').inc(feed_similar)
+            metrics.log_event('feed_fetch', feed=source_name, outcome='ok',
+                              seconds=round(result.elapsed, 3), entries=len(feed.entries),
+                              unseen=len(entries), new=len(fresh_entries) - feed_similar,
+                              similar=feed_similar)
                     
         except Exception as e:
             safe_print(f"❌ خطأ في جلب أخبار {source_name}: {e}")
+            await loop.run_in_executor(None, record_feed_failure, result, e)
     
-    safe_print(f"📊 إجمالي الأخبار المجلوبة: {len(all_news)}")
-    return all_news
-
+    # المصادر التي لم تكتمل قبل انقضاء مهلة الدورة
+    for feed_info in pending_feeds.values():
+        if await loop.run_in_executor(None, feed_health.record_failure,
+                                      feed_info['id'], "انقضت مهلة الدورة", 0, INTERVAL):
+            safe_print(f"🔌 تم إيقاف فحص {feed_info['name']} مؤقتاً بعد أخطاء متتالية")
+    
+    safe_print(f"📊 إجمالي الأخبار الجديدة: {total_news}")
+    if total_skipped > 0:
+        safe_print(f"⏭️ تم تخطي {total_skipped} خبر (منشور مسبقاً)")
+    if total_similar > 0:
+        safe_print(f"🧩 تم تخطي {total_similar} خبر مشابه لأخبار منشورة من مصادر أخرى")
+    if total_claimed > 0:
+        metrics.DEDUP_HITS.labels('claimed').inc(total_claimed)
+        safe_print(f"🔒 تم تخطي {total_claimed} خبر حجزته عملية worker أخرى")
 
-def escape_markdown(text):
-    """تهريب رموز Markdown الخاصة لتجنب أخطاء التنسيق"""
-    if not text:
-        return ""
-    import re
-    # تهريب الرموز الخاصة في Markdown
-    special_chars = ['*', '_', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '.', '!']
-    for char in special_chars:
-        text = text.replace(char, f'\\{char}')
-    return text
 
 def format_news_message(title, description, link, source_name):
     """تنسيق الخبر بشكل جميل للإرسال في تليجرام"""
     
-    # تنظيف العنوان والوصف من HTML والرموز الخاصة
-    import re
-    if title:
-        # إزالة HTML
-        title = re.sub('<[^<]+?>', '', title)
-        # إزالة رموز Markdown من العنوان (نستخدم نص عادي)
-        title = title.replace('*', '').replace('_', '').replace('[', '').replace(']', '')
-        title = title.strip()
-    
-    if description:
-        # إزالة HTML
-        description = re.sub('<[^<]+?>', '', description)
-        description = description.strip()[:200]  # أول 200 حرف
-        # تنظيف الوصف من الرموز الخاصة
-        description = description.replace('*', '').replace('_', '').replace('[', '').replace(']', '')
+    # تنظيف العنوان والوصف من HTML والرموز الخاصة (نستخدم نص عادي)
+    title = plain_text(title)
+    description = plain_text(description, limit=200)  # أول 200 حرف
     
     # اختيار الإيموجي حسب المصدر
     emoji = SOURCE_EMOJIS.get(source_name, DEFAULT_EMOJI)
     
     # بناء الرسالة بشكل احترافي وجميل
-    message = f"{emoji} {source_name}\n"
-    message += f"━━━━━━━━━━━━━━━━━━\n"
-    message += f"📌 {title}\n"
+    message = f"{emoji} {source_name}\n━━━━━━━━━━━━━━━━━━\n📌 {title}\n"
     
     if description:
         message += f"\n📝 {description}...\n"
@@ -316,135 +663,72 @@ def format_news_message(title, description, link, source_name):
     # if link:
     #     message += f"\n🔗 {link}"
     
-    # إضافة الهاشتاجات (تنظيف الاسم)
-    safe_source = source_name.replace(' ', '_').replace('-', '_')
-    # إزالة أي رموز خاصة من الهاشتاج
-    safe_source = re.sub(r'[^a-zA-Z0-9_أ-ي]', '', safe_source)
-    message += f"\n\n#{safe_source} #أخبار #عاجل #أخبار_عربية"
+    # إضافة الهاشتاجات (اسم المصدر بحروفه العربية)
+    message += f"\n\n#{hashtag(source_name)} #أخبار #عاجل #أخبار_عربية"
     
     return message
 
 
 async def post_to_telegram_async(bot, news_item, channel_error_shown=False):
-    """إرسال الخبر إلى قناة التليجرام (غير متزامن)"""
+    """
+    إرسال الخبر إلى قناة التليجرام (محاولة واحدة)
+
+    RetryAfter يُمرر لطابور النشر ليعيد المحاولة بعد المدة التي يحددها تليجرام
+    """
     try:
-        # تحقق إذا كان الخبر منشوراً من قبل
-        if is_news_published(news_item['title']):
-            safe_print(f"⏭️ تم نشر هذا الخبر مسبقاً: {news_item['title'][:50]}...")
-            return None
+        # نص الرسالة يُنسق هنا لأول مرة (العنوان والوصف نُظفا من HTML أثناء التنسيق)
+        clean_message = news_item.message
         
-        # إرسال الرسالة كنص عادي (بدون تنسيق) لتجنب جميع مشاكل Markdown/HTML
-        import re
-        clean_message = news_item['message']
+        # إنشاء أزرار التفاعل (إعجاب ونجوم) بمعرف الخبر المحجوز مباشرة
+        news_id = news_item.news_id
+        reply_markup = build_reaction_keyboard(news_post_ref(news_id))
         
-        # إزالة أي تنسيقات HTML/Markdown قد تسبب مشاكل
-        clean_message = re.sub('<[^<]+?>', '', clean_message)  # إزالة HTML tags
-        
-        # محاولة الإرسال مع معالجة Flood control
-        max_retries = 3
-        retry_count = 0
-        
-        while retry_count < max_retries:
-            try:
-                # إنشاء أزرار التفاعل (إعجاب ونجوم)
-                # سنستخدم معرف مؤقت ثم نحدثه بعد الحصول على message_id
-                temp_message_id = int(time.time() * 1000)  # معرف مؤقت
-                keyboard = [
-                    [
-                        InlineKeyboardButton("👍 إعجاب (0)", callback_data=f"like_{temp_message_id}"),
-                        InlineKeyboardButton("⭐ نجوم (0)", callback_data=f"star_{temp_message_id}")
-                    ]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                message = await bot.send_message(
-                    chat_id=CHANNEL_ID,
-                    text=clean_message,
-                    parse_mode=None,  # نص عادي بدون تنسيق
-                    disable_web_page_preview=True,  # إخفاء preview الروابط
-                    reply_markup=reply_markup  # إضافة أزرار التفاعل
-                )
-                
-                # تحديث الأزرار بمعرف الرسالة الحقيقي
-                try:
-                    real_keyboard = [
-                        [
-                            InlineKeyboardButton("👍 إعجاب (0)", callback_data=f"like_{message.message_id}"),
-                            InlineKeyboardButton("⭐ نجوم (0)", callback_data=f"star_{message.message_id}")
-                        ]
-                    ]
-                    real_reply_markup = InlineKeyboardMarkup(real_keyboard)
-                    await bot.edit_message_reply_markup(
-                        chat_id=CHANNEL_ID,
-                        message_id=message.message_id,
-                        reply_markup=real_reply_markup
-                    )
-                except:
-                    pass  # تجاهل الأخطاء في تحديث الأزرار
-                
-                break  # نجح الإرسال، اخرج من الحلقة
-            except TelegramError as e:
-                error_msg = str(e).lower()
-                
-                # معالجة Flood control - انتظر الوقت المطلوب ثم أعد المحاولة
-                if "flood control" in error_msg or "retry in" in error_msg:
-                    # استخراج وقت الانتظار من رسالة الخطأ
-                    import re
-                    retry_match = re.search(r'retry in (\d+)', error_msg, re.IGNORECASE)
-                    if retry_match:
-                        wait_time = int(retry_match.group(1)) + 2  # أضف ثانيتين إضافيتين للأمان
-                        safe_print(f"⏳ Flood control: انتظر {wait_time} ثانية قبل إعادة المحاولة...")
-                        await asyncio.sleep(wait_time)
-                        retry_count += 1
-                        continue
-                    else:
-                        # إذا لم نجد وقت محدد، انتظر 35 ثانية (الحد الأقصى عادة)
-                        safe_print(f"⏳ Flood control: انتظر 35 ثانية...")
-                        await asyncio.sleep(35)
-                        retry_count += 1
-                        continue
-                
-                # إذا كان الخطأ متعلقاً بعدم وجود البوت في القناة
-                elif "not a member" in error_msg or "forbidden" in error_msg or "chat not found" in error_msg:
-                    if not channel_error_shown:
-                        safe_print(f"\n{'='*60}")
-                        safe_print(f"⚠️ تحذير: البوت ليس عضو في القناة!")
-                        safe_print(f"{'='*60}")
-                        safe_print(f"📋 الخطوات المطلوبة:")
-                        safe_print(f"   1) افتح قناة @ArabNewsAi في تليجرام")
-                        safe_print(f"   2) اضغط على Settings (الإعدادات)")
-                        safe_print(f"   3) اختر Administrators (المدراء)")
-                        safe_print(f"   4) اضغط Add Administrator (إضافة مدير)")
-                        safe_print(f"   5) ابحث عن @News2027bot وأضفه")
-                        safe_print(f"   6) فعّل صلاحية 'Post Messages' (مهم جداً!)")
-                        safe_print(f"   7) احفظ التغييرات")
-                        safe_print(f"{'='*60}\n")
-                    return None
-                else:
-                    safe_print(f"❌ خطأ في إرسال الرسالة: {e}")
-                    return None
-        
-        # إذا فشلت جميع المحاولات
-        if retry_count >= max_retries:
-            safe_print(f"❌ فشل إرسال الرسالة بعد {max_retries} محاولات")
-            return None
+        started = time.perf_counter()
+        try:
+            message = await bot.send_message(
+                chat_id=CHANNEL_ID,
+                text=clean_message,
+                parse_mode=None,  # نص عادي بدون تنسيق
+                disable_web_page_preview=True,  # إخفاء preview الروابط
+                reply_markup=reply_markup  # إضافة أزرار التفاعل
+            )
+        except BaseException as e:
+            # الحجز يبقى أثناء إعادة المحاولة، ويُلغى إذا فشل النشر نهائياً (release_news)
+            metrics.TELEGRAM_SECONDS.labels(
+                'sendMessage', 'flood' if isinstance(e, RetryAfter) else 'error'
+            ).observe(time.perf_counter() - started)
+            raise
+        metrics.TELEGRAM_SECONDS.labels('sendMessage', 'ok').observe(time.perf_counter() - started)
         
-        # حفظ في قاعدة البيانات
-        save_published_news(
-            news_item['title'], 
-            news_item['source'], 
-            news_item['link'],
-            message.message_id
-        )
+        # حفظ معرف رسالة تليجرام في قاعدة البيانات (في thread حتى لا ينتظر الـ event loop القفل)
+        await asyncio.get_running_loop().run_in_executor(None, confirm_published_news,
+                                                         news_id, message.message_id)
         
-        safe_print(f"✅ تم النشر: {news_item['title'][:50]}...")
+        safe_print(f"✅ تم النشر: {news_item.title[:50]}...")
         return message.message_id
         
+    except RetryAfter as e:
+        safe_print(f"⏳ Flood control: انتظر {e.retry_after} ثانية قبل إعادة المحاولة...")
+        raise
     except TelegramError as e:
         error_msg = str(e).lower()
-        if ("not a member" in error_msg or "forbidden" in error_msg) and not channel_error_shown:
-            safe_print(f"\n⚠️ تحذير: البوت ليس عضو في القناة. أضف @News2027bot كمدير في القناة @ArabNewsAi")
-        elif "not a member" not in error_msg and "forbidden" not in error_msg:
+        
+        # إذا كان الخطأ متعلقاً بعدم وجود البوت في القناة
+        if "not a member" in error_msg or "forbidden" in error_msg or "chat not found" in error_msg:
+            if not channel_error_shown:
+                safe_print(f"\n{'='*60}")
+                safe_print(f"⚠️ تحذير: البوت ليس عضو في القناة!")
+                safe_print(f"{'='*60}")
+                safe_print(f"📋 الخطوات المطلوبة:")
+                safe_print(f"   1) افتح قناة @ArabNewsAi في تليجرام")
+                safe_print(f"   2) اضغط على Settings (الإعدادات)")
+                safe_print(f"   3) اختر Administrators (المدراء)")
+                safe_print(f"   4) اضغط Add Administrator (إضافة مدير)")
+                safe_print(f"   5) ابحث عن @News2027bot وأضفه")
+                safe_print(f"   6) فعّل صلاحية 'Post Messages' (مهم جداً!)")
+                safe_print(f"   7) احفظ التغييرات")
+                safe_print(f"{'='*60}\n")
+        else:
             safe_print(f"❌ خطأ في إرسال الرسالة: {e}")
         return None
     except Exception as e:
@@ -452,216 +736,430 @@ async def post_to_telegram_async(bot, news_item, channel_error_shown=False):
         return None
 
 
-async def check_and_post_news_async():
-    """المهمة الرئيسية: جلب ونشر الأخبار (غير متزامن)"""
+async def check_and_post_news_async(bot=None, on_progress=None, force=False):
+    """
+    المهمة الرئيسية: جلب ونشر الأخبار (غير متزامن)
+
+    bot: البوت المشترك من Application (بنفس اتصال HTTP)، وإذا لم يُمرر يُنشأ بوت مؤقت
+    on_progress: دالة اختيارية تُستدعى بقاموس التقدم (news, posted, skipped) بعد كل خبر
+    force: فحص كل المصادر الآن بدلاً من المصادر التي حان موعدها فقط
+    """
+    if bot is None:
+        async with Bot(token=BOT_TOKEN, **_bot_kwargs()) as temporary_bot:
+            return await check_and_post_news_async(temporary_bot, on_progress, force)
+    
+    cycle_started = time.perf_counter()
     safe_print(f"\n{'='*50}")
     safe_print(f"⏰ {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - بدء جلب الأخبار...")
     safe_print(f"{'='*50}")
     
-    # إنشاء البوت
-    bot = Bot(token=BOT_TOKEN)
+    # إزالة المفاتيح المنتهية من كاش منع التكرار
+    dedup.prune_cache(NEWS_COOLDOWN_HOURS)
+    near_dup.index.prune()
+    if SHARD.sharded:
+        # ما نشرته عمليات worker الأخرى منذ الدورة السابقة (لكشف الأخبار المتشابهة)
+        near_dup.refresh_index()
     
-    # جلب الأخبار
-    news_items = fetch_latest_news()
+    # نشر كل الأخبار الجديدة (بدون حد)، كل خبر فور وصول مصدره
+    stats = {
+        'news': 0,
+        'posted': 0,
+        'skipped': 0,
+        'channel_error_shown': False  # لتتبع ما إذا تم عرض تحذير القناة
+    }
     
-    if not news_items:
-        safe_print("📭 لا توجد أخبار جديدة")
-        return
+    async def send(news):
+        return await post_to_telegram_async(bot, news, stats['channel_error_shown'])
     
-    # نشر كل الأخبار الجديدة (بدون حد)
-    posted_count = 0
-    skipped_count = 0
-    channel_error_shown = False  # لتتبع ما إذا تم عرض تحذير القناة
+    loop = asyncio.get_running_loop()
     
-    safe_print(f"📊 جاهز لنشر {len(news_items)} خبر...")
+    async def on_result(news, message_id):
+        if message_id:
+            stats['posted'] += 1
+        else:
+            stats['skipped'] += 1
+            stats['channel_error_shown'] = True
+            # فشل الإرسال: إلغاء حجز الخبر ليُعاد في الفحص القادم
+            await loop.run_in_executor(None, release_news, news)
+        if on_progress is not None:
+            await loop.run_in_executor(None, on_progress,
+                                       {key: stats[key] for key in ('news', 'posted', 'skipped')})
     
-    for news in news_items:
-        success = await post_to_telegram_async(bot, news, channel_error_shown)
-        if success:
-            posted_count += 1
-            await asyncio.sleep(3)  # انتظر 3 ثوان بين كل خبر لتجنب Flood control
-        elif success is None:
-            skipped_count += 1
-            if not channel_error_shown:
-                # تم عرض تحذير القناة
-                channel_error_shown = True
+    # طابور النشر يرسل بأقصى معدل مسموح بدلاً من انتظار ثابت بين الرسائل
+    publisher = Publisher(send, CHANNEL_ID, on_result=on_result, log=safe_print)
+    publisher.start()
+    try:
+        async for news in fetch_latest_news(force):
+            stats['news'] += 1
+            await publisher.submit(news)
+    finally:
+        # عند الإيقاف لا ننتظر تفريغ الطابور كاملاً (قد يستغرق دقائق بحدود المعدل)
+        unsent = await publisher.close(PUBLISH_DRAIN_TIMEOUT_SECONDS if _stopping else None)
+        if unsent:
+            safe_print(f"⏹️ لم يُرسل {len(unsent)} خبر قبل الإيقاف، تُعاد في التشغيل القادم")
+            for news in unsent:
+                await loop.run_in_executor(None, release_news, news)
+        cycle_seconds = time.perf_counter() - cycle_started
+        metrics.NEWS_CYCLE_SECONDS.observe(cycle_seconds)
+        metrics.NEWS_POSTED.inc(stats['posted'])
+        metrics.log_event('news_cycle', seconds=round(cycle_seconds, 3), force=force,
+                          news=stats['news'], posted=stats['posted'], skipped=stats['skipped'],
+                          flood_waits=publisher.flood_waits)
     
-    # تنظيف الأخبار القديمة
-    cleanup_old_news()
+    if stats['news'] == 0:
+        safe_print("📭 لا توجد أخبار جديدة")
+        return
     
-    if posted_count == 0 and channel_error_shown:
+    if stats['posted'] == 0 and stats['channel_error_shown']:
         safe_print(f"\n⚠️ لم يتم نشر أي أخبار - تأكد من إضافة البوت كمدير في القناة")
     else:
-        safe_print(f"\n🎯 تم نشر {posted_count} خبر جديد")
-        if skipped_count > 0:
-            safe_print(f"⏭️ تم تخطي {skipped_count} خبر (منشور مسبقاً)")
-    safe_print(f"⏰ الفحص القادم بعد {INTERVAL} دقيقة")
+        safe_print(f"\n🎯 تم نشر {stats['posted']} خبر جديد")
+        if stats['skipped'] > 0:
+            safe_print(f"⏭️ لم يتم نشر {stats['skipped']} خبر بسبب أخطاء الإرسال")
+        if publisher.flood_waits > 0:
+            safe_print(f"⏳ انتظار Flood control: {publisher.flood_waits} مرة")
 
 
 def check_and_post_news():
-    """غلاف متزامن للدالة غير المتزامنة"""
-    asyncio.run(check_and_post_news_async())
+    """غلاف متزامن للدالة غير المتزامنة (لتشغيل دورة واحدة لكل المصادر خارج البوت)"""
+    errors = load_settings()
+    if errors:
+        raise RuntimeError(errors[0])
+    asyncio.run(check_and_post_news_async(force=True))
 
 
-def get_reaction_counts(message_id):
-    """جلب عدد التفاعلات لكل رسالة"""
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        
-        # عدد الإعجابات
-        likes = c.execute("SELECT COUNT(*) FROM reactions WHERE message_id = ? AND reaction_type = 'like'", 
-                         (message_id,)).fetchone()[0]
-        
-        # عدد النجوم
-        stars = c.execute("SELECT COUNT(*) FROM reactions WHERE message_id = ? AND reaction_type = 'star'", 
-                         (message_id,)).fetchone()[0]
-        
-        conn.close()
-        return likes, stars
-    except:
-        return 0, 0
+async def run_news_cycle(bot, job_id=None):
+    """
+    تشغيل دورة واحدة، مع ضمان عدم تداخل الدورات
 
+    job_id: معرف المهمة في جدول jobs إذا كانت الدورة بطلب من لوحة التحكم (لحفظ التقدم والنتيجة)
+    """
+    on_progress = None
+    if job_id is not None:
+        def on_progress(progress):
+            jobs.update_progress(job_id, progress)
+    
+    async with _cycle_lock:
+        try:
+            # طلبات لوحة التحكم تفحص كل المصادر، والدورات الدورية المصادر التي حان موعدها
+            await check_and_post_news_async(bot, on_progress, force=job_id is not None)
+        except Exception as e:
+            safe_print(f"❌ خطأ في دورة جلب الأخبار: {e}")
+            if job_id is not None:
+                jobs.finish(job_id, error=e)
+            return
+    if job_id is not None:
+        jobs.finish(job_id)
 
-def save_reaction(message_id, user_id, reaction_type):
-    """حفظ تفاعل المستخدم"""
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        
-        # حذف التفاعل السابق للمستخدم على هذه الرسالة (إذا كان)
-        c.execute("DELETE FROM reactions WHERE message_id = ? AND user_id = ?", 
-                 (message_id, user_id))
-        
-        # إضافة التفاعل الجديد
-        c.execute("INSERT INTO reactions (message_id, user_id, reaction_type) VALUES (?, ?, ?)",
-                 (message_id, user_id, reaction_type))
-        
-        conn.commit()
-        conn.close()
-        return True
-    except Exception as e:
-        safe_print(f"Error saving reaction: {e}")
-        return False
 
+async def news_job(bot):
+    """
+    المهمة الدورية: فحص المصادر التي حان موعدها
 
-async def handle_reaction(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """معالجة تفاعلات المستخدمين"""
-    query = update.callback_query
-    await query.answer()
-    
-    user_id = query.from_user.id
-    message_id = query.message.message_id
-    data = query.data
+    كل مصدر له موعده الخاص (INTERVAL معدّلة حسب نشاطه وصحته)، لذلك تعمل الدورة
+    كل FEED_MIN_POLL_MINUTES وتجلب المصادر المستحقة فقط. إذا طالت دورة
+    تبدأ التالية بعد انتهائها مباشرة (لا تتداخل دورتان أبداً)
+    """
+    tick = min(INTERVAL, FEED_MIN_POLL_MINUTES) * 60
+    async with _cycle_lock:
+        # الكاشات تُبنى بعد بدء استقبال التفاعلات، وقبل أي دورة (دورية أو بطلب من اللوحة)
+        await asyncio.get_running_loop().run_in_executor(None, warm_caches)
+    metrics.readiness.mark('caches')
     
-    # استخراج message_id من callback_data
-    try:
-        if data.startswith("like_"):
-            msg_id = int(data.split("_")[1])
-            reaction_type = "like"
-        elif data.startswith("star_"):
-            msg_id = int(data.split("_")[1])
-            reaction_type = "star"
-        else:
-            return
-        
-        # حفظ التفاعل
-        save_reaction(msg_id, user_id, reaction_type)
-        
-        # جلب عدد التفاعلات المحدث
-        likes, stars = get_reaction_counts(msg_id)
-        
-        # تحديث الأزرار بالأرقام المحدثة
-        keyboard = [
-            [
-                InlineKeyboardButton(f"👍 إعجاب ({likes})", callback_data=f"like_{msg_id}"),
-                InlineKeyboardButton(f"⭐ نجوم ({stars})", callback_data=f"star_{msg_id}")
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        # تحديث الرسالة
+    first_cycle = True
+    while True:
+        started = time.monotonic()
+        await run_news_cycle(bot)
+        if first_cycle:
+            first_cycle = False
+            metrics.readiness.mark('first_cycle')
+        await asyncio.sleep(max(0.0, tick - (time.monotonic() - started)))
+
+
+async def job_queue_job(bot):
+    """المهمة الدورية: تنفيذ طلبات "تحديث الآن" من لوحة التحكم (مهمة واحدة في كل مرة، في القائد فقط)"""
+    while True:
+        if not _leader.held:
+            await asyncio.sleep(JOB_POLL_SECONDS)
+            continue
         try:
-            await query.edit_message_reply_markup(reply_markup=reply_markup)
-        except:
-            pass  # تجاهل الأخطاء في التحديث
-    except Exception as e:
-        safe_print(f"Error handling reaction: {e}")
+            job_id = jobs.claim_next(jobs.NEWS_CYCLE)
+        except Exception as e:
+            safe_print(f"⚠️ خطأ في قراءة طابور المهام: {e}")
+            job_id = None
+        if job_id is not None:
+            safe_print(f"\n🛎️ تنفيذ طلب تحديث من لوحة التحكم (مهمة #{job_id})")
+            await run_news_cycle(bot, job_id)
+            continue
+        await asyncio.sleep(JOB_POLL_SECONDS)
 
 
-async def test_bot_connection():
-    """اختبار اتصال البوت"""
-    try:
-        bot = Bot(token=BOT_TOKEN)
-        me = await bot.get_me()
-        safe_print(f"✅ تم الاتصال بالبوت: @{me.username}")
-        return True
-    except Exception as e:
-        safe_print(f"❌ فشل الاتصال بالبوت: {e}")
-        return False
+async def reaction_flush_job():
+    """المهمة الدورية: حفظ التفاعلات المعلقة في قاعدة البيانات (في thread حتى لا تتوقف الضغطات)"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(REACTION_FLUSH_SECONDS)
+        await loop.run_in_executor(None, reaction_store.flush)
+
+
+def run_retention():
+    """دورة احتفاظ واحدة (تعمل في thread منفصل باتصال قاعدة بيانات خاص به)"""
+    results, maintenance = retention.run()
+    for table, (deleted, groups) in results.items():
+        if deleted:
+            safe_print(f"🗑️ {table}: تم حذف {deleted} سجل منتهي")
+        if table == 'reactions' and groups:
+            # عدادات الرسائل المحذوفة تفاعلاتها لا تبقى في الذاكرة
+            reaction_store.forget(groups)
+    if maintenance:
+        safe_print(f"🧹 صيانة قاعدة البيانات: {', '.join(maintenance)}")
 
 
-def run_scheduler():
-    """تشغيل الجدولة في thread منفصل"""
+async def retention_job():
+    """المهمة الدورية: حذف البيانات المنتهية على دفعات وصيانة قاعدة البيانات (في القائد فقط)"""
+    loop = asyncio.get_running_loop()
     while True:
-        schedule.run_pending()
-        time.sleep(30)  # فحص الجدول كل 30 ثانية
+        if not _leader.held:
+            await asyncio.sleep(_leader.ttl / 3)
+            continue
+        try:
+            await loop.run_in_executor(None, run_retention)
+        except Exception as e:
+            safe_print(f"❌ خطأ في تنظيف البيانات القديمة: {e}")
+        await asyncio.sleep(RETENTION_INTERVAL_MINUTES * 60)
+
+
+async def leader_job():
+    """
+    المهمة الدورية: أخذ عقد القيادة أو تجديده كل ثلث مدته
+
+    عملية واحدة فقط تملك العقد في أي وقت، وإذا توقفت يأخذه غيرها بعد انتهائه
+    """
+    loop = asyncio.get_running_loop()
+    was_leader = False
+    while True:
+        try:
+            is_leader = await loop.run_in_executor(None, _leader.acquire)
+        except Exception as e:
+            safe_print(f"⚠️ خطأ في تجديد عقد القيادة: {e}")
+            is_leader = False
+        if is_leader and not was_leader:
+            if SHARD.sharded:
+                safe_print(f"👑 العملية {SHARD} هي القائد (الحذف والصيانة وطلبات لوحة التحكم)")
+            # طلبات لوحة التحكم: المهام التي توقفت مع القائد السابق لن تكتمل
+            interrupted = await loop.run_in_executor(None, jobs.fail_interrupted, jobs.NEWS_CYCLE)
+            if interrupted:
+                safe_print(f"⚠️ تم إلغاء {interrupted} مهمة توقفت مع التشغيل السابق")
+        elif was_leader and not is_leader:
+            safe_print(f"⚠️ العملية {SHARD} فقدت عقد القيادة")
+        was_leader = is_leader
+        await asyncio.sleep(_leader.ttl / 3)
+
+
+def warm_caches():
+    """تعبئة كاش منع التكرار وفهرس الأخبار المتشابهة وعدادات التفاعلات من قاعدة البيانات"""
+    # حجوزات تشغيل سابق توقف قبل إرسالها: تُلغى قبل تعبئة الكاشات ليُعاد جلب أخبارها
+    released = release_stale_reservations()
+    if released:
+        safe_print(f"♻️ تم إلغاء حجز {released} خبر لم يُرسل في تشغيل سابق (يُعاد في الدورة القادمة)")
+    warmed = dedup.warm_cache(NEWS_COOLDOWN_HOURS)
+    safe_print(f"🔄 تم تحميل {warmed} خبر منشور مؤخراً في كاش منع التكرار")
+    indexed = near_dup.warm_index()
+    safe_print(f"🧩 تم فهرسة {indexed} عنوان لكشف الأخبار المتشابهة")
+    # polling يعمل قبل هذه المرحلة: لا نعيد بناء عدادات حمّلتها ضغطة وصلت أولاً
+    reaction_store.warm()
+
+
+async def wait_until_polling(application):
+    """تسجيل مرحلة الجاهزية عندما يبدأ التطبيق استقبال التحديثات (بعد post_init)"""
+    while not (application.running and application.updater and application.updater.running):
+        await asyncio.sleep(0.05)
+    metrics.readiness.mark('polling')
+    safe_print("✅ البوت جاهز لاستقبال التفاعلات (الجلب الأول يعمل في الخلفية)")
+
+
+async def post_init(application):
+    """
+    بعد تهيئة التطبيق: تشغيل المهام الدورية على نفس الـ event loop
+
+    لا شيء هنا ينتظر الشبكة أو قاعدة البيانات طويلاً، لأن polling لا يبدأ قبل انتهائها
+    (initialize نفسها تتحقق من التوكن عبر getMe)
+    """
+    global _metrics_server, _leader
+    safe_print(f"✅ تم الاتصال بالبوت: @{application.bot.username}")
+    metrics.readiness.mark('connected')
+    
+    # نشر أول مجموعة أخبار عند التشغيل ثم كل INTERVAL دقيقة (بنفس البوت واتصال HTTP)
+    safe_print("\n📰 جلب الأخبار الأولى في الخلفية...")
+    if application.updater is not None:
+        # في وضع webhook تُسجل الجاهزية بعد setWebhook
+        _background_tasks.append(asyncio.create_task(wait_until_polling(application)))
+    _background_tasks.append(asyncio.create_task(news_job(application.bot)))
+    _background_tasks.append(asyncio.create_task(reaction_flush_job()))
+    
+    # المهام المفردة (الحذف والصيانة وطلبات لوحة التحكم) تعمل فقط في العملية التي تملك عقد القيادة
+    _leader = cluster.Lease('leader', cluster.worker_id(SHARD))
+    _background_tasks.append(asyncio.create_task(leader_job()))
+    _background_tasks.append(asyncio.create_task(retention_job()))
+    _background_tasks.append(asyncio.create_task(job_queue_job(application.bot)))
+    
+    # تحليل RSS في عمليات منفصلة (تبدأ فعلاً عند أول تحليل)
+    processes = feed_fetcher.start_parse_pool(PARSE_PROCESSES)
+    if processes:
+        safe_print(f"🧮 تحليل RSS في {processes} عملية منفصلة")
+    
+    # مقاييس الأداء بصيغة Prometheus على منفذ محلي
+    if METRICS_PORT:
+        # كل عملية worker على منفذ خاص بها (عدة عمليات على نفس الجهاز)
+        port = METRICS_PORT + SHARD.index
+        try:
+            _metrics_server = await metrics.start_server(METRICS_HOST, port)
+            safe_print(f"📈 المقاييس: http://{METRICS_HOST}:{port}/metrics")
+        except OSError as e:
+            safe_print(f"⚠️ تعذر تشغيل خادم المقاييس على المنفذ {port}: {e}")
+
+
+async def post_stop(application):
+    """عند الإيقاف: إلغاء المهام الدورية وحفظ التفاعلات المعلقة"""
+    global _metrics_server, _stopping
+    _stopping = True
+    for task in _background_tasks:
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    _background_tasks.clear()
+    reaction_store.flush()
+    feed_fetcher.shutdown_parse_pool()
+    if _leader is not None and _leader.held:
+        # ترك القيادة فوراً بدلاً من انتظار انتهاء العقد
+        _leader.release()
+    
+    if _metrics_server is not None:
+        _metrics_server.close()
+        await _metrics_server.wait_closed()
+        _metrics_server = None
+
+
+def run_profile(output_dir=None):
+    """تشغيل دورة واحدة لكل المصادر تحت القياس (cProfile وعينات المكدس و tracemalloc)"""
+    import profiler
+    
+    init_database()
+    warm_caches()
+    
+    safe_print("🔬 وضع قياس الأداء: دورة واحدة لكل المصادر (الأخبار الجديدة تُنشر فعلاً)")
+    report_dir = asyncio.run(profiler.profile_cycle(
+        lambda: check_and_post_news_async(force=True), output_dir
+    ))
+    safe_print(f"\n📄 التقرير: {os.path.join(report_dir, 'report.txt')}")
+    safe_print(f"🔥 المكدسات (flamegraph.pl / speedscope): {os.path.join(report_dir, 'stacks.folded')}")
+    safe_print(f"📊 cProfile: {os.path.join(report_dir, 'cycle.prof')}")
 
 
 def main():
     """الدالة الرئيسية"""
+    metrics.readiness.reset()
+    if sys.platform == 'win32':
+        try:
+            # إصلاح مشكلة الترميز في Windows (UTF-8 للـ stdout)
+            sys.stdout.reconfigure(encoding='utf-8')
+        except Exception:
+            pass
+    
+    errors = load_settings()
+    if errors:
+        for error in errors:
+            safe_print(f"❌ خطأ: {error}")
+        sys.exit(1)
+    
+    parser = argparse.ArgumentParser(description="بوت نشر الأخبار الآلي على تليجرام")
+    parser.add_argument('--profile', nargs='?', const='', metavar='DIR',
+                        default=os.getenv('NEWS_BOT_PROFILE'),
+                        help="تشغيل دورة واحدة تحت القياس وكتابة التقرير (أو NEWS_BOT_PROFILE=1)")
+    parser.add_argument('--shard', metavar='INDEX/COUNT',
+                        help="نصيب هذه العملية من المصادر عند تشغيل عدة عمليات (مثلاً 0/3)")
+    args = parser.parse_args()
+    if args.shard:
+        global SHARD
+        try:
+            SHARD = cluster.Shard.parse(args.shard)
+        except ValueError as e:
+            safe_print(f"❌ خطأ: --shard {args.shard}: {e}")
+            sys.exit(1)
+    if args.profile is not None and args.profile not in ('0', 'false'):
+        # NEWS_BOT_PROFILE=1 يعني المجلد الافتراضي، وأي قيمة أخرى مسار المجلد
+        run_profile(None if args.profile in ('', '1', 'true') else args.profile)
+        return
+    
     safe_print("=" * 60)
     safe_print("🚀 بوت نشر الأخبار الآلي على تليجرام")
     safe_print("=" * 60)
     safe_print(f"📡 المصادر المفعلة: {len(RSS_FEEDS)}")
     for name in RSS_FEEDS.keys():
         safe_print(f"   • {name}")
-    safe_print(f"⏱️  الفحص كل: {INTERVAL} دقيقة")
+    safe_print(f"⏱️  الفحص كل: {INTERVAL} دقيقة (يتكيف حسب نشاط وصحة كل مصدر)")
     if MAX_POSTS_PER_CHECK >= 999:
         safe_print(f"📊 وضع النشر: كل الأخبار الجديدة (بدون حد)")
     else:
         safe_print(f"📊 الحد الأقصى للنشر: {MAX_POSTS_PER_CHECK} أخبار في كل مرة")
     safe_print(f"🔄 عدم تكرار الخبر قبل: {NEWS_COOLDOWN_HOURS} ساعة/ساعات")
+    if SHARD.sharded:
+        safe_print(f"🧩 العملية {SHARD}: نصيبها من المصادر فقط، وحدود النشر مقسومة على {SHARD.count}")
+    # تليجرام يسمح بمستقبل تحديثات واحد لكل بوت (polling أو webhook): العملية الأولى فقط
+    receives_updates = SHARD.index == 0
+    safe_print(f"📥 استقبال التفاعلات: {UPDATE_MODE if receives_updates else 'في العملية 0'}")
     safe_print("=" * 60)
+    set_rate_share(1 / SHARD.count)
     
-    # اختبار الاتصال
-    safe_print("\n🔌 اختبار الاتصال بتليجرام...")
-    if not asyncio.run(test_bot_connection()):
-        safe_print("❌ فشل الاتصال. تحقق من التوكن وحاول مرة أخرى.")
-        sys.exit(1)
-    
-    # تهيئة قاعدة البيانات
+    # تهيئة قاعدة البيانات (الكاشات تُبنى في الخلفية بعد بدء استقبال التفاعلات)
     init_database()
+    metrics.readiness.mark('database')
+    
+    # telegram.ext يُستورد هنا فقط (لا يحتاجه من يستورد الوحدة لتشغيل دورة أو للقياس)
+    from telegram import Update
+    from telegram.error import InvalidToken
+    from telegram.ext import Application, CallbackQueryHandler
     
-    # إنشاء Application لمعالجة التفاعلات
-    application = Application.builder().token(BOT_TOKEN).build()
+    # إنشاء Application: التفاعلات والمهام الدورية كلها على event loop واحد،
+    # والضغطات تُعالج بالتوازي (بترتيب الوصول داخل الرسالة الواحدة)
+    builder = (Application.builder().token(BOT_TOKEN).post_init(post_init).post_stop(post_stop)
+               .concurrent_updates(UPDATE_CONCURRENCY))
+    if API_BASE_URL:
+        builder = builder.base_url(API_BASE_URL)
+    import webhook_server
+    if not receives_updates:
+        builder = builder.updater(None)
+        metrics.readiness.required = 'worker'
+    elif UPDATE_MODE == 'webhook':
+        builder = webhook_server.configure_builder(builder)
+        metrics.readiness.required = 'webhook'
+    application = builder.build()
     
     # إضافة handler للتفاعلات
     application.add_handler(CallbackQueryHandler(handle_reaction))
     
-    # نشر أول مجموعة أخبار عند التشغيل
-    safe_print("\n📰 جلب الأخبار الأولى...")
-    check_and_post_news()
-    
-    # جدولة المهام
-    schedule.every(INTERVAL).minutes.do(check_and_post_news)
-    
-    # تشغيل الجدولة في thread منفصل
-    import threading
-    scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
-    scheduler_thread.start()
-    
     safe_print("\n" + "=" * 60)
     safe_print("✅ البوت يعمل الآن مع معالج التفاعلات...")
     safe_print("   اضغط Ctrl+C للإيقاف")
     safe_print("=" * 60 + "\n")
     
-    # تشغيل معالج التفاعلات (polling)
+    # تشغيل معالج التفاعلات (polling أو webhook) مع المهام الدورية
     try:
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
-    except KeyboardInterrupt:
-        safe_print("\n\n🛑 تم إيقاف البوت بنجاح")
-        safe_print("👋 إلى اللقاء!")
+        if not receives_updates:
+            webhook_server.run_application(application, 'worker')
+        elif UPDATE_MODE == 'webhook':
+            webhook_server.run_webhook(application, webhook_server.webhook_url(WEBHOOK_URL),
+                                       WEBHOOK_SECRET, port=WEBHOOK_LISTEN_PORT,
+                                       allowed_updates=Update.ALL_TYPES)
+        else:
+            application.run_polling(allowed_updates=Update.ALL_TYPES)
+    except InvalidToken as e:
+        safe_print(f"❌ فشل الاتصال بالبوت: {e}. تحقق من التوكن وحاول مرة أخرى.")
+        sys.exit(1)
+    except RuntimeError as e:
+        safe_print(f"❌ {e}")
+        sys.exit(1)
+    safe_print("\n\n🛑 تم إيقاف البوت بنجاح")
+    safe_print("👋 إلى اللقاء!")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+وضع قياس الأداء لدورة واحدة
+Single-Cycle Profiling Mode
+
+يشغل دورة جلب ونشر واحدة مع:
+- cProfile على الـ event loop (ملف cycle.prof يُفتح بـ pstats أو snakeviz)
+- عينات دورية من مكدسات كل الـ threads عبر sys._current_frames (تشمل تحليل feedparser
+  في threads الجلب التي لا يراها cProfile)، تُكتب في stacks.folded بصيغة flamegraph.pl / speedscope
+- tracemalloc لأكبر مواضع حجز الذاكرة وذروتها
+- أزمنة كل مرحلة من فرق مقاييس metrics قبل الدورة وبعدها
+والتقرير النصي report.txt يلخص أين ذهب زمن الدورة
+"""
+
+import io
+import os
+import sys
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+import metrics
+from config import PROFILE_DIR, PROFILE_SAMPLE_INTERVAL_MS, PROFILE_TRACEMALLOC_FRAMES
+
+# تصنيف العينة حسب أول إطار مطابق من قمة المكدس نزولاً (الزمن الذاتي لكل مرحلة)
+STAGES = (
+    ('sanitize', ('sanitizer.py',)),
+    ('sqlite', ('db.py', 'sqlite3')),
+    ('feedparser', ('feedparser',)),
+    ('feed_download', ('requests', 'urllib3', 'http/client.py', 'ssl.py')),
+    ('telegram', ('telegram', 'httpx', 'httpcore', 'anyio')),
+    ('event_loop_wait', ('selectors.py',)),
+)
+
+# إطارات الانتظار: thread في هذه الحالة خامل ولا يُحسب
+# (select خامل في كل الـ threads إلا thread الـ event loop حيث يعني انتظار الشبكة)
+_IDLE_LEAVES = {
+    ('selectors.py', 'select'),
+    ('threading.py', 'wait'),
+    ('queue.py', 'get'),
+    ('thread.py', '_worker'),
+}
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class StackSampler:
+    """خيط يأخذ عينة من مكدس كل thread كل interval ثانية (ملف تعريف بزمن الساعة)"""
+
+    def __init__(self, interval, loop_thread_id=None):
+        self.interval = interval
+        self.loop_thread_id = loop_thread_id or threading.get_ident()
+        self.stacks = Counter()  # "thread;frame;frame..." -> عدد العينات
+        self.stages = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                self._record(names.get(thread_id, str(thread_id)), frame,
+                             thread_id == self.loop_thread_id)
+            self.samples += 1
+
+    def _record(self, thread_name, leaf, is_loop_thread):
+        code = leaf.f_code
+        leaf_key = (os.path.basename(code.co_filename), code.co_name)
+        if leaf_key in _IDLE_LEAVES and not (is_loop_thread and leaf_key[1] == 'select'):
+            return
+
+        frames = []
+        stage = 'other'
+        frame = leaf
+        while frame is not None:
+            if stage == 'other':
+                filename = frame.f_code.co_filename
+                for name, patterns in STAGES:
+                    if any(pattern in filename for pattern in patterns):
+                        stage = name
+                        break
+            frames.append(_frame_label(frame))
+            frame = frame.f_back
+        frames.append(thread_name)
+        self.stacks[';'.join(reversed(frames))] += 1
+        self.stages[stage] += 1
+
+
+def _histogram_deltas(before, after):
+    """الفرق (عدد، مجموع) لكل مدرج بين لقطتين من metrics.snapshot()"""
+    deltas = {}
+    for name, children in after.items():
+        if not name.endswith('_seconds'):
+            continue
+        for labels, values in children.items():
+            previous = before.get(name, {}).get(labels, {'count': 0, 'sum': 0.0})
+            count = values['count'] - previous['count']
+            if count:
+                deltas[(name, labels)] = (count, values['sum'] - previous['sum'])
+    return deltas
+
+
+def _format_report(elapsed, sampler, interval, deltas, stats_text, memory, peak):
+    lines = [
+        f"دورة واحدة: {elapsed:.2f} ثانية (القياس نفسه يبطئ الدورة، قارن النسب وليس الأزمنة المطلقة)",
+        f"عينات المكدس: {sampler.samples} (كل {interval * 1000:.0f} ملي ثانية)",
+        "",
+        "== الزمن الذاتي حسب المرحلة (عينات كل الـ threads) ==",
+    ]
+    total = sum(sampler.stages.values()) or 1
+    for stage, count in sampler.stages.most_common():
+        lines.append(f"  {stage:<16} {count * interval:8.2f} ث  {count / total:6.1%}")
+
+    lines += ["", "== أزمنة المراحل من المقاييس (العدد، المجموع، المتوسط) =="]
+    fetch_by_feed = []
+    for (name, labels), (count, total_seconds) in sorted(deltas.items(), key=lambda item: -item[1][1]):
+        if name == 'newsbot_feed_fetch_seconds':
+            fetch_by_feed.append((total_seconds, labels))
+            continue
+        label = f"{name}{{{labels}}}" if labels else name
+        lines.append(f"  {label:<60} {count:6d} {total_seconds:9.3f} ث {total_seconds / count * 1000:9.2f} ms")
+    if fetch_by_feed:
+        fetch_total = sum(seconds for seconds, _ in fetch_by_feed)
+        lines.append(f"  {'newsbot_feed_fetch_seconds (كل المصادر)':<60} {len(fetch_by_feed):6d} {fetch_total:9.3f} ث")
+        lines.append("  أبطأ المصادر:")
+        for seconds, feed in sorted(fetch_by_feed, reverse=True)[:10]:
+            lines.append(f"    {feed:<40} {seconds:8.3f} ث")
+
+    lines += ["", f"== الذاكرة: الذروة {peak / 1024 / 1024:.1f} MB، أكبر مواضع الحجز =="]
+    for stat in memory:
+        frame = stat.traceback[0]
+        lines.append(f"  {stat.size / 1024:10.1f} KB {stat.count:8d}  {frame.filename}:{frame.lineno}")
+
+    lines += ["", "== cProfile (الـ event loop، مرتبة بالزمن التراكمي) ==", stats_text]
+    return '\n'.join(lines)
+
+
+async def profile_cycle(run, output_dir=None, interval=PROFILE_SAMPLE_INTERVAL_MS / 1000):
+    """
+    تشغيل run() (دالة تُرجع coroutine لدورة واحدة) تحت القياس وكتابة التقرير
+
+    يُرجع مسار المجلد الذي يحتوي report.txt و cycle.prof و stacks.folded
+    """
+    output_dir = output_dir or os.path.join(PROFILE_DIR, datetime.now().strftime('%Y%m%d-%H%M%S'))
+    os.makedirs(output_dir, exist_ok=True)
+
+    before = metrics.snapshot()
+    tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+    sampler = StackSampler(interval)
+    profile = cProfile.Profile()
+    sampler.start()
+    started = time.perf_counter()
+    profile.enable()
+    try:
+        await run()
+    finally:
+        profile.disable()
+        elapsed = time.perf_counter() - started
+        sampler.stop()
+        memory = tracemalloc.take_snapshot().statistics('lineno')[:25]
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    profile.dump_stats(os.path.join(output_dir, 'cycle.prof'))
+    stats_stream = io.StringIO()
+    pstats.Stats(profile, stream=stats_stream).sort_stats('cumulative').print_stats(40)
+
+    with open(os.path.join(output_dir, 'stacks.folded'), 'w', encoding='utf-8') as f:
+        for stack, count in sampler.stacks.most_common():
+            f.write(f"{stack} {count}\n")
+
+    report = _format_report(elapsed, sampler, interval, _histogram_deltas(before, metrics.snapshot()),
+                            stats_stream.getvalue(), memory, peak)
+    with open(os.path.join(output_dir, 'report.txt'), 'w', encoding='utf-8') as f:
+        f.write(report + '\n')
+    return output_dir
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+طابور النشر على تليجرام مع تحديد المعدل
+Telegram Publishing Queue with Token-Bucket Rate Limiting
+
+بدلاً من انتظار ثابت بين الرسائل، كل رسالة تأخذ "رمزاً" من دلو القناة
+ومن الدلو العام، فتُرسل الأخبار بأقصى معدل يسمح به تليجرام، ويُحترم
+RetryAfter مباشرة بإيقاف الدلو كله للمدة المطلوبة
+"""
+
+import time
+import asyncio
+import inspect
+
+from telegram.error import RetryAfter
+
+import metrics
+from config import (TELEGRAM_GLOBAL_RATE_PER_SECOND, TELEGRAM_CHAT_RATE_PER_MINUTE,
+                    TELEGRAM_CHAT_BURST, PUBLISH_CONCURRENCY, PUBLISH_QUEUE_SIZE,
+                    PUBLISH_MAX_RETRIES)
+
+
+class TokenBucket:
+    """دلو رموز غير متزامن: rate رمز في الثانية وسعة capacity"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = None
+        self._loop = None
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def pause(self, seconds):
+        """إيقاف الدلو لمدة معينة (عند RetryAfter) وتفريغه"""
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + seconds)
+        self._tokens = 0
+        self._updated = max(self._updated, self._paused_until)
+
+    async def acquire(self):
+        """انتظار رمز واحد (الطلبات تُخدم بالترتيب)"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # القفل مرتبط بالـ event loop الذي أُنشئ فيه
+            self._loop, self._lock = loop, asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+# الدلو العام مشترك بين كل القنوات داخل العملية
+global_bucket = TokenBucket(TELEGRAM_GLOBAL_RATE_PER_SECOND, TELEGRAM_GLOBAL_RATE_PER_SECOND)
+_chat_buckets = {}
+# نصيب هذه العملية من حدود البوت (عدة عمليات worker تنشر بنفس التوكن وفي نفس القناة)
+_rate_share = 1.0
+
+
+def get_chat_bucket(chat_id):
+    """دلو خاص بكل قناة/محادثة"""
+    bucket = _chat_buckets.get(chat_id)
+    if bucket is None:
+        bucket = _chat_buckets[chat_id] = TokenBucket(
+            TELEGRAM_CHAT_RATE_PER_MINUTE / 60 * _rate_share, TELEGRAM_CHAT_BURST
+        )
+    return bucket
+
+
+def set_rate_share(share):
+    """تقسيم حدود المعدل بين عمليات worker (share = 1 / عدد العمليات)"""
+    global _rate_share
+    _rate_share = share
+    global_bucket.rate = TELEGRAM_GLOBAL_RATE_PER_SECOND * share
+    for bucket in _chat_buckets.values():
+        bucket.rate = TELEGRAM_CHAT_RATE_PER_MINUTE / 60 * share
+
+
+class Publisher:
+    """
+    طابور نشر بعدة عمال
+
+    send: دالة غير متزامنة تأخذ العنصر وترسله مرة واحدة (وقد ترفع RetryAfter)
+    on_result: دالة اختيارية (عادية أو غير متزامنة) تُستدعى بـ (العنصر، النتيجة) بعد كل إرسال
+    log: دالة طباعة أخطاء العمال (البوت يمرر safe_print حتى لا تتوقف الطباعة في Windows)
+    """
+
+    def __init__(self, send, chat_id, on_result=None, concurrency=PUBLISH_CONCURRENCY,
+                 queue_size=PUBLISH_QUEUE_SIZE, max_retries=PUBLISH_MAX_RETRIES, log=print):
+        self.send = send
+        self.on_result = on_result
+        self.log = log
+        self.chat_bucket = get_chat_bucket(chat_id)
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.flood_waits = 0
+        self._workers = []
+
+    def start(self):
+        """تشغيل العمال"""
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def submit(self, item):
+        """إضافة عنصر للطابور (ينتظر إذا امتلأ الطابور)"""
+        await self.queue.put(item)
+
+    async def close(self, timeout=None):
+        """
+        انتظار إرسال ما في الطابور ثم إيقاف العمال، ويُرجع العناصر التي لم تُرسل
+
+        timeout: أقصى مدة للانتظار (عند الإيقاف)، وبعدها تُترك بقية الطابور بلا إرسال
+        """
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            for worker in self._workers:
+                worker.cancel()
+            await asyncio.gather(*self._workers, return_exceptions=True)
+            self._workers = []
+        unsent = []
+        while not self.queue.empty():
+            unsent.append(self.queue.get_nowait())
+            self.queue.task_done()
+        return unsent
+
+    async def _worker(self):
+        # أي خطأ في عنصر واحد لا يوقف العامل، وإلا توقف تفريغ الطابور وانتظر close() بلا نهاية
+        while True:
+            item = await self.queue.get()
+            try:
+                try:
+                    result = await self._send_with_retry(item)
+                except Exception as e:
+                    self.log(f"❌ خطأ غير متوقع أثناء الإرسال: {e}")
+                    result = None
+                if self.on_result is not None:
+                    try:
+                        handled = self.on_result(item, result)
+                        if inspect.isawaitable(handled):
+                            await handled
+                    except Exception as e:
+                        self.log(f"❌ خطأ في معالجة نتيجة الإرسال: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def _send_with_retry(self, item):
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            await self.chat_bucket.acquire()
+            await global_bucket.acquire()
+            metrics.RATE_LIMIT_WAIT_SECONDS.observe(time.perf_counter() - started)
+            try:
+                return await self.send(item)
+            except RetryAfter as e:
+                # تليجرام يحدد مدة الانتظار بدقة: نوقف الدلو كله (كل العمال) لهذه المدة
+                self.flood_waits += 1
+                retry_after = float(e.retry_after) + 1
+                metrics.FLOOD_WAITS.labels('publisher').inc()
+                metrics.FLOOD_WAIT_SECONDS.labels('publisher').inc(retry_after)
+                self.chat_bucket.pause(retry_after)
+                if attempt == self.max_retries:
+                    break
+        return None
@@ -2,125 +2,436 @@
 """
 معالج التفاعلات (الإعجابات والنجوم)
 Reaction Handler for Telegram Bot
+
+الضغطات تُعالج بالتوازي (UPDATE_CONCURRENCY) عبر الرسائل المختلفة، وبترتيب
+وصولها داخل الرسالة الواحدة (قفل لكل رسالة)، وعمل SQLite يتم في thread منفصل
 """
 
 import os
-import sqlite3
+import time
+import atexit
 import asyncio
+import threading
+import contextlib
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CallbackQueryHandler, ContextTypes
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+from config import REACTION_FLUSH_SECONDS, REACTION_FLUSH_BATCH, REACTION_EDIT_WINDOW_SECONDS
+from config import UPDATE_MODE, UPDATE_CONCURRENCY, WEBHOOK_PORT
+from db import get_connection, transaction
+import metrics
+
+
+REACTION_TYPES = ('like', 'star')
+
+
+class ReactionStore:
+    """
+    عدادات التفاعلات في الذاكرة مع حفظ مؤجل على دفعات (write-behind)
+
+    الأعداد تُبنى عند التشغيل باستعلام تجميعي واحد، وكل ضغطة تعدّل العداد
+    مباشرة (O(1)) بدون COUNT، والتغييرات تُحفظ في قاعدة البيانات على دفعات
+    """
+
+    def __init__(self, flush_seconds=REACTION_FLUSH_SECONDS, flush_batch=REACTION_FLUSH_BATCH):
+        self.flush_seconds = flush_seconds
+        self.flush_batch = flush_batch
+        self._counts = {}  # message_id -> {'like': n, 'star': n}
+        self._users = {}  # message_id -> {user_id: reaction_type} (يُحمّل عند أول ضغطة على الرسالة)
+        self._pending = {}  # (message_id, user_id) -> (reaction_type, news_id)
+        self._lock = threading.RLock()
+        # دفعة حفظ واحدة في كل مرة، من أخذ الدفعة حتى كتابتها (يُؤخذ قبل self._lock دائماً)
+        self._flush_lock = threading.Lock()
+        self._loaded = False
+        self._last_flush = time.monotonic()
+
+    def load(self):
+        """
+        بناء العدادات من جدول التفاعلات باستعلام تجميعي واحد
+
+        التفاعلات المعلقة تُحفظ أولاً حتى لا يمحوها البناء من جديد، وإذا تعذر حفظها
+        تبقى العدادات الحالية كما هي (فهي تشمل تلك التفاعلات)
+        """
+        with self._flush_lock, self._lock:
+            if self._pending and not self._flush_locked():
+                return len(self._counts)
+            return self._rebuild()
+
+    def _rebuild(self):
+        with self._lock:
+            rows = get_connection().execute(
+                """SELECT message_id, reaction_type, COUNT(*) FROM reactions
+                   GROUP BY message_id, reaction_type"""
+            ).fetchall()
+            self._counts = {}
+            for message_id, reaction_type, count in rows:
+                self._counts.setdefault(message_id, dict.fromkeys(REACTION_TYPES, 0))[reaction_type] = count
+            self._users = {}
+            self._loaded = True
+        return len(rows)
+
+    def _ensure_loaded(self):
+        # قبل أول تحميل لا توجد تفاعلات معلقة (record يحمّل أولاً)، فلا حاجة لحفظها
+        if not self._loaded:
+            self._rebuild()
+
+    def warm(self):
+        """تحميل العدادات إذا لم تُحمّل بعد (أول ضغطة قد تسبق تهيئة الكاش عند التشغيل)"""
+        with self._lock:
+            self._ensure_loaded()
+
+    def _message_users(self, message_id):
+        """تفاعلات المستخدمين على رسالة (استعلام واحد لكل رسالة طوال عمر العملية)"""
+        users = self._users.get(message_id)
+        if users is None:
+            rows = get_connection().execute(
+                "SELECT user_id, reaction_type FROM reactions WHERE message_id = ?", (message_id,)
+            ).fetchall()
+            users = self._users[message_id] = {user_id: reaction_type for user_id, reaction_type in rows}
+        return users
+
+    def counts(self, message_id):
+        """إرجاع (الإعجابات، النجوم) للرسالة"""
+        with self._lock:
+            self._ensure_loaded()
+            counts = self._counts.get(message_id)
+            if counts is None:
+                return 0, 0
+            return counts['like'], counts['star']
+
+    def record(self, message_id, user_id, reaction_type, news_id=None):
+        """تسجيل تفاعل (يستبدل تفاعل المستخدم السابق على نفس الرسالة) وإرجاع الأعداد الجديدة"""
+        with self._lock:
+            self._ensure_loaded()
+            users = self._message_users(message_id)
+            counts = self._counts.setdefault(message_id, dict.fromkeys(REACTION_TYPES, 0))
+            previous = users.get(user_id)
+            if previous is not None:
+                counts[previous] -= 1
+            users[user_id] = reaction_type
+            counts[reaction_type] += 1
+            self._pending[(message_id, user_id)] = (reaction_type, news_id)
+            result = counts['like'], counts['star']
+        self.maybe_flush()
+        return result
+
+    def forget(self, message_ids):
+        """إزالة عدادات رسائل حُذفت تفاعلاتها من قاعدة البيانات (سياسة الاحتفاظ)"""
+        with self._lock:
+            for message_id in message_ids:
+                self._counts.pop(message_id, None)
+                self._users.pop(message_id, None)
+
+    def maybe_flush(self):
+        """حفظ التفاعلات المعلقة إذا كثرت أو مر وقت كافٍ منذ آخر حفظ"""
+        if (len(self._pending) >= self.flush_batch
+                or time.monotonic() - self._last_flush >= self.flush_seconds):
+            self.flush(blocking=False)
+
+    def flush(self, blocking=True):
+        """
+        حفظ كل التفاعلات المعلقة في معاملة واحدة
 
-# تحميل الإعدادات
-load_dotenv()
+        الدفعات تُحفظ بترتيب أخذها (لا تُكتب دفعة أقدم بعد أحدث منها فتعيد تفاعلاً قديماً)
+        blocking=False: لا ينتظر إذا كان حفظ آخر جارياً (الضغطات تحفظ ما تبقى لاحقاً)
+        """
+        if not self._flush_lock.acquire(blocking):
+            return 0
+        try:
+            return self._flush_locked()
+        finally:
+            self._flush_lock.release()
+
+    def _flush_locked(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+        try:
+            with transaction() as conn:
+                conn.executemany("DELETE FROM reactions WHERE message_id = ? AND user_id = ?",
+                                 list(pending))
+                conn.executemany("""INSERT INTO reactions (message_id, user_id, reaction_type, news_id)
+                                    VALUES (?, ?, ?, ?)""",
+                                 [(message_id, user_id, reaction_type, news_id)
+                                  for (message_id, user_id), (reaction_type, news_id) in pending.items()])
+        except Exception as e:
+            print(f"Error saving reactions: {e}")
+            # إعادة التفاعلات للطابور دون الكتابة فوق ما وصل بعدها
+            with self._lock:
+                for key, value in pending.items():
+                    self._pending.setdefault(key, value)
+            return 0
+        return len(pending)
 
-BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'news_bot.db')
+
+# مخزن التفاعلات المشترك داخل العملية (يُحفظ ما تبقى عند الإغلاق)
+store = ReactionStore()
+atexit.register(store.flush)
 
 
 def get_reaction_counts(message_id):
     """جلب عدد التفاعلات لكل رسالة"""
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        
-        # عدد الإعجابات
-        likes = c.execute("SELECT COUNT(*) FROM reactions WHERE message_id = ? AND reaction_type = 'like'", 
-                         (message_id,)).fetchone()[0]
-        
-        # عدد النجوم
-        stars = c.execute("SELECT COUNT(*) FROM reactions WHERE message_id = ? AND reaction_type = 'star'", 
-                         (message_id,)).fetchone()[0]
-        
-        conn.close()
-        return likes, stars
-    except:
-        return 0, 0
+    return store.counts(message_id)
 
 
-def save_reaction(message_id, user_id, reaction_type):
-    """حفظ تفاعل المستخدم"""
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        
-        # حذف التفاعل السابق للمستخدم على هذه الرسالة (إذا كان)
-        c.execute("DELETE FROM reactions WHERE message_id = ? AND user_id = ?", 
-                 (message_id, user_id))
-        
-        # إضافة التفاعل الجديد
-        c.execute("INSERT INTO reactions (message_id, user_id, reaction_type) VALUES (?, ?, ?)",
-                 (message_id, user_id, reaction_type))
-        
-        conn.commit()
-        conn.close()
-        return True
-    except Exception as e:
-        print(f"Error saving reaction: {e}")
-        return False
+def save_reaction(message_id, user_id, reaction_type, news_id=None):
+    """حفظ تفاعل المستخدم وإرجاع (الإعجابات، النجوم) بعد التحديث"""
+    return store.record(message_id, user_id, reaction_type, news_id)
+
+
+def news_post_ref(news_id):
+    """مرجع الخبر في callback_data (معرف سجل published_news مسبوقاً بـ n)"""
+    return f"n{news_id}"
+
+
+def build_reaction_keyboard(post_ref, likes=0, stars=0):
+    """أزرار التفاعل (إعجاب ونجوم) مع الأعداد الحالية"""
+    keyboard = [
+        [
+            InlineKeyboardButton(f"👍 إعجاب ({likes})", callback_data=f"like_{post_ref}"),
+            InlineKeyboardButton(f"⭐ نجوم ({stars})", callback_data=f"star_{post_ref}")
+        ]
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
 
+def resolve_post_ref(post_ref, message_id=None):
+    """
+    تحويل مرجع الزر إلى (news_id, message_id)
 
-async def handle_reaction(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    الأزرار الجديدة تحمل معرف الخبر (n123)، والأزرار القديمة تحمل معرف رسالة تليجرام.
+    message_id: معرف الرسالة الذي وصل مع الضغطة، وبدونه فقط (رسائل inline) يُحل
+    معرف الرسالة من published_news، فلا تكلف الضغطة العادية استعلاماً
+    """
+    if post_ref.startswith('n'):
+        news_id = int(post_ref[1:])
+        if message_id is not None:
+            return news_id, message_id
+        row = get_connection().execute("SELECT telegram_message_id FROM published_news WHERE id = ?",
+                                        (news_id,)).fetchone()
+        return news_id, (row[0] if row else None)
+    return None, message_id or int(post_ref)
+
+
+class KeyboardCoalescer:
+    """
+    دمج تحديثات أزرار التفاعل لكل رسالة
+
+    أول ضغطة تُحدّث الأزرار فوراً، والضغطات التالية خلال النافذة تُدمج في تعديل
+    واحد في نهايتها يحمل آخر الأعداد، فلا يتجاوز تعديل واحد لكل رسالة في كل نافذة
+    """
+
+    def __init__(self, window=REACTION_EDIT_WINDOW_SECONDS):
+        self.window = window
+        self._pending = {}  # (chat_id, message_id) -> post_ref
+        self._tasks = {}  # (chat_id, message_id) -> مهمة التحديث
+        self._last_edit = {}  # (chat_id, message_id) -> وقت آخر تعديل
+        self._shown = {}  # (chat_id, message_id) -> آخر أعداد ظاهرة على الأزرار
+        self.edits = 0
+        self.coalesced = 0
+
+    def schedule(self, bot, chat_id, message_id, post_ref):
+        """طلب تحديث أزرار الرسالة بآخر الأعداد"""
+        key = (chat_id, message_id)
+        if key in self._pending:
+            self.coalesced += 1
+        self._pending[key] = post_ref
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._run(bot, key))
+
+    async def _run(self, bot, key):
+        chat_id, message_id = key
+        try:
+            while True:
+                wait = self._last_edit.get(key, 0.0) + self.window - time.monotonic()
+                if key not in self._pending:
+                    if wait <= 0:
+                        break  # مرت نافذة كاملة بلا ضغطات جديدة
+                    await asyncio.sleep(wait)
+                    continue
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    continue
+
+                post_ref = self._pending.pop(key)
+                counts = store.counts(message_id)
+                if counts == self._shown.get(key):
+                    continue
+                self._last_edit[key] = time.monotonic()
+                result = 'ok'
+                started = time.perf_counter()
+                try:
+                    await bot.edit_message_reply_markup(
+                        chat_id=chat_id,
+                        message_id=message_id,
+                        reply_markup=build_reaction_keyboard(post_ref, *counts)
+                    )
+                    self._shown[key] = counts
+                    self.edits += 1
+                except RetryAfter as e:
+                    # إعادة المحاولة بعد المدة المطلوبة (بأحدث الأعداد وقتها)
+                    result = 'flood'
+                    self._pending.setdefault(key, post_ref)
+                    self._last_edit[key] = time.monotonic() + float(e.retry_after) - self.window
+                    metrics.FLOOD_WAITS.labels('reactions').inc()
+                    metrics.FLOOD_WAIT_SECONDS.labels('reactions').inc(float(e.retry_after))
+                except BadRequest as e:
+                    if "not modified" in str(e).lower():
+                        self._shown[key] = counts
+                    else:
+                        result = 'error'
+                        print(f"Error updating reaction buttons: {e}")
+                except TelegramError as e:
+                    result = 'error'
+                    print(f"Error updating reaction buttons: {e}")
+                metrics.TELEGRAM_SECONDS.labels('editMessageReplyMarkup', result).observe(
+                    time.perf_counter() - started)
+        finally:
+            self._tasks.pop(key, None)
+            self._last_edit.pop(key, None)
+            self._shown.pop(key, None)
+
+
+# مُجمّع تحديثات الأزرار المشترك داخل العملية
+coalescer = KeyboardCoalescer()
+
+
+class MessageLocks:
+    """
+    قفل asyncio لكل رسالة: الضغطات على نفس الرسالة تُطبق بترتيب وصولها
+    (asyncio.Lock يوقظ المنتظرين بالترتيب)، والرسائل المختلفة لا تنتظر بعضها
+
+    القفل يُحذف عندما لا ينتظره أحد، فلا تكبر الذاكرة مع عدد الرسائل
+    """
+
+    def __init__(self):
+        self._locks = {}  # مفتاح الرسالة -> [القفل، عدد المستخدمين]
+
+    @contextlib.asynccontextmanager
+    async def hold(self, key):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    def __len__(self):
+        return len(self._locks)
+
+
+message_locks = MessageLocks()
+
+
+def apply_reaction(post_ref, message_id, user_id, reaction_type):
+    """
+    حل مرجع الزر وتسجيل التفاعل (يعمل في thread: قد يقرأ أو يكتب في قاعدة البيانات)
+
+    يُرجع (news_id, message_id, الأعداد الجديدة) أو None إذا لم تُعرف الرسالة
+    """
+    news_id, message_id = resolve_post_ref(post_ref, message_id)
+    if message_id is None:
+        return None
+    return news_id, message_id, save_reaction(message_id, user_id, reaction_type, news_id)
+
+
+async def handle_reaction(update: Update, context):
     """معالجة تفاعلات المستخدمين"""
+    with metrics.Timer(metrics.REACTION_SECONDS.labels()):
+        await _handle_reaction(update, context)
+
+
+async def _handle_reaction(update, context):
     query = update.callback_query
-    await query.answer()
-    
     user_id = query.from_user.id
-    message_id = query.message.message_id
     data = query.data
     
-    # استخراج message_id من callback_data
+    # استخراج مرجع الخبر من callback_data
+    if data.startswith("like_"):
+        reaction_type = "like"
+    elif data.startswith("star_"):
+        reaction_type = "star"
+    else:
+        await query.answer()
+        return
+    post_ref = data.split("_", 1)[1]
+    
+    # معرف الرسالة الحقيقي يأتي مع الضغطة نفسها، ومرجع الزر احتياطي
+    message = query.message
+    key = (message.chat_id, message.message_id) if message is not None else post_ref
+    loop = asyncio.get_running_loop()
+    # الرد على الضغطة يبدأ فوراً (يوقف مؤشر التحميل) ولا ننتظره قبل طلب القفل
+    answering = asyncio.ensure_future(query.answer())
     try:
-        if data.startswith("like_"):
-            msg_id = int(data.split("_")[1])
-            reaction_type = "like"
-        elif data.startswith("star_"):
-            msg_id = int(data.split("_")[1])
-            reaction_type = "star"
-        else:
-            return
+        # القفل يُطلب قبل أي انتظار، فترتيب التسجيل لكل رسالة هو ترتيب الوصول
+        async with message_locks.hold(key):
+            applied = await loop.run_in_executor(
+                None, apply_reaction, post_ref, message.message_id if message is not None else None,
+                user_id, reaction_type
+            )
+            if applied is not None and message is None:
+                # رسالة بدون معرف (inline): التعديل مباشرة وداخل القفل حتى لا تتراجع الأعداد
+                await query.edit_message_reply_markup(
+                    reply_markup=build_reaction_keyboard(post_ref, *applied[2]))
         
-        # حفظ التفاعل
-        save_reaction(msg_id, user_id, reaction_type)
-        
-        # جلب عدد التفاعلات المحدث
-        likes, stars = get_reaction_counts(msg_id)
-        
-        # تحديث الأزرار بالأرقام المحدثة
-        keyboard = [
-            [
-                InlineKeyboardButton(f"👍 إعجاب ({likes})", callback_data=f"like_{msg_id}"),
-                InlineKeyboardButton(f"⭐ نجوم ({stars})", callback_data=f"star_{msg_id}")
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        # تحديث الرسالة
-        try:
-            await query.edit_message_reply_markup(reply_markup=reply_markup)
-        except:
-            pass  # تجاهل الأخطاء في التحديث
+        # تحديث الأزرار بالأرقام المحدثة (التحديثات المتتالية تُدمج في تعديل واحد)
+        if applied is not None and message is not None:
+            coalescer.schedule(context.bot, message.chat_id, applied[1], post_ref)
     except Exception as e:
         print(f"Error handling reaction: {e}")
+    await answering
 
 
 def main():
     """تشغيل معالج التفاعلات"""
-    if not BOT_TOKEN:
+    # تحميل الإعدادات (عند التشغيل فقط، وليس عند استيراد الوحدة من البوت)
+    load_dotenv()
+    bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
+    if not bot_token:
         print("❌ خطأ: يجب تعيين TELEGRAM_BOT_TOKEN في ملف .env")
         return
     
+    update_mode = os.getenv("UPDATE_MODE", UPDATE_MODE)
+    if update_mode == 'webhook' and not os.getenv("WEBHOOK_URL"):
+        print("❌ خطأ: وضع webhook يحتاج WEBHOOK_URL (الرابط العام HTTPS للخادم)")
+        return
+    
+    from telegram.ext import Application, CallbackQueryHandler
+    import webhook_server
+    
     # إنشاء التطبيق
-    application = Application.builder().token(BOT_TOKEN).build()
+    builder = Application.builder().token(bot_token).concurrent_updates(UPDATE_CONCURRENCY)
+    if os.getenv("TELEGRAM_API_URL"):
+        builder = builder.base_url(os.getenv("TELEGRAM_API_URL"))
+    if update_mode == 'webhook':
+        builder = webhook_server.configure_builder(builder)
+    application = builder.build()
     
     # إضافة handler للتفاعلات
     application.add_handler(CallbackQueryHandler(handle_reaction))
     
+    # بناء عدادات التفاعلات من قاعدة البيانات
+    store.load()
+    
     print("✅ معالج التفاعلات يعمل الآن...")
     print("   اضغط Ctrl+C للإيقاف")
     
     # تشغيل البوت
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if update_mode == 'webhook':
+        webhook_server.run_webhook(application, webhook_server.webhook_url(os.getenv("WEBHOOK_URL")),
+                                   os.getenv("WEBHOOK_SECRET"),
+                                   port=int(os.getenv("PORT") or WEBHOOK_PORT),
+                                   allowed_updates=Update.ALL_TYPES)
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 
 if __name__ == "__main__":
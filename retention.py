@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+الاحتفاظ بالبيانات وأرشفتها وصيانة قاعدة البيانات
+Retention, Archival and Database Maintenance
+
+لكل جدول سياسة احتفاظ في config.RETENTION_POLICIES (عمر الصفوف، والأرشفة قبل الحذف).
+الحذف يتم على دفعات صغيرة، كل دفعة في معاملة قصيرة مع استراحة بينها، فلا يُحبس قفل
+الكتابة عن البوت ومعالج التفاعلات ولوحة التحكم مهما كان عدد الصفوف المنتهية.
+الصفوف المنتهية تُكتب قبل حذفها في ملفات JSONL مضغوطة (gzip) لكل جدول ويوم.
+والصيانة الدورية: PRAGMA optimize و ANALYZE و incremental_vacuum وتصغير ملف WAL
+
+التشغيل اليدوي (دورة واحدة):
+    python retention.py
+"""
+
+import os
+import gzip
+import json
+import time
+from datetime import datetime, timedelta
+
+from config import (RETENTION_POLICIES, RETENTION_BATCH_SIZE, RETENTION_PAUSE_SECONDS,
+                    RETENTION_ARCHIVE_DIR, RETENTION_ANALYZE_HOURS, RETENTION_VACUUM_PAGES)
+from db import get_connection, transaction
+
+_schema_ready = False
+
+
+class RetentionPolicy:
+    """
+    سياسة جدول واحد
+
+    age_column: عمود العمر، والصف ينتهي إذا كان أقدم من days يوماً
+    where: شرط إضافي (مثلاً المهام المنتهية فقط)
+    group_by: إذا حُدد، تُحذف كل صفوف المجموعة عندما يكون أحدث صف فيها منتهياً
+              (مثل تفاعلات الرسالة الواحدة، حتى لا تبقى أعدادها ناقصة). الدفعة تبقى
+              بحد أقصى من الصفوف، والمجموعة الكبيرة تكتمل على عدة دفعات
+    """
+
+    def __init__(self, table, days, archive=False, age_column='created_at', where=None, group_by=None):
+        self.table = table
+        self.days = days
+        self.archive = archive
+        self.age_column = age_column
+        self.where = where
+        self.group_by = group_by
+
+    def _condition(self):
+        return f" AND ({self.where})" if self.where else ""
+
+    def next_chunk(self, conn, cutoff, limit):
+        """(معرفات الصفوف، المجموعات التي تكتمل بحذفها) لأقدم دفعة منتهية"""
+        if self.group_by is None:
+            ids = [row[0] for row in conn.execute(
+                f"""SELECT id FROM {self.table}
+                    WHERE {self.age_column} < ?{self._condition()}
+                    ORDER BY {self.age_column} LIMIT ?""", (cutoff, limit))]
+            return ids, []
+
+        # كل صفوف المجموعات المنتهية، مرتبة حسب المجموعة وبحد أقصى limit صف في الدفعة:
+        # المجموعة الكبيرة (رسالة عليها آلاف التفاعلات) تُحذف على عدة دفعات
+        rows = conn.execute(
+            f"""SELECT id, {self.group_by} FROM {self.table}
+                WHERE {self.group_by} IN (SELECT {self.group_by} FROM {self.table}
+                                          WHERE 1{self._condition()}
+                                          GROUP BY {self.group_by} HAVING MAX({self.age_column}) < ?)
+                ORDER BY {self.group_by} LIMIT ?""", (cutoff, limit)).fetchall()
+        if not rows:
+            return [], []
+        ids = [row[0] for row in rows]
+        groups = list(dict.fromkeys(row[1] for row in rows))
+        if len(rows) == limit:
+            # المجموعة الأخيرة قد تكون ناقصة، فلا تُعتبر محذوفة إلا إذا لم يبقَ منها شيء
+            last = groups[-1]
+            remaining = conn.execute(f"SELECT COUNT(*) FROM {self.table} WHERE {self.group_by} = ?",
+                                     (last,)).fetchone()[0]
+            if remaining > sum(1 for row in rows if row[1] == last):
+                groups.pop()
+        return ids, groups
+
+
+def load_policies(policies=RETENTION_POLICIES):
+    """سياسات الجداول من الإعدادات (الجداول بـ days = None لا تُحذف)"""
+    return [RetentionPolicy(table, **options) for table, options in policies.items()
+            if options.get('days') is not None]
+
+
+def init_retention(conn=None):
+    """جدول حالة الصيانة وفهارس أعمدة العمر (مرة واحدة لكل عملية)"""
+    global _schema_ready
+    conn = conn or get_connection()
+    with conn:
+        conn.execute('''CREATE TABLE IF NOT EXISTS maintenance_state
+                        (task TEXT PRIMARY KEY,
+                         last_run TIMESTAMP)''')
+        # أعمار الصفوف تُقرأ من الفهارس بدلاً من مسح الجداول
+        conn.execute("""CREATE INDEX IF NOT EXISTS idx_published_news_created_at
+                        ON published_news (created_at)""")
+        conn.execute("""CREATE INDEX IF NOT EXISTS idx_reactions_message_created
+                        ON reactions (message_id, created_at)""")
+        conn.execute("""CREATE INDEX IF NOT EXISTS idx_jobs_finished_at
+                        ON jobs (finished_at)""")
+    _schema_ready = True
+
+
+def _connection():
+    if not _schema_ready:
+        init_retention()
+    return get_connection()
+
+
+def _archive_rows(table, rows):
+    """إلحاق الصفوف بملف الأرشيف المضغوط لهذا الجدول واليوم"""
+    os.makedirs(RETENTION_ARCHIVE_DIR, exist_ok=True)
+    path = os.path.join(RETENTION_ARCHIVE_DIR, f"{table}-{datetime.now():%Y%m%d}.jsonl.gz")
+    # الإلحاق بملف gzip ينشئ عضواً جديداً، و gzip/zcat يقرآن الأعضاء كملف واحد
+    with gzip.open(path, 'at', encoding='utf-8') as f:
+        for row in rows:
+            f.write(json.dumps(dict(row), ensure_ascii=False, default=str) + '\n')
+    return path
+
+
+def purge(policy, now=None, batch_size=RETENTION_BATCH_SIZE, pause=RETENTION_PAUSE_SECONDS):
+    """
+    حذف الصفوف المنتهية لجدول واحد على دفعات
+
+    كل دفعة: قراءة المعرفات ← أرشفة الصفوف (إن طُلبت) ← حذفها في معاملة قصيرة.
+    إذا فشلت الأرشفة لا يُحذف شيء. يُرجع (عدد المحذوف، المجموعات المحذوفة)
+    """
+    conn = _connection()
+    # أعمدة العمر بتوقيت UTC (CURRENT_TIMESTAMP)، فالحد يُحسب بتوقيت UTC وليس بالوقت المحلي
+    cutoff = (now or datetime.utcnow()) - timedelta(days=policy.days)
+    deleted = 0
+    deleted_groups = []
+    while True:
+        ids, groups = policy.next_chunk(conn, cutoff, batch_size)
+        if not ids:
+            break
+        placeholders = ','.join('?' * len(ids))
+        if policy.archive:
+            rows = conn.execute(f"SELECT * FROM {policy.table} WHERE id IN ({placeholders})",
+                                ids).fetchall()
+            _archive_rows(policy.table, rows)
+        with transaction() as write_conn:
+            deleted += write_conn.execute(f"DELETE FROM {policy.table} WHERE id IN ({placeholders})",
+                                          ids).rowcount
+        deleted_groups.extend(groups)
+        if len(ids) < batch_size:
+            break
+        # استراحة بين الدفعات حتى يكتب غيرنا
+        time.sleep(pause)
+    return deleted, deleted_groups
+
+
+def _due(conn, task, hours, now):
+    row = conn.execute("SELECT last_run FROM maintenance_state WHERE task = ?", (task,)).fetchone()
+    return row is None or str(row[0]) < str(now - timedelta(hours=hours))
+
+
+def _mark(conn, task, now):
+    with conn:
+        conn.execute("""INSERT INTO maintenance_state (task, last_run) VALUES (?, ?)
+                        ON CONFLICT(task) DO UPDATE SET last_run = excluded.last_run""", (task, now))
+
+
+def maintain(now=None):
+    """
+    صيانة دورية بتكلفة محدودة
+
+    - PRAGMA optimize في كل دورة (يحلل فقط ما يحتاج)، و ANALYZE كامل كل RETENTION_ANALYZE_HOURS
+    - incremental_vacuum: إعادة حتى RETENTION_VACUUM_PAGES صفحة فارغة للنظام في كل دورة
+      (يتطلب auto_vacuum = INCREMENTAL، ويُفعل بـ VACUUM كامل مرة واحدة فقط)
+    - wal_checkpoint(TRUNCATE): حتى لا يكبر ملف WAL بلا حد
+    """
+    conn = _connection()
+    now = now or datetime.utcnow()
+    done = []
+    conn.execute("PRAGMA optimize")
+    if _due(conn, 'analyze', RETENTION_ANALYZE_HOURS, now):
+        conn.execute("ANALYZE")
+        _mark(conn, 'analyze', now)
+        done.append('analyze')
+
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        done.append('vacuum')
+    freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if freelist:
+        conn.execute(f"PRAGMA incremental_vacuum({RETENTION_VACUUM_PAGES})").fetchall()
+        done.append(f"incremental_vacuum({min(freelist, RETENTION_VACUUM_PAGES)})")
+
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+    return done
+
+
+def run(now=None):
+    """
+    دورة احتفاظ كاملة: حذف المنتهي من كل الجداول ثم الصيانة
+
+    now: الوقت الحالي بتوقيت UTC (مثل أعمدة created_at)، والافتراضي datetime.utcnow()
+    يُرجع {table: (عدد المحذوف، المجموعات المحذوفة)} وقائمة مهام الصيانة المنفذة
+    """
+    results = {}
+    for policy in load_policies():
+        results[policy.table] = purge(policy, now)
+    return results, maintain(now)
+
+
+if __name__ == "__main__":
+    results, maintenance = run()
+    for table, (deleted, _) in results.items():
+        print(f"🗑️ {table}: {deleted}")
+    print(f"🧹 {', '.join(maintenance) or '-'}")
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+تنظيف نصوص الأخبار قبل النشر
+Text Sanitization
+
+كل الأنماط مُجهزة مسبقاً مرة واحدة عند الاستيراد، والنص يُنظف مرة واحدة فقط.
+الوصف يُعالج في نافذة بطول الحد المطلوب تقريباً بدلاً من المقال كاملاً.
+ملاحظة: في CPython سلسلة str.replace على رموز قليلة أسرع من str.translate
+بجدول قاموس للنصوص العربية، لذلك الجداول تُستخدم فقط حيث تكون أسرع (أو مع كاش)
+"""
+
+import re
+import html
+from functools import lru_cache
+
+# وسوم HTML في العنوان والوصف
+_HTML_TAG_RE = re.compile(r'<[^<>]*>')
+# أي تتابع أحرف غير صالحة في الهاشتاج (\w يشمل الحروف والأرقام العربية)
+_HASHTAG_SEPARATOR_RE = re.compile(r'[\W_]+')
+
+# رموز Markdown التي نحذفها من النص العادي
+PLAIN_TEXT_REMOVED_CHARS = '*_[]'
+# رموز MarkdownV2 التي تحتاج تهريباً
+MARKDOWN_SPECIAL_CHARS = '*_[]()~`>#+-=|{}.!'
+_MARKDOWN_ESCAPES = tuple((char, '\\' + char) for char in MARKDOWN_SPECIAL_CHARS)
+
+# التشكيل والتطويل لا يصلحان داخل الهاشتاج
+_HASHTAG_TABLE = str.maketrans({
+    **{chr(code): None for code in range(0x064B, 0x0660)},  # التشكيل
+    'ٰ': None,  # الألف الخنجرية
+    'ـ': None,  # التطويل
+})
+
+# نافذة معالجة الوصف: تبدأ بـ limit × هذا العدد من أحرف HTML وتتسع بنفس النسبة عند الحاجة
+_WINDOW_FACTOR = 2
+
+
+def _remove_markdown(text):
+    for char in PLAIN_TEXT_REMOVED_CHARS:
+        if char in text:
+            text = text.replace(char, '')
+    return text
+
+
+def _html_window(text, size):
+    """أول size حرف من النص بدون وسم أو كيان مقطوع في آخرها"""
+    window = text[:size]
+    if len(window) < len(text):
+        cut = window.rfind('<')
+        if cut > window.rfind('>'):
+            window = window[:cut]
+        cut = window.rfind('&')
+        if cut > window.rfind(';'):
+            window = window[:cut]
+    return window
+
+
+def _clean(text):
+    """إزالة الوسوم وفك الكيانات وحذف رموز Markdown وتوحيد المسافات"""
+    if '<' in text:
+        text = _HTML_TAG_RE.sub(' ', text)
+    if '&' in text:
+        text = html.unescape(text)
+    return ' '.join(_remove_markdown(text).split())
+
+
+def strip_html(text):
+    """إزالة وسوم HTML وفك الكيانات (&amp; &quot; &#1575; ...) وتوحيد المسافات"""
+    if not text:
+        return ""
+    if '<' in text:
+        text = _HTML_TAG_RE.sub(' ', text)
+    if '&' in text:
+        text = html.unescape(text)
+    return ' '.join(text.split())
+
+
+def plain_text(text, limit=None):
+    """نص عادي آمن للنشر: بدون HTML ولا رموز Markdown، ومقصوص إلى limit حرف"""
+    if not text:
+        return ""
+    if limit is None:
+        return _clean(text)
+
+    # التنظيف لا يطيل النص أبداً، فنعالج بداية المقال فقط ونوسع النافذة إذا لم تكفِ
+    size = limit * _WINDOW_FACTOR
+    while True:
+        cleaned = _clean(_html_window(text, size))
+        if len(cleaned) >= limit or size >= len(text):
+            break
+        size *= _WINDOW_FACTOR
+    if len(cleaned) > limit:
+        cleaned = cleaned[:limit].rstrip()
+    return cleaned
+
+
+def escape_markdown(text):
+    """تهريب رموز Markdown الخاصة (الرموز غير الموجودة في النص لا تكلف شيئاً)"""
+    if not text:
+        return ""
+    for char, escaped in _MARKDOWN_ESCAPES:
+        if char in text:
+            text = text.replace(char, escaped)
+    return text
+
+
+@lru_cache(maxsize=1024)
+def hashtag(name):
+    """
+    هاشتاج صالح في تليجرام من اسم المصدر (يحافظ على الحروف العربية)
+
+    المسافات والرموز تصبح _ واحدة، ويُحذف التشكيل والتطويل
+    """
+    tag = _HASHTAG_SEPARATOR_RE.sub('_', name.translate(_HASHTAG_TABLE)).strip('_')
+    if tag.isdigit():
+        # الهاشتاج المكون من أرقام فقط لا يعمل في تليجرام
+        tag = '_' + tag
+    return tag
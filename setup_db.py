@@ -1,11 +1,9 @@
-import sqlite3
-import os
 from werkzeug.security import generate_password_hash
-
-DB_PATH = 'news_bot.db'
+from dotenv import load_dotenv
+from db import database_path, get_connection
 
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     c = conn.cursor()
     
     # جدول الأخبار (موجود سابقاً - نحدثه إذا لزم)
@@ -58,8 +56,12 @@ def init_db():
         print("Config file not found or empty, skipping migration.")
 
     conn.commit()
-    conn.close()
-    print("[OK] Database initialized successfully.")
+
+    # عدادات لوحة التحكم (تُحدّث بـ triggers)
+    import dashboard_stats
+    dashboard_stats.init_stats_table(conn)
+    print(f"[OK] Database initialized successfully: {database_path()}")
 
 if __name__ == "__main__":
+    load_dotenv()
     init_db()
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""اختبارات كشف الأخبار المتشابهة (near_dup)"""
+
+import near_dup
+
+
+def _similar(index, title, source):
+    return index.find_cluster(near_dup.signature(title), source)
+
+
+def test_opposite_events_do_not_collide():
+    index = near_dup.NearDupIndex()
+    index.add('a', near_dup.signature('Oil prices rise after OPEC cuts output'), 'a', 'Reuters')
+    index.add('b', near_dup.signature('ارتفاع أسعار النفط بعد قرار أوبك خفض الإنتاج'), 'b', 'الجزيرة')
+
+    assert _similar(index, 'Oil prices fall after OPEC cuts output', 'AP') == (None, 0.0)
+    assert _similar(index, 'انخفاض أسعار النفط بعد قرار أوبك خفض الإنتاج', 'العربية') == (None, 0.0)
+
+
+def test_different_country_does_not_collide():
+    index = near_dup.NearDupIndex()
+    index.add('a', near_dup.signature('زلزال بقوة 6 درجات يضرب تركيا'), 'a', 'الجزيرة')
+
+    assert _similar(index, 'زلزال بقوة 6 درجات يضرب إيران', 'العربية') == (None, 0.0)
+
+
+def test_same_story_from_another_source_collides():
+    index = near_dup.NearDupIndex()
+    index.add('a', near_dup.signature('ارتفاع أسعار النفط بعد قرار أوبك خفض الإنتاج'), 'a', 'الجزيرة')
+
+    cluster_id, score = _similar(index, 'ارتفاع أَسعار النفط بعد قرار "أوبك" خفض الانتاج', 'العربية')
+    assert cluster_id == 'a'
+    assert score >= index.threshold
+
+
+def test_same_source_is_not_compared():
+    index = near_dup.NearDupIndex()
+    index.add('a', near_dup.signature('ارتفاع أسعار النفط بعد قرار أوبك خفض الإنتاج'), 'a', 'الجزيرة')
+
+    assert _similar(index, 'ارتفاع أسعار النفط بعد قرار أوبك خفض الإنتاج', 'الجزيرة') == (None, 0.0)
@@ -1,9 +1,19 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, g, Response
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 import sqlite3
 from werkzeug.security import check_password_hash, generate_password_hash
 import os
+import hmac
+import time
 from datetime import datetime
+from dotenv import load_dotenv
+from db import database_path, get_connection, transaction
+import jobs
+import dashboard_stats
+import metrics
+
+# Read .env like the bot does (NEWS_BOT_DB_PATH, METRICS_TOKEN); gunicorn does not load it
+load_dotenv()
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-here-change-this-in-production'
@@ -13,23 +23,67 @@ login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
-# Use absolute path for DB to avoid issues
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_PATH = os.path.join(BASE_DIR, 'news_bot.db')
+WEB_REQUEST_SECONDS = metrics.histogram('newsbot_web_request_seconds', 'Dashboard request time',
+                                        ('endpoint', 'status'))
+
+# Prometheus scrapers send "Authorization: Bearer <METRICS_TOKEN>"; without it /metrics is for logged-in users.
+# The client address is not trusted: behind a local reverse proxy every request comes from 127.0.0.1
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
 
 @app.route('/force_run', methods=['POST'])
 @login_required
 def force_run():
+    # Queue the cycle for the bot worker; the web process never fetches or posts itself
     try:
-        from news_bot import check_and_post_news
-        # Run the news check manually
-        check_and_post_news()
-        flash('News check triggered successfully!', 'success')
+        job_id, created = jobs.enqueue(jobs.NEWS_CYCLE, requested_by=current_user.username)
     except Exception as e:
-        flash(f'Error running news check: {e}', 'error')
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify(error=str(e)), 500
+        flash(f'Error queueing news check: {e}', 'error')
+        return redirect(url_for('dashboard'))
     
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(job=jobs.get_job(job_id), created=created), 202 if created else 200
+    if created:
+        flash(f'News check #{job_id} queued. The bot will run it shortly.', 'success')
+    else:
+        flash(f'News check #{job_id} is already queued or running.', 'success')
     return redirect(url_for('dashboard'))
 
+@app.route('/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    job = jobs.get_job(job_id)
+    if job is None:
+        return jsonify(error='not found'), 404
+    return jsonify(job=job)
+
+@app.route('/jobs/latest')
+@login_required
+def latest_job_status():
+    return jsonify(job=jobs.latest_job(jobs.NEWS_CYCLE))
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def observe_request_time(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        WEB_REQUEST_SECONDS.labels(request.endpoint or 'unknown', response.status_code).observe(
+            time.perf_counter() - started)
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    # Prometheus scrape of this process (SQLite timings, request times); token holders or logged-in users only
+    token = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    if not (METRICS_TOKEN and token and hmac.compare_digest(token.encode(), METRICS_TOKEN.encode())) \
+            and not current_user.is_authenticated:
+        return login_manager.unauthorized()
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 class User(UserMixin):
     def __init__(self, id, username):
         self.id = id
@@ -37,19 +91,15 @@ class User(UserMixin):
 
 @login_manager.user_loader
 def load_user(user_id):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT id, username FROM users WHERE id = ?", (user_id,))
-    user_data = c.fetchone()
-    conn.close()
+    user_data = get_connection().execute("SELECT id, username FROM users WHERE id = ?",
+                                         (user_id,)).fetchone()
     if user_data:
         return User(user_data[0], user_data[1])
     return None
 
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    # Persistent per-thread connection (WAL, busy_timeout) - do not close it
+    return get_connection()
 
 @app.route('/')
 def index():
@@ -65,7 +115,6 @@ def login():
         
         conn = get_db_connection()
         user_data = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
-        conn.close()
         
         if user_data and check_password_hash(user_data['password_hash'], password):
             user = User(user_data['id'], user_data['username'])
@@ -85,16 +134,26 @@ def logout():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    conn = get_db_connection()
-    
-    # Get stats
-    total_news = conn.execute('SELECT COUNT(*) FROM published_news').fetchone()[0]
-    feeds_count = conn.execute('SELECT COUNT(*) FROM rss_feeds WHERE is_active = 1').fetchone()[0]
-    recent_news = conn.execute('SELECT * FROM published_news ORDER BY created_at DESC LIMIT 10').fetchall()
-    feeds = conn.execute('SELECT * FROM rss_feeds').fetchall()
-    
-    conn.close()
-    return render_template('dashboard.html', total_news=total_news, feeds_count=feeds_count, recent_news=recent_news, feeds=feeds)
+    # Counters are kept by triggers; the snapshot is reused until the bot or an admin writes
+    snapshot = dashboard_stats.snapshot_cache.get()
+    return render_template('dashboard.html', **snapshot)
+
+@app.route('/news')
+@login_required
+def news_history():
+    # Keyset pagination: ?before_ts=<created_at>&before_id=<id> of the last row on the previous page
+    before = None
+    if request.args.get('before_ts') and request.args.get('before_id', type=int):
+        before = (request.args['before_ts'], request.args.get('before_id', type=int))
+    news, next_cursor = dashboard_stats.news_page(before)
+    return render_template('news.html', news=news, next_cursor=next_cursor)
+
+@app.route('/feeds')
+@login_required
+def feeds_list():
+    # Keyset pagination: ?after=<id> of the last feed on the previous page
+    feeds, next_after = dashboard_stats.feeds_page(request.args.get('after', type=int))
+    return render_template('feeds.html', feeds=feeds, next_after=next_after)
 
 @app.route('/add_feed', methods=['POST'])
 @login_required
@@ -103,10 +162,8 @@ def add_feed():
     url = request.form['url']
     
     try:
-        conn = get_db_connection()
-        conn.execute('INSERT INTO rss_feeds (name, url) VALUES (?, ?)', (name, url))
-        conn.commit()
-        conn.close()
+        with transaction() as conn:
+            conn.execute('INSERT INTO rss_feeds (name, url) VALUES (?, ?)', (name, url))
         flash('Feed added successfully!', 'success')
     except sqlite3.IntegrityError:
         flash('Feed URL already exists!', 'error')
@@ -118,22 +175,20 @@ def add_feed():
 @app.route('/delete_feed/<int:id>')
 @login_required
 def delete_feed(id):
-    conn = get_db_connection()
-    conn.execute('DELETE FROM rss_feeds WHERE id = ?', (id,))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute('DELETE FROM rss_feeds WHERE id = ?', (id,))
     flash('Feed deleted.', 'success')
     return redirect(url_for('dashboard'))
 
 if __name__ == '__main__':
     # Initialize DB if run directly this way
-    if not os.path.exists(DB_PATH):
+    if not os.path.exists(database_path()):
         import setup_db
         setup_db.init_db()
     else:
         # Ensure users table exists
         try:
-            conn = sqlite3.connect(DB_PATH)
+            conn = get_db_connection()
             c = conn.cursor()
             c.execute('''CREATE TABLE IF NOT EXISTS users
                          (id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -146,7 +201,6 @@ if __name__ == '__main__':
                 password = generate_password_hash("admin123")
                 c.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", ("admin", password))
             conn.commit()
-            conn.close()
         except Exception as e:
             print(f"Warning: {e}")
         
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+استقبال تحديثات تليجرام عبر webhook
+Built-in Telegram Webhook Server
+
+خادم HTTP صغير على asyncio (بدون tornado أو أي مكتبة إضافية) يستقبل التحديثات
+التي يرسلها تليجرام، بدلاً من long polling الذي يضيف زمناً لكل ضغطة ويحد عدد
+التحديثات في كل طلب:
+- التحقق من X-Telegram-Bot-Api-Secret-Token (السر المسجل مع setWebhook)
+- اتصالات متوازية ومستمرة (keep-alive) من تليجرام حتى WEBHOOK_MAX_CONNECTIONS
+- طابور محدود الحجم أمام المعالجة: إذا امتلأ يرد الخادم بـ 503 فيعيد تليجرام
+  الإرسال لاحقاً، بدلاً من تراكم الذاكرة بلا حد أثناء موجة ضغطات
+
+run_webhook() تقابل Application.run_polling: تهيئة التطبيق و post_init وتسجيل
+الـ webhook ثم الانتظار حتى Ctrl+C أو SIGTERM، و run_application() نفس الدورة
+بدون استقبال تحديثات (عمليات worker الإضافية عند تقسيم المصادر)
+"""
+
+import hmac
+import json
+import time
+import signal
+import secrets
+import asyncio
+
+from telegram import Update
+
+import metrics
+from config import (WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_MAX_CONNECTIONS,
+                    WEBHOOK_QUEUE_SIZE, WEBHOOK_QUEUE_TIMEOUT_SECONDS, WEBHOOK_MAX_BODY_BYTES)
+
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+
+WEBHOOK_REQUESTS = metrics.counter('newsbot_webhook_requests_total', 'Webhook requests by outcome',
+                                   ('result',))
+WEBHOOK_SECONDS = metrics.histogram('newsbot_webhook_request_seconds',
+                                    'Time from reading a webhook request to queuing its update')
+
+_STATUS = {
+    200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+    405: 'Method Not Allowed', 413: 'Payload Too Large', 503: 'Service Unavailable',
+}
+
+
+class WebhookServer:
+    """
+    خادم التحديثات: كل طلب POST صالح يتحول إلى Update في طابور التطبيق
+
+    الرد بـ 200 يعني أن التحديث في الطابور (المعالجة نفسها تتم في التطبيق)،
+    فلا ينتظر تليجرام معالجة الضغطة قبل إرسال التالية على نفس الاتصال
+    """
+
+    def __init__(self, application, secret_token, path=WEBHOOK_PATH,
+                 queue_timeout=WEBHOOK_QUEUE_TIMEOUT_SECONDS, max_body=WEBHOOK_MAX_BODY_BYTES):
+        self.application = application
+        self.secret_token = secret_token.encode('utf-8') if secret_token else None
+        self.path = path
+        self.queue_timeout = queue_timeout
+        self.max_body = max_body
+        self._server = None
+        self._connections = {}  # مهمة الاتصال -> writer
+
+    async def start(self, host=WEBHOOK_HOST, port=WEBHOOK_PORT):
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def stop(self):
+        """إيقاف استقبال اتصالات جديدة وإغلاق الاتصالات المفتوحة (الطابور يُكمل في التطبيق)"""
+        if self._server is None:
+            return
+        self._server.close()
+        # إغلاق الاتصال ينهي انتظار الطلب التالي، والطلب الجاري يكتمل أولاً
+        for writer in list(self._connections.values()):
+            writer.close()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        await self._server.wait_closed()
+        self._server = None
+
+    async def _handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            # اتصال مستمر: عدة تحديثات متتالية على نفس الاتصال
+            keep_alive = True
+            while keep_alive:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                status, extra_headers = await self._dispatch(method, path, headers, body)
+                keep_alive = headers.get('connection', '').lower() != 'close' and status != 413
+                self._write_response(writer, status, extra_headers, keep_alive)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError, ValueError):
+            pass
+        finally:
+            self._connections.pop(task, None)
+            writer.close()
+
+    async def _read_request(self, reader):
+        """(الطريقة، المسار، الترويسات، المحتوى) أو None عند إغلاق الاتصال"""
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        parts = request_line.decode('latin-1').split()
+        if len(parts) != 3:
+            raise ValueError('bad request line')
+        headers = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), 10)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        method, path = parts[0], parts[1].split('?')[0]
+        length = int(headers.get('content-length') or 0)
+        if length > self.max_body:
+            return method, path, dict(headers, connection='close'), None
+        body = await asyncio.wait_for(reader.readexactly(length), 10) if length else b''
+        return method, path, headers, body
+
+    async def _dispatch(self, method, path, headers, body):
+        """حالة الرد وترويساته الإضافية لطلب واحد"""
+        started = time.perf_counter()
+        if path != self.path:
+            return self._done(404, 'not_found')
+        if method != 'POST':
+            return self._done(405, 'bad_method', {'Allow': 'POST'})
+        if self.secret_token is not None and not hmac.compare_digest(
+                headers.get(SECRET_HEADER, '').encode('utf-8'), self.secret_token):
+            return self._done(403, 'forbidden')
+        if body is None:
+            return self._done(413, 'too_large')
+
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except Exception:
+            return self._done(400, 'bad_request')
+        if update is None:
+            return self._done(400, 'bad_request')
+
+        queue = self.application.update_queue
+        try:
+            queue.put_nowait(update)
+        except asyncio.QueueFull:
+            # الطابور ممتلئ: انتظار قصير ثم رفض التحديث فيعيده تليجرام لاحقاً
+            try:
+                await asyncio.wait_for(queue.put(update), self.queue_timeout)
+            except asyncio.TimeoutError:
+                return self._done(503, 'overloaded', {'Retry-After': '1'})
+        WEBHOOK_SECONDS.labels().observe(time.perf_counter() - started)
+        return self._done(200, 'accepted')
+
+    @staticmethod
+    def _done(status, result, extra_headers=None):
+        WEBHOOK_REQUESTS.labels(result).inc()
+        return status, extra_headers or {}
+
+    @staticmethod
+    def _write_response(writer, status, extra_headers, keep_alive):
+        lines = [f'HTTP/1.1 {status} {_STATUS[status]}', 'Content-Length: 0',
+                 f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        lines += [f'{name}: {value}' for name, value in extra_headers.items()]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+
+
+def configure_builder(builder):
+    """
+    إعداد ApplicationBuilder لوضع webhook: بدون Updater (لا polling)، وطابور
+    تحديثات محدود الحجم يملؤه الخادم (ضغط عكسي على تليجرام عند الامتلاء)
+    """
+    return builder.updater(None).update_queue(asyncio.Queue(maxsize=WEBHOOK_QUEUE_SIZE))
+
+
+def webhook_url(base_url, path=WEBHOOK_PATH):
+    """الرابط الكامل المسجل في تليجرام: الرابط العام للخادم + WEBHOOK_PATH"""
+    return base_url.rstrip('/') + path
+
+
+async def serve(application, ready_stage, start=None, stop=None):
+    """
+    دورة حياة التطبيق بدون Updater (بنفس ترتيب run_polling في python-telegram-bot):
+    initialize ← post_init ← start() ← application.start ... stop() ← application.stop ← post_stop ← shutdown
+
+    start و stop: بدء استقبال التحديثات وإيقافه (خادم webhook)، أو None لعملية worker
+    لا تستقبل التحديثات. يعمل حتى Ctrl+C أو SIGTERM
+    """
+    loop = asyncio.get_running_loop()
+    stop_event = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: Ctrl+C يصل كـ KeyboardInterrupt
+
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        if start is not None:
+            await start()
+        await application.start()
+        metrics.readiness.mark(ready_stage)
+        await stop_event.wait()
+    finally:
+        # إيقاف الاستقبال أولاً حتى لا تدخل الطابور تحديثات بعد إشارة الإيقاف
+        if stop is not None:
+            await stop()
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+
+
+def run_application(application, ready_stage, start=None, stop=None):
+    """تشغيل serve() حتى الإيقاف (مقابل run_polling)"""
+    try:
+        asyncio.run(serve(application, ready_stage, start, stop))
+    except KeyboardInterrupt:
+        pass
+
+
+async def serve_webhook(application, url, secret_token, host=WEBHOOK_HOST, port=WEBHOOK_PORT,
+                        allowed_updates=None, max_connections=WEBHOOK_MAX_CONNECTIONS):
+    """
+    وضع webhook: تشغيل الخادم وتسجيل الرابط في تليجرام بعد post_init
+
+    الـ webhook لا يُحذف عند الإيقاف، فيحتفظ تليجرام بالتحديثات حتى يعود الخادم
+    (والعودة إلى polling تحذفه تلقائياً)
+    """
+    server = WebhookServer(application, secret_token)
+
+    async def start():
+        bound_host, bound_port = await server.start(host, port)
+        await application.bot.set_webhook(url, secret_token=secret_token,
+                                          allowed_updates=allowed_updates,
+                                          max_connections=max_connections)
+        print(f"🌐 webhook: {url} (الخادم على {bound_host}:{bound_port})")
+
+    await serve(application, 'webhook', start, server.stop)
+
+
+def run_webhook(application, url, secret_token=None, **kwargs):
+    """
+    تشغيل التطبيق في وضع webhook حتى Ctrl+C أو SIGTERM (مقابل run_polling)
+
+    بدون secret_token يُولد سر عشوائي لهذا التشغيل (يُسجل مع setWebhook في كل بدء)
+    """
+    secret_token = secret_token or secrets.token_urlsafe(32)
+    try:
+        asyncio.run(serve_webhook(application, url, secret_token, **kwargs))
+    except KeyboardInterrupt:
+        pass